@@ -3,19 +3,25 @@ import re
 import logging
 import time
 import uuid
-from datetime import datetime, timezone
-from flask import Flask, request, jsonify
+from datetime import datetime, timedelta, timezone
+from flask import Flask, Response, g, request, jsonify
 from langchain_core.messages import HumanMessage, AIMessage, ToolMessage
 
 # --- Importaciones de tu proyecto ---
 from src.agents.modules.agent import RagAgent
 from src.agents.modules.tools import ALL_TOOLS_LIST
 from src.agents.modules.redis_checkpointer import RedisCheckpointer
-from src.agents.modules.metriclogger import MetricLogger
-from src.agents.modules.config import OLLAMA_MODEL_NAME
+from src.agents.modules.metriclogger import get_metric_logger
+from src.agents.modules.config import OLLAMA_MODEL_NAME, PROFILING_ENABLED, PROFILING_MAX_SECONDS, PROFILING_SLOW_REQUEST_MS
+from src.agents.modules.histogram import snapshot_histograms, get_histogram, render_prometheus, PROMETHEUS_CONTENT_TYPE
+from src.agents.modules.http_client import upstream_status
+from src.agents.modules.tracing import start_span, TRACEPARENT_HEADER
+from src.agents.modules.state import add_llm_usage, summarize_llm_usage
+from src.agents.modules.log_config import configure_logging
+from src.agents.modules.profiling import SlowRequestProfiler, sample_stacks, format_collapsed, write_collapsed
 
 # --- Configuración del Logging ---
-logging.basicConfig(level=logging.INFO)
+configure_logging()
 logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
@@ -24,6 +30,8 @@ app = Flask(__name__)
 agent_instance = None
 redis_checkpointer = None
 metric_logger = None
+# cProfile de las peticiones más lentas que PROFILING_SLOW_REQUEST_MS (solo con PROFILING_ENABLED)
+slow_request_profiler = SlowRequestProfiler(PROFILING_SLOW_REQUEST_MS) if PROFILING_ENABLED and PROFILING_SLOW_REQUEST_MS > 0 else None
 
 # --- Función de inicialización centralizada ---
 def initialize_components():
@@ -42,9 +50,9 @@ def initialize_components():
             redis_checkpointer = RedisCheckpointer()
             logger.info("✅ RedisCheckpointer inicializado correctamente.")
             
-            logger.info("🚀 Inicializando MetricLogger...")
-            metric_logger = MetricLogger()
-            logger.info("📊 MetricLogger inicializado correctamente.")
+            # No bloquea: las tablas se crean en segundo plano y, sin BD, las métricas se descartan
+            metric_logger = get_metric_logger()
+            logger.info(f"📊 MetricLogger inicializado (estado: {metric_logger.status}).")
 
         except Exception as e:
             logger.critical(f"❌ Error crítico durante la inicialización de componentes: {e}", exc_info=True)
@@ -69,15 +77,67 @@ def validate_thread_id(thread_id):
         return False
     return bool(re.match(r'^[a-zA-Z0-9_-]+$', thread_id))
 
-def log_execution_metric(metric_name: str, execution_time: float):
-    """Registra una métrica de tiempo de ejecución si el logger está disponible."""
+def log_execution_metric(metric_name: str, execution_time: float, **labels):
+    """Registra una métrica (nombre fijo + labels como status o tools) si el logger está disponible."""
     if metric_logger:
         try:
             timestamp = datetime.now(timezone.utc)
-            metric_logger.log_metric(timestamp, OLLAMA_MODEL_NAME, metric_name, execution_time)
+            metric_logger.log_metric(timestamp, OLLAMA_MODEL_NAME, metric_name, execution_time, labels=labels)
         except Exception as e:
             logger.warning(f"⚠️ No se pudo registrar la métrica '{metric_name}': {e}")
 
+def log_llm_usage_metrics(turn_usage: dict):
+    """Registra el consumo del LLM en el turno: contexto, tokens generados, prefill y tokens/s."""
+    if not turn_usage["llm_calls"]:
+        return
+    if turn_usage["max_prompt_tokens"]:
+        log_execution_metric("llm_prompt_tokens", turn_usage["max_prompt_tokens"])
+    log_execution_metric("llm_completion_tokens", turn_usage["completion_tokens"])
+    log_execution_metric("llm_prefill_seconds", turn_usage["prefill_ms"] / 1000)
+    if turn_usage["tokens_per_second"] is not None:
+        log_execution_metric("llm_tokens_per_second", turn_usage["tokens_per_second"])
+
+
+# --- Latencia por endpoint (histograma http_request_duration_seconds) ---
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+    if slow_request_profiler and not request.path.startswith('/debug/'):
+        g.request_profile = slow_request_profiler.start()
+
+
+@app.after_request
+def observe_request_latency(response):
+    start = g.pop('request_start', None)
+    if start is not None:
+        # La regla ('/sessions/<thread_id>') y no la URL concreta, para acotar las series
+        endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+        duration = time.perf_counter() - start
+        get_histogram(
+            "http_request_duration_seconds", endpoint=endpoint, method=request.method, status=str(response.status_code)
+        ).observe(duration)
+        profile = g.pop('request_profile', None)
+        if profile is not None:
+            slow_request_profiler.finish(profile, duration * 1000, f"{request.method} {endpoint}")
+    return response
+
+
+def collect_gauges(checkpointer_stats, metric_logger_stats):
+    """Estado de circuit breakers, checkpointer y MetricLogger como gauges de Prometheus."""
+    gauges = [
+        ("upstream_circuit_open", {"upstream": name}, 1.0 if status["circuit"] == "open" else 0.0)
+        for name, status in upstream_status().items()
+    ]
+    if checkpointer_stats:
+        gauges.append(("checkpointer_redis_used_memory_bytes", {}, checkpointer_stats.get("redis_used_memory_bytes")))
+        gauges.append(("checkpointer_indexed_sessions", {}, checkpointer_stats.get("indexed_sessions")))
+        for key, value in (checkpointer_stats.get("hot_cache") or {}).items():
+            gauges.append((f"checkpointer_hot_cache_{key}", {}, value))
+    for key, value in (metric_logger_stats or {}).items():
+        gauges.append((f"metric_logger_rows_{key}", {}, value))
+    return gauges
+
 
 # --- Endpoints de la API ---
 
@@ -105,50 +165,70 @@ def chat_with_agent():
     if not validate_thread_id(thread_id):
         return jsonify({"error": "thread_id inválido. Solo se permiten caracteres alfanuméricos, '-' y '_'."}), 400
 
-    logger.info(f"📬 Mensaje recibido para thread '{thread_id}': '{message[:100]}'")
+    logger.info("📬 Mensaje recibido para thread '%s': '%.100s'", thread_id, message, extra={"thread_id": thread_id})
 
     config = {"configurable": {"thread_id": thread_id}}
     input_for_graph = {"messages": [HumanMessage(content=message)]}
     tools_used = set()
 
-    try:
-        final_state = None
-        for event in agent_instance.graph.stream(input_for_graph, config=config, stream_mode="values"):
-            final_state = event
-            if event.get('messages'):
-                for msg in event['messages']:
-                    if isinstance(msg, AIMessage) and msg.tool_calls:
-                        for tool_call in msg.tool_calls:
-                            tools_used.add(tool_call['name'])
-
-        if not final_state or not final_state.get('messages'):
-            raise ValueError("El grafo no produjo un estado final con mensajes.")
-        
-        final_messages = final_state.get('messages', [])
-        response_content = clean_agent_response(final_messages[-1].content)
-        
-        execution_time = time.time() - start_time
-        log_execution_metric("ejecucion_total", execution_time)
-        if not tools_used:
-            log_execution_metric("ejecucion_sin_tools", execution_time)
-        for tool in tools_used:
-            log_execution_metric(f"ejecucion_con_{tool}", execution_time)
-
-        logger.info(f"💬 Respuesta para '{thread_id}' en {execution_time:.2f}s: '{response_content[:100]}'")
-        
-        return jsonify({
-            "response": response_content,
-            "thread_id": thread_id,
-            "execution_time_seconds": round(execution_time, 2),
-            "tools_used": list(tools_used),
-            "timestamp_utc": datetime.now(timezone.utc).isoformat()
-        })
+    # Span raíz del turno: continúa la traza del cliente si envía traceparent
+    with start_span("chat", traceparent=request.headers.get(TRACEPARENT_HEADER), thread_id=thread_id) as span:
+        try:
+            final_state = None
+            turn_usage = {}
+            for mode, event in agent_instance.graph.stream(input_for_graph, config=config, stream_mode=["values", "updates"]):
+                if mode == "updates":
+                    # Consumo de cada llamada al LLM de este turno (el estado solo guarda el total del thread)
+                    for node_update in event.values():
+                        if isinstance(node_update, dict) and node_update.get('llm_usage'):
+                            turn_usage = add_llm_usage(turn_usage, node_update['llm_usage'])
+                    continue
+                final_state = event
+                if event.get('messages'):
+                    for msg in event['messages']:
+                        if isinstance(msg, AIMessage) and msg.tool_calls:
+                            for tool_call in msg.tool_calls:
+                                tools_used.add(tool_call['name'])
+
+            if not final_state or not final_state.get('messages'):
+                raise ValueError("El grafo no produjo un estado final con mensajes.")
+            
+            final_messages = final_state.get('messages', [])
+            response_content = clean_agent_response(final_messages[-1].content)
+            
+            execution_time = time.time() - start_time
+            # Una sola serie por combinación de herramientas en lugar de un nombre de métrica por herramienta
+            log_execution_metric("ejecucion_total", execution_time, status="ok", tools="+".join(sorted(tools_used)) or "none")
+
+            llm_usage = {
+                "turn": summarize_llm_usage(turn_usage),
+                "thread": summarize_llm_usage(final_state.get('llm_usage')),
+            }
+            log_llm_usage_metrics(llm_usage["turn"])
+
+            span.set_attribute("tools_used", sorted(tools_used))
+            logger.info(
+                "💬 Respuesta para '%s' en %.2fs (trace %s): '%.100s'", thread_id, execution_time, span.trace_id, response_content,
+                extra={"thread_id": thread_id, "tools_used": sorted(tools_used), "execution_time_seconds": round(execution_time, 3)},
+            )
+            
+            return jsonify({
+                "response": response_content,
+                "thread_id": thread_id,
+                "trace_id": span.trace_id,
+                "execution_time_seconds": round(execution_time, 2),
+                "tools_used": list(tools_used),
+                "llm_usage": llm_usage,
+                "timestamp_utc": datetime.now(timezone.utc).isoformat()
+            })
 
-    except Exception as e:
-        execution_time = time.time() - start_time
-        log_execution_metric("ejecucion_error", execution_time)
-        logger.error(f"❌ Error durante la interacción del agente para '{thread_id}': {e}", exc_info=True)
-        return jsonify({"error": f"Error interno del servidor: {e}"}), 500
+        except Exception as e:
+            execution_time = time.time() - start_time
+            log_execution_metric("ejecucion_total", execution_time, status="error", tools="+".join(sorted(tools_used)) or "none")
+            span.status = "ERROR"
+            span.set_attribute("exception.message", str(e)[:500])
+            logger.error(f"❌ Error durante la interacción del agente para '{thread_id}' (trace {span.trace_id}): {e}", exc_info=True)
+            return jsonify({"error": f"Error interno del servidor: {e}", "trace_id": span.trace_id}), 500
 
 @app.route('/health', methods=['GET'])
 def health_check():
@@ -159,7 +239,7 @@ def health_check():
         "timestamp_utc": datetime.now(timezone.utc).isoformat(),
         "agent": "initialized" if agent_instance else "not_initialized",
         "redis": "not_initialized",
-        "metrics": "initialized" if metric_logger else "not_initialized"
+        "metrics": metric_logger.status if metric_logger else "not_initialized"
     }
 
     if not agent_instance:
@@ -178,6 +258,66 @@ def health_check():
     return jsonify(health_info), status_code
 
 
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """
+    Métricas del proceso en formato de texto de Prometheus (histogramas de latencia y gauges
+    de estado). Con ?format=json devuelve los mismos datos en JSON con percentiles p50/p95/p99.
+    """
+    checkpointer_stats = redis_checkpointer.get_stats() if redis_checkpointer else None
+    metric_logger_stats = metric_logger.stats() if metric_logger else None
+    if request.args.get('format') == 'json':
+        return jsonify({
+            "timestamp_utc": datetime.now(timezone.utc).isoformat(),
+            "histograms": snapshot_histograms(),
+            "upstreams": upstream_status(),
+            "checkpointer": checkpointer_stats,
+            "metric_logger": metric_logger_stats,
+        })
+    return Response(render_prometheus(collect_gauges(checkpointer_stats, metric_logger_stats)), content_type=PROMETHEUS_CONTENT_TYPE)
+
+
+def parse_utc_datetime(value, default):
+    """Fecha ISO 8601 de un parámetro de consulta (sin zona horaria se asume UTC)."""
+    if not value:
+        return default
+    parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+@app.route('/metrics/query', methods=['GET'])
+def query_metrics():
+    """
+    Percentiles de una métrica de agent_metrics en un rango, calculados con los rollups.
+    Parámetros: metric (obligatorio), from / to (ISO 8601, por defecto la última hora),
+    llm, resolution (1m | 1h, por defecto según la longitud del rango) y labels
+    ("status:ok,tools:none"; se agregan todas las series que contienen esos pares).
+    """
+    if not metric_logger or metric_logger.rollup is None:
+        return jsonify({"error": "Los rollups de métricas no están disponibles."}), 503
+
+    metric = request.args.get('metric')
+    if not metric:
+        return jsonify({"error": "El parámetro 'metric' es requerido."}), 400
+    try:
+        end = parse_utc_datetime(request.args.get('to'), datetime.now(timezone.utc))
+        start = parse_utc_datetime(request.args.get('from'), end - timedelta(hours=1))
+    except ValueError:
+        return jsonify({"error": "'from' y 'to' deben ser fechas ISO 8601."}), 400
+    if start >= end:
+        return jsonify({"error": "'from' debe ser anterior a 'to'."}), 400
+    labels = dict(item.split(':', 1) for item in request.args.get('labels', '').split(',') if ':' in item)
+
+    try:
+        return jsonify(metric_logger.query_percentiles(
+            metric, start, end, llm=request.args.get('llm'), resolution=request.args.get('resolution'), labels=labels
+        ))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except RuntimeError as e:
+        return jsonify({"error": str(e)}), 503
+
+
 @app.route('/sessions', methods=['GET'])
 def list_sessions():
     """Lista las sesiones activas almacenadas en Redis."""
@@ -228,5 +368,33 @@ def delete_session(thread_id):
         logger.error(f"Error al eliminar la sesión '{thread_id}': {e}", exc_info=True)
         return jsonify({"error": "Ocurrió un error al eliminar la sesión."}), 500
 
+@app.route('/debug/profile', methods=['GET'])
+def debug_profile():
+    """
+    Perfil de muestreo de todo el proceso durante ?seconds=N (máx. PROFILING_MAX_SECONDS).
+    Devuelve pilas colapsadas (flamegraph.pl, speedscope) y las guarda en PROFILING_DIR.
+    ?idle=true incluye los hilos bloqueados esperando. Solo con PROFILING_ENABLED.
+    """
+    if not PROFILING_ENABLED:
+        return jsonify({"error": "El perfilado está deshabilitado (PROFILING_ENABLED)."}), 404
+    try:
+        seconds = float(request.args.get('seconds', '10'))
+    except ValueError:
+        return jsonify({"error": "'seconds' debe ser un número."}), 400
+    if not 0 < seconds <= PROFILING_MAX_SECONDS:
+        return jsonify({"error": f"'seconds' debe estar entre 0 y {PROFILING_MAX_SECONDS}."}), 400
+
+    include_idle = request.args.get('idle', 'false').lower() in ('1', 'true', 'yes')
+    try:
+        stacks = sample_stacks(seconds, include_idle=include_idle)
+    except RuntimeError as e:
+        return jsonify({"error": str(e)}), 409
+    try:
+        path = write_collapsed(stacks)
+        logger.info(f"🔥 Perfil de {seconds:g}s ({sum(stacks.values())} muestras) guardado en {path}")
+    except OSError as e:
+        logger.warning(f"⚠️ No se pudo guardar el perfil: {e}")
+    return Response(format_collapsed(stacks), content_type='text/plain; charset=utf-8')
+
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=8081)
\ No newline at end of file
@@ -0,0 +1,109 @@
+"""
+Benchmark de serialización de checkpoints.
+
+Compara, para cada combinación de códec y compresión, el tiempo de codificación y
+decodificación (incluida la reconstrucción de mensajes de LangChain) y el tamaño del
+payload de una sesión sintética. Con --redis-url guarda cada payload en Redis y mide la
+memoria real por sesión con MEMORY USAGE.
+
+Uso (desde la raíz del repositorio):
+    python -m src.agents.benchmarks.bench_checkpoint_serializer --turns 20
+    python -m src.agents.benchmarks.bench_checkpoint_serializer --turns 50 --redis-url redis://:redis_password@localhost:6379/0
+"""
+import argparse
+import statistics
+import time
+import uuid
+
+from langchain_core.messages import HumanMessage, AIMessage, ToolMessage
+
+from src.agents.modules.checkpoint_serializer import CheckpointSerializer, message_to_dict, message_from_dict
+
+RAG_CHUNK = (
+    "El check-in se realiza a partir de las 15:00 y el check-out hasta las 12:00. "
+    "Se admiten mascotas de hasta 10 kg con un suplemento diario. " * 8
+)
+
+
+def build_session(turns: int) -> list:
+    """Genera una conversación realista: pregunta, llamada al RAG, resultado y respuesta."""
+    messages = []
+    for i in range(turns):
+        call_id = f"llm_tc_{uuid.uuid4().hex}"
+        messages.append(HumanMessage(content=f"¿Cuál es la política de mascotas y el horario del check-in? (turno {i})"))
+        messages.append(AIMessage(content="", tool_calls=[{"name": "external_rag_search_tool", "args": {"query": "política de mascotas"}, "id": call_id}]))
+        messages.append(ToolMessage(content=f"Información recuperada de la base de conocimientos:\n\n{RAG_CHUNK}", tool_call_id=call_id, name="external_rag_search_tool"))
+        messages.append(AIMessage(content="Se admiten mascotas de hasta 10 kg. El check-in es a partir de las 15:00. " * 3))
+    return messages
+
+
+def build_checkpoint(messages: list) -> dict:
+    return {
+        "v": 1,
+        "id": str(uuid.uuid4()),
+        "ts": "2025-07-24T09:00:00+00:00",
+        "channel_values": {"messages": [message_to_dict(m) for m in messages]},
+        "channel_versions": {"messages": len(messages), "__start__": 2},
+        "versions_seen": {"call_llm": {"messages": len(messages)}},
+        "pending_sends": [],
+    }
+
+
+def timed(fn, repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=20, help="Turnos de conversación de la sesión sintética")
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--redis-url", default=None, help="Si se indica, mide MEMORY USAGE en Redis")
+    args = parser.parse_args()
+
+    messages = build_session(args.turns)
+    checkpoint = build_checkpoint(messages)
+    redis_client = None
+    if args.redis_url:
+        import redis
+        redis_client = redis.Redis.from_url(args.redis_url)
+
+    print(f"Sesión sintética: {len(messages)} mensajes, {args.repeat} repeticiones\n")
+    print(f"{'códec':<8} {'compresión':<11} {'bytes':>9} {'encode ms':>10} {'decode ms':>10} {'msg delta B':>12} {'redis B':>9}")
+
+    for codec in ("json", "msgpack"):
+        for compression in ("none", "zlib", "zstd", "lz4"):
+            try:
+                serializer = CheckpointSerializer(codec, compression)
+            except ValueError as e:
+                print(f"{codec:<8} {compression:<11} {e}")
+                continue
+            if (serializer.codec, serializer.compression) != (codec, compression):
+                print(f"{codec:<8} {compression:<11} (no instalado)")
+                continue
+
+            payload = serializer.dumps(checkpoint)
+            encode_ms = timed(lambda: serializer.dumps(checkpoint), args.repeat)
+            decode_ms = timed(
+                lambda: [message_from_dict(m) for m in serializer.loads(payload)["channel_values"]["messages"]],
+                args.repeat,
+            )
+            # Coste del modo delta: lo que se escribe por el último mensaje de un turno
+            delta_bytes = len(serializer.dumps(message_to_dict(messages[-1])))
+
+            redis_bytes = "-"
+            if redis_client is not None:
+                key = f"bench:checkpoint:{codec}:{compression}"
+                redis_client.set(key, payload)
+                redis_bytes = redis_client.memory_usage(key)
+                redis_client.delete(key)
+
+            print(f"{codec:<8} {compression:<11} {len(payload):>9} {encode_ms:>10.3f} {decode_ms:>10.3f} {delta_bytes:>12} {redis_bytes:>9}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+Benchmark de concurrencia: RedisCheckpointer (hilos) frente a AsyncRedisCheckpointer (asyncio).
+
+Ejecuta un grafo mínimo de LangGraph (un nodo que añade un mensaje) sobre muchas sesiones
+concurrentes, de modo que el coste medido es el del checkpointer: get_tuple/put/put_writes
+en cada turno. La versión síncrona usa un ThreadPoolExecutor y la asíncrona asyncio.gather,
+ambas con el mismo nivel de concurrencia. Usa el Redis configurado en las variables de
+entorno (REDIS_HOST, REDIS_PORT, REDIS_PASSWORD...) y borra sus sesiones al terminar.
+
+Uso (desde la raíz del repositorio):
+    python -m src.agents.benchmarks.bench_checkpointer_concurrency --sessions 100 --turns 5 --concurrency 50
+"""
+import argparse
+import asyncio
+import statistics
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from langchain_core.messages import AIMessage, HumanMessage
+from langgraph.graph import StateGraph, END
+
+from src.agents.modules.state import AgentState
+from src.agents.modules.redis_checkpointer import RedisCheckpointer
+from src.agents.modules.async_redis_checkpointer import AsyncRedisCheckpointer
+
+
+def build_graph(checkpointer, node_latency: float, is_async: bool):
+    if is_async:
+        async def node(state):
+            if node_latency:
+                await asyncio.sleep(node_latency)
+            return {"messages": [AIMessage(content=f"respuesta {len(state['messages'])}")]}
+    else:
+        def node(state):
+            if node_latency:
+                time.sleep(node_latency)
+            return {"messages": [AIMessage(content=f"respuesta {len(state['messages'])}")]}
+
+    workflow = StateGraph(AgentState)
+    workflow.add_node("respond", node)
+    workflow.set_entry_point("respond")
+    workflow.add_edge("respond", END)
+    return workflow.compile(checkpointer=checkpointer)
+
+
+def report(name: str, latencies: list, elapsed: float) -> None:
+    latencies = sorted(latencies)
+    quantiles = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else latencies * 99
+    print(
+        f"{name:<6} turnos={len(latencies):>6}  throughput={len(latencies) / elapsed:>8.1f} turnos/s  "
+        f"p50={quantiles[49] * 1000:>7.2f} ms  p95={quantiles[94] * 1000:>7.2f} ms  p99={quantiles[98] * 1000:>7.2f} ms"
+    )
+
+
+def run_sync(args, thread_ids: list) -> None:
+    checkpointer = RedisCheckpointer()
+    graph = build_graph(checkpointer, args.node_latency_ms / 1000, is_async=False)
+
+    def run_session(thread_id: str) -> list:
+        latencies = []
+        config = {"configurable": {"thread_id": thread_id}}
+        for turn in range(args.turns):
+            start = time.perf_counter()
+            graph.invoke({"messages": [HumanMessage(content=f"mensaje {turn}")]}, config)
+            latencies.append(time.perf_counter() - start)
+        return latencies
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        results = list(executor.map(run_session, thread_ids))
+    report("sync", [lat for session in results for lat in session], time.perf_counter() - start)
+
+    for thread_id in thread_ids:
+        checkpointer.clear_session(thread_id)
+
+
+async def run_async(args, thread_ids: list) -> None:
+    checkpointer = AsyncRedisCheckpointer()
+    graph = build_graph(checkpointer, args.node_latency_ms / 1000, is_async=True)
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def run_session(thread_id: str) -> list:
+        latencies = []
+        config = {"configurable": {"thread_id": thread_id}}
+        async with semaphore:
+            for turn in range(args.turns):
+                start = time.perf_counter()
+                await graph.ainvoke({"messages": [HumanMessage(content=f"mensaje {turn}")]}, config)
+                latencies.append(time.perf_counter() - start)
+        return latencies
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*[run_session(thread_id) for thread_id in thread_ids])
+    report("async", [lat for session in results for lat in session], time.perf_counter() - start)
+
+    for thread_id in thread_ids:
+        checkpointer.clear_session(thread_id)
+    await checkpointer.aclose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=100, help="Nº de sesiones (threads) distintas")
+    parser.add_argument("--turns", type=int, default=5, help="Turnos por sesión")
+    parser.add_argument("--concurrency", type=int, default=50, help="Sesiones en curso a la vez")
+    parser.add_argument("--node-latency-ms", type=float, default=0.0, help="Espera simulada dentro del nodo (p. ej. el LLM)")
+    args = parser.parse_args()
+
+    run_id = uuid.uuid4().hex[:8]
+    print(f"{args.sessions} sesiones x {args.turns} turnos, concurrencia {args.concurrency}\n")
+    run_sync(args, [f"bench-sync-{run_id}-{i}" for i in range(args.sessions)])
+    asyncio.run(run_async(args, [f"bench-async-{run_id}-{i}" for i in range(args.sessions)]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+Benchmark del logging de las rutas calientes.
+
+Simula los registros de un turno de /chat (nodos del grafo, router, herramienta y
+checkpointer: 12 eventos por turno) y mide turnos/s con cada configuración: mensajes con
+f-string (como antes) frente a formato perezoso, salida de texto o JSON, muestreo de los
+eventos por paso y nivel por módulo en WARNING. La salida va a os.devnull, así que se mide
+solo el coste de crear, filtrar y formatear los registros.
+
+Uso (desde la raíz del repositorio):
+    python -m src.agents.benchmarks.bench_logging --turns 20000
+"""
+import argparse
+import logging
+import os
+import statistics
+import time
+
+from src.agents.modules.log_config import HotPathFilter, JsonFormatter, TEXT_FORMAT
+
+logger = logging.getLogger("bench.hot_path")
+
+STATE = {"gym_slot_iso_to_book": "2025-07-24T09:00:00", "user_name_for_gym_booking": None, "pending_gym_slot_confirmation": True}
+TOOL_ARGS = {"query": "¿Cuál es la política de mascotas y el horario del check-in?"}
+RAG_OUTPUT = "Información recuperada de la base de conocimientos: el check-in se realiza a partir de las 15:00. " * 6
+MESSAGE = "¿Se admiten mascotas en el hotel? ¿Y a qué hora es el check-in?"
+
+
+def turn_fstring(thread_id: str) -> None:
+    logger.info(f"📬 Mensaje recibido para thread '{thread_id}': '{MESSAGE[:100]}'")
+    logger.info(f"  [LLM Node] Llamando al LLM con {12} mensajes.")
+    logger.info(f"  [UpdateStateAfterLLM] Estado después de actualizar: gym_slot='{STATE.get('gym_slot_iso_to_book')}', user_name='{STATE.get('user_name_for_gym_booking')}', pending_confirm='{STATE.get('pending_gym_slot_confirmation')}'")
+    logger.info("    [Router] LLM solicitó herramienta correctamente vía .tool_calls.")
+    logger.info(f"    [Tools Node] Invocando herramienta: '{'external_rag_search_tool'}' con args: {TOOL_ARGS}")
+    logger.info(f"🛠️ Herramienta RAG Externa llamada con: query='{TOOL_ARGS['query']}', limit={3}, threshold={0.3}")
+    logger.info(f"📤 Herramienta RAG devolviendo (primeros 200 chars): {RAG_OUTPUT[:200]}...")
+    logger.info(f"  [UpdateStateAfterTool] Estado después de actualizar: gym_slot='{STATE.get('gym_slot_iso_to_book')}', user_name='{STATE.get('user_name_for_gym_booking')}', pending_confirm='{STATE.get('pending_gym_slot_confirmation')}'")
+    logger.debug(f"🔧 [PUT] thread_id: {thread_id}, checkpoint_ns: {''}")
+    logger.debug(f"✅ Checkpoint guardado para {thread_id}: {14} mensajes, {len(RAG_OUTPUT)} bytes")
+    logger.info("    [Router] El LLM no solicitó herramienta. La ejecución termina.")
+    logger.info(f"💬 Respuesta para '{thread_id}' en {1.234:.2f}s (trace {'0' * 32}): '{RAG_OUTPUT[:100]}'")
+
+
+def turn_lazy(thread_id: str) -> None:
+    logger.info("📬 Mensaje recibido para thread '%s': '%.100s'", thread_id, MESSAGE, extra={"thread_id": thread_id})
+    logger.info("  [LLM Node] Llamando al LLM con %d mensajes.", 12, extra={"step": "call_llm"})
+    logger.info(
+        "  [UpdateStateAfterLLM] Estado después de actualizar: gym_slot='%s', user_name='%s', pending_confirm='%s'",
+        STATE.get('gym_slot_iso_to_book'), STATE.get('user_name_for_gym_booking'), STATE.get('pending_gym_slot_confirmation'),
+        extra={"step": "update_state_after_llm"},
+    )
+    logger.info("    [Router] LLM solicitó herramienta correctamente vía .tool_calls.", extra={"step": "router"})
+    logger.info("    [Tools Node] Invocando herramienta: '%s' con args: %s", "external_rag_search_tool", TOOL_ARGS, extra={"step": "invoke_tool", "tool": "external_rag_search_tool"})
+    logger.info("🛠️ Herramienta RAG Externa llamada con: query='%s', limit=%s, threshold=%s", TOOL_ARGS['query'], 3, 0.3, extra={"step": "tool", "tool": "external_rag_search_tool"})
+    logger.info("📤 Herramienta RAG devolviendo (primeros 200 chars): %.200s...", RAG_OUTPUT, extra={"step": "tool", "tool": "external_rag_search_tool"})
+    logger.info(
+        "  [UpdateStateAfterTool] Estado después de actualizar: gym_slot='%s', user_name='%s', pending_confirm='%s'",
+        STATE.get('gym_slot_iso_to_book'), STATE.get('user_name_for_gym_booking'), STATE.get('pending_gym_slot_confirmation'),
+        extra={"step": "update_state_after_tool"},
+    )
+    logger.debug("🔧 [PUT] thread_id: %s, checkpoint_ns: %s", thread_id, "", extra={"step": "checkpoint.put", "thread_id": thread_id})
+    logger.debug("✅ Checkpoint guardado para %s: %d mensajes, %d bytes", thread_id, 14, len(RAG_OUTPUT), extra={"step": "checkpoint.put", "thread_id": thread_id})
+    logger.info("    [Router] El LLM no solicitó herramienta. La ejecución termina.", extra={"step": "router"})
+    logger.info("💬 Respuesta para '%s' en %.2fs (trace %s): '%.100s'", thread_id, 1.234, "0" * 32, RAG_OUTPUT, extra={"thread_id": thread_id})
+
+
+# nombre -> (función del turno, formato, nivel del logger, muestreo de pasos, límite por minuto)
+SCENARIOS = {
+    "f-string texto INFO (antes)": (turn_fstring, "text", logging.INFO, 1.0, 0),
+    "perezoso texto INFO": (turn_lazy, "text", logging.INFO, 1.0, 0),
+    "perezoso JSON INFO": (turn_lazy, "json", logging.INFO, 1.0, 0),
+    "perezoso JSON INFO, pasos al 10%": (turn_lazy, "json", logging.INFO, 0.1, 0),
+    "perezoso JSON INFO, 600/min": (turn_lazy, "json", logging.INFO, 1.0, 600),
+    "f-string, módulo en WARNING": (turn_fstring, "text", logging.WARNING, 1.0, 0),
+    "perezoso, módulo en WARNING": (turn_lazy, "json", logging.WARNING, 1.0, 0),
+}
+
+
+def run_scenario(turn, log_format: str, level: int, step_sample_rate: float, per_minute: int, turns: int) -> float:
+    with open(os.devnull, "w", encoding="utf-8") as devnull:
+        handler = logging.StreamHandler(devnull)
+        handler.setFormatter(JsonFormatter() if log_format == "json" else logging.Formatter(TEXT_FORMAT))
+        handler.addFilter(HotPathFilter(per_minute=per_minute, step_sample_rate=step_sample_rate))
+        logger.handlers = [handler]
+        logger.propagate = False
+        logger.setLevel(level)
+        start = time.perf_counter()
+        for i in range(turns):
+            turn(f"session-{i % 100}")
+        elapsed = time.perf_counter() - start
+        logger.handlers = []
+    return turns / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    baseline = None
+    print(f"{'escenario':<36} {'turnos/s':>12} {'µs/turno':>10} {'vs antes':>9}")
+    for name, scenario in SCENARIOS.items():
+        rate = statistics.median(run_scenario(*scenario, args.turns) for _ in range(args.repeat))
+        baseline = baseline or rate
+        print(f"{name:<36} {rate:>12.0f} {1e6 / rate:>10.1f} {rate / baseline:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
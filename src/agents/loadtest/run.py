@@ -0,0 +1,192 @@
+"""
+Generador de carga para /chat.
+
+Reproduce conversaciones de varios turnos (scenarios.py) con `--concurrency` conversaciones
+simultáneas y una mezcla de escenarios configurable, y resume por escenario: throughput,
+percentiles de latencia por turno y tasa de errores. Con --with-stubs arranca en este
+proceso los sustitutos de stubs.py (Ollama falso, api_rag sobre Qdrant en memoria,
+api_services sobre SQLite) y un agente (`python -m src.agents.api.main`) apuntando a ellos;
+el agente sigue necesitando el Redis configurado en REDIS_HOST / REDIS_PORT / REDIS_PASSWORD.
+
+Uso (desde la raíz del repositorio):
+    python -m src.agents.loadtest.run --with-stubs --conversations 200 --concurrency 20
+    python -m src.agents.loadtest.run --target http://localhost:8081 --mix politicas=0.5,disponibilidad=0.3,reserva=0.2
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import requests
+
+from .scenarios import SCENARIOS
+from .stubs import StubServices, add_stub_arguments, ollama_config_from_args
+
+REPO_ROOT = Path(__file__).resolve().parents[3]
+
+
+@dataclass
+class TurnResult:
+    scenario: str
+    conversation: str
+    turn: int
+    latency_ms: float
+    status: int
+    error: Optional[str] = None
+    tools_used: int = 0
+
+
+def run_conversation(target: str, scenario_name: str, seed: int, think_time: float, timeout: float) -> List[TurnResult]:
+    """Ejecuta los turnos de una conversación en orden con el mismo thread_id."""
+    rng = random.Random(seed)
+    thread_id = f"loadtest-{uuid.uuid4().hex[:12]}"
+    results = []
+    with requests.Session() as session:
+        for turn, message in enumerate(SCENARIOS[scenario_name].build(rng)):
+            start = time.perf_counter()
+            status, error, tools_used = 0, None, 0
+            try:
+                response = session.post(f"{target}/chat", json={"message": message, "thread_id": thread_id}, timeout=timeout)
+                status = response.status_code
+                if status == 200:
+                    tools_used = len(response.json().get("tools_used", []))
+                else:
+                    error = response.text[:200]
+            except requests.RequestException as e:
+                error = type(e).__name__
+            results.append(TurnResult(scenario_name, thread_id, turn, (time.perf_counter() - start) * 1000, status, error, tools_used))
+            if error:
+                # Sin la respuesta de este turno el resto del guion no tiene sentido
+                break
+            if think_time:
+                time.sleep(rng.expovariate(1 / think_time))
+    return results
+
+
+def percentile(sorted_values: List[float], q: float) -> Optional[float]:
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+def summarize(results: List[TurnResult], elapsed: float) -> Dict[str, dict]:
+    """Resumen por escenario (y "total"): turnos, errores, turnos/s y percentiles de latencia."""
+    groups: Dict[str, List[TurnResult]] = {"total": results}
+    for result in results:
+        groups.setdefault(result.scenario, []).append(result)
+
+    summary = {}
+    for name, group in groups.items():
+        latencies = sorted(r.latency_ms for r in group if r.error is None)
+        errors = sum(1 for r in group if r.error is not None)
+        summary[name] = {
+            "conversations": len({r.conversation for r in group}),
+            "turns": len(group),
+            "errors": errors,
+            "error_rate": errors / len(group) if group else 0.0,
+            "turns_per_second": len(group) / elapsed if elapsed else 0.0,
+            "p50_ms": percentile(latencies, 0.5),
+            "p95_ms": percentile(latencies, 0.95),
+            "p99_ms": percentile(latencies, 0.99),
+            "max_ms": latencies[-1] if latencies else None,
+        }
+    return summary
+
+
+def run_load(target: str, mix: Dict[str, float], conversations: int, concurrency: int, think_time: float, timeout: float, seed: int):
+    rng = random.Random(seed)
+    names, weights = zip(*mix.items())
+    plan = [(rng.choices(names, weights)[0], rng.randrange(2 ** 32)) for _ in range(conversations)]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = [executor.submit(run_conversation, target, name, conversation_seed, think_time, timeout) for name, conversation_seed in plan]
+        results = [result for future in futures for result in future.result()]
+    return results, time.perf_counter() - start
+
+
+def print_report(summary: Dict[str, dict], elapsed: float) -> None:
+    fmt = lambda value: f"{value:9.0f}" if value is not None else f"{'-':>9}"
+    print(f"\nDuración: {elapsed:.1f}s")
+    print(f"{'escenario':<16} {'conv.':>6} {'turnos':>7} {'turnos/s':>9} {'errores':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'máx ms':>9}")
+    for name, row in sorted(summary.items(), key=lambda item: item[0] == "total"):
+        print(
+            f"{name:<16} {row['conversations']:>6} {row['turns']:>7} {row['turns_per_second']:>9.2f} "
+            f"{row['error_rate']:>7.1%} {fmt(row['p50_ms'])} {fmt(row['p95_ms'])} {fmt(row['p99_ms'])} {fmt(row['max_ms'])}"
+        )
+
+
+def start_agent(env: Dict[str, str], target: str, log_path: Path, timeout: float = 180.0) -> subprocess.Popen:
+    """Arranca la API del agente con las variables de los sustitutos y espera a que /health responda 200."""
+    log = open(log_path, "w", encoding="utf-8")
+    process = subprocess.Popen(
+        [sys.executable, "-m", "src.agents.api.main"],
+        cwd=REPO_ROOT, env={**os.environ, **env}, stdout=log, stderr=subprocess.STDOUT,
+    )
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"La API del agente terminó al arrancar (código {process.returncode}), ver {log_path}")
+        try:
+            if requests.get(f"{target}/health", timeout=2).status_code == 200:
+                return process
+        except requests.RequestException:
+            pass
+        time.sleep(1)
+    process.terminate()
+    raise RuntimeError(f"La API del agente no respondió en {timeout:.0f}s, ver {log_path}")
+
+
+def parse_mix(value: str) -> Dict[str, float]:
+    mix = {name.strip(): float(weight) for name, weight in (item.split("=", 1) for item in value.split(",") if "=" in item)}
+    unknown = set(mix) - set(SCENARIOS)
+    if unknown or not mix:
+        raise argparse.ArgumentTypeError(f"Escenarios válidos: {', '.join(SCENARIOS)}")
+    return mix
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--target", default="http://127.0.0.1:8081", help="URL base de la API del agente")
+    parser.add_argument("--conversations", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix("politicas=0.5,disponibilidad=0.3,reserva=0.2"))
+    parser.add_argument("--think-time-ms", type=float, default=0.0, help="Pausa media (exponencial) entre turnos")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Timeout por turno (s)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json-out", help="Guarda el resumen y cada turno en este fichero JSON")
+    parser.add_argument("--with-stubs", action="store_true", help="Arranca los sustitutos y la API del agente")
+    add_stub_arguments(parser)
+    args = parser.parse_args()
+
+    stubs, agent = None, None
+    try:
+        if args.with_stubs:
+            random.seed(args.seed)
+            stubs = StubServices(ollama_config_from_args(args)).start()
+            print(f"Sustitutos: Ollama {stubs.url('ollama')}, RAG {stubs.url('rag')}, servicios {stubs.url('services')} ({stubs.workdir})")
+            agent = start_agent(stubs.agent_env(), args.target, stubs.workdir / "agent.log")
+
+        results, elapsed = run_load(args.target, args.mix, args.conversations, args.concurrency, args.think_time_ms / 1000, args.timeout, args.seed)
+        summary = summarize(results, elapsed)
+        print_report(summary, elapsed)
+        if args.json_out:
+            with open(args.json_out, "w", encoding="utf-8") as f:
+                json.dump({"elapsed_seconds": elapsed, "summary": summary, "turns": [asdict(r) for r in results]}, f, indent=2)
+    finally:
+        if agent is not None:
+            agent.terminate()
+            agent.wait(30)
+        if stubs is not None:
+            stubs.close()
+
+
+if __name__ == "__main__":
+    main()
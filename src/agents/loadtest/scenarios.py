@@ -0,0 +1,64 @@
+"""
+Guiones de conversación para las pruebas de carga: cada escenario genera los mensajes de
+una conversación de varios turnos (mismo thread_id) con variaciones aleatorias.
+"""
+import random
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List
+
+POLICY_QUESTIONS = [
+    "¿A qué hora es el check-in y el check-out?",
+    "¿Se admiten mascotas en el hotel?",
+    "¿El desayuno está incluido en la tarifa?",
+    "¿Cuál es la política de cancelación?",
+    "¿Hay parking en el hotel y cuánto cuesta?",
+    "¿Tenéis wifi gratuito en las habitaciones?",
+    "¿Se puede fumar en las habitaciones?",
+    "¿Hasta qué hora está abierta la piscina?",
+]
+GUEST_NAMES = ["Lucía Fernández", "Carlos Portilla", "Marta Gómez", "John Smith", "Ana Ruiz", "Pierre Dubois"]
+
+
+@dataclass(frozen=True)
+class Scenario:
+    name: str
+    description: str
+    build: Callable[[random.Random], List[str]]
+
+
+def gym_slot(rng: random.Random) -> str:
+    """Hora en punto de los próximos días dentro del horario del gimnasio (slots del generador: 6-22 h, 7 días)."""
+    day = datetime.now() + timedelta(days=rng.randint(1, 5))
+    return day.strftime(f"%Y-%m-%dT{rng.randint(8, 20):02d}:00:00")
+
+
+def policy_conversation(rng: random.Random) -> List[str]:
+    return rng.sample(POLICY_QUESTIONS, rng.randint(2, 3))
+
+
+def availability_conversation(rng: random.Random) -> List[str]:
+    return [
+        f"¿Hay disponibilidad en el gimnasio el {gym_slot(rng)}?",
+        f"¿Y el {gym_slot(rng)}?",
+        rng.choice(POLICY_QUESTIONS),
+    ]
+
+
+def booking_conversation(rng: random.Random) -> List[str]:
+    slot = gym_slot(rng)
+    return [
+        f"Quiero ir al gimnasio, ¿hay plazas el {slot}?",
+        f"Perfecto, resérvalo para el {slot} a nombre de {rng.choice(GUEST_NAMES)}",
+        "Gracias, ¿hasta qué hora puedo hacer el check-out?",
+    ]
+
+
+SCENARIOS: Dict[str, Scenario] = {
+    scenario.name: scenario
+    for scenario in (
+        Scenario("politicas", "Preguntas sobre las políticas del hotel (RAG)", policy_conversation),
+        Scenario("disponibilidad", "Consultas de disponibilidad del gimnasio y una pregunta de políticas", availability_conversation),
+        Scenario("reserva", "Disponibilidad, reserva con nombre y pregunta final", booking_conversation),
+    )
+}
@@ -0,0 +1,332 @@
+"""
+Servicios sustitutos para las pruebas de carga, sin GPU ni infraestructura externa.
+
+- Ollama falso (`/api/chat`, `/api/embeddings`, `/api/embed`, `/api/tags`): responde con
+  llamadas a herramienta guionizadas según la conversación (disponibilidad, reserva o RAG) y
+  simula la latencia del modelo: tiempo hasta el primer token lognormal (mediana y p95),
+  generación a N tokens/s y una tasa de errores configurable. Los embeddings son vectores
+  deterministas (hashing de palabras), así que textos parecidos dan vectores cercanos.
+- api_rag real sobre un Qdrant en memoria, cargado con los documentos de rag_loader.
+- api_services real sobre SQLite con los datos simulados del generador.
+
+Uso (desde la raíz del repositorio; imprime las variables de entorno para el agente):
+    python -m src.agents.loadtest.stubs --llm-ttft-ms 800:2500 --llm-tokens-per-second 30
+"""
+import argparse
+import hashlib
+import importlib
+import importlib.util
+import json
+import math
+import os
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from flask import Flask, Response, jsonify, request
+from werkzeug.serving import make_server
+
+SRC_DIR = Path(__file__).resolve().parents[2]
+DOCUMENTS_DIR = SRC_DIR / "rag_loader" / "documents"
+EMBEDDING_DIM = 256
+
+ISO_DATETIME = re.compile(r"\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}")
+GUEST_NAME = re.compile(r"a nombre de ([A-ZÁÉÍÓÚÑ][\wáéíóúñ]+(?: [A-ZÁÉÍÓÚÑ][\wáéíóúñ]+)*)")
+
+
+@dataclass
+class LatencyModel:
+    """Latencia lognormal definida por su mediana y su p95 (ms); "800:2500" en la línea de comandos."""
+
+    median_ms: float = 0.0
+    p95_ms: float = 0.0
+
+    @classmethod
+    def parse(cls, value: str) -> "LatencyModel":
+        median, _, p95 = value.partition(":")
+        return cls(float(median), float(p95 or median))
+
+    def sample(self) -> float:
+        """Una latencia en segundos."""
+        if self.median_ms <= 0:
+            return 0.0
+        sigma = math.log(max(self.p95_ms, self.median_ms) / self.median_ms) / 1.645
+        return random.lognormvariate(math.log(self.median_ms), sigma) / 1000
+
+
+@dataclass
+class FakeOllamaConfig:
+    model: str = "caporti/qwen3-capor"
+    time_to_first_token: LatencyModel = field(default_factory=lambda: LatencyModel(800, 2500))
+    tokens_per_second: float = 30.0
+    embedding_latency: LatencyModel = field(default_factory=lambda: LatencyModel(20, 60))
+    error_rate: float = 0.0
+
+
+def fake_embedding(text: str, dim: int = EMBEDDING_DIM) -> List[float]:
+    """Vector normalizado por hashing de palabras: comparte dimensiones entre textos con palabras comunes."""
+    vector = [0.0] * dim
+    for word in re.findall(r"\w+", text.lower()):
+        digest = int.from_bytes(hashlib.blake2b(word.encode(), digest_size=8).digest(), "big")
+        vector[digest % dim] += 1.0 if (digest >> 32) & 1 else -1.0
+    norm = math.sqrt(sum(v * v for v in vector))
+    if not norm:
+        vector[0], norm = 1.0, 1.0
+    return [v / norm for v in vector]
+
+
+def scripted_reply(messages: List[dict], tool_names: List[str]) -> Tuple[str, List[dict]]:
+    """
+    Respuesta guionizada del modelo: (texto, tool_calls). Tras el resultado de una
+    herramienta contesta con texto; si no, reserva cuando el huésped da su nombre y hay una
+    fecha en la conversación, consulta disponibilidad si pregunta por el gimnasio, y en el
+    resto de casos busca en el RAG.
+    """
+    last = messages[-1] if messages else {}
+    if last.get("role") == "tool":
+        return f"Según la información consultada: {str(last.get('content', ''))[:300]}", []
+
+    text = str(last.get("content", ""))
+    lowered = text.lower()
+    dates = [d for m in messages if m.get("role") == "user" for d in ISO_DATETIME.findall(str(m.get("content", "")))]
+    name = GUEST_NAME.search(text)
+
+    if name and dates and "book_gym_slot" in tool_names:
+        return "", [{"function": {"name": "book_gym_slot", "arguments": {"booking_date": dates[-1], "user_name": name.group(1)}}}]
+    if ("gimnasio" in lowered or "disponib" in lowered) and "check_gym_availability" in tool_names:
+        if not dates:
+            tomorrow = datetime.now() + timedelta(days=1)
+            dates = [tomorrow.strftime("%Y-%m-%dT08:00:00")]
+        return "", [{"function": {"name": "check_gym_availability", "arguments": {"target_date": dates[-1]}}}]
+    if "external_rag_search_tool" in tool_names:
+        return "", [{"function": {"name": "external_rag_search_tool", "arguments": {"query": text}}}]
+    return "¿Puedo ayudarte con algo más durante tu estancia?", []
+
+
+def create_fake_ollama(config: FakeOllamaConfig) -> Flask:
+    app = Flask("fake_ollama")
+
+    def chat_response(content: str = "", tool_calls: Optional[List[dict]] = None, done: bool = False, **stats) -> dict:
+        message = {"role": "assistant", "content": content}
+        if tool_calls:
+            message["tool_calls"] = tool_calls
+        return {"model": config.model, "created_at": datetime.now(timezone.utc).isoformat(), "message": message, "done": done, **stats}
+
+    @app.route("/api/tags", methods=["GET"])
+    def tags():
+        return jsonify({"models": [{"name": config.model, "model": config.model}]})
+
+    @app.route("/api/embeddings", methods=["POST"])
+    def embeddings():
+        time.sleep(config.embedding_latency.sample())
+        return jsonify({"embedding": fake_embedding(request.get_json().get("prompt", ""))})
+
+    @app.route("/api/embed", methods=["POST"])
+    def embed():
+        time.sleep(config.embedding_latency.sample())
+        inputs = request.get_json().get("input", "")
+        inputs = [inputs] if isinstance(inputs, str) else inputs
+        return jsonify({"model": config.model, "embeddings": [fake_embedding(text) for text in inputs]})
+
+    @app.route("/api/chat", methods=["POST"])
+    def chat():
+        body = request.get_json()
+        if config.error_rate and random.random() < config.error_rate:
+            return jsonify({"error": "fallo simulado del modelo"}), 500
+
+        messages = body.get("messages", [])
+        tool_names = [tool.get("function", {}).get("name") for tool in body.get("tools") or []]
+        content, tool_calls = scripted_reply(messages, tool_names)
+        prompt_tokens = sum(len(str(m.get("content", ""))) for m in messages) // 4
+        tokens = re.findall(r"\S+\s*", content)
+        # Una llamada a herramienta cuesta lo que su JSON (~4 caracteres por token)
+        eval_count = len(tokens) or max(1, len(json.dumps(tool_calls)) // 4)
+        prefill = config.time_to_first_token.sample()
+        per_token = 1 / config.tokens_per_second if config.tokens_per_second > 0 else 0.0
+        stats = {
+            "done_reason": "stop",
+            "total_duration": int((prefill + per_token * eval_count) * 1e9),
+            "load_duration": 0,
+            "prompt_eval_count": prompt_tokens,
+            "prompt_eval_duration": int(prefill * 1e9),
+            "eval_count": eval_count,
+            "eval_duration": int(per_token * eval_count * 1e9),
+        }
+
+        if not body.get("stream", True):
+            time.sleep(prefill + per_token * eval_count)
+            return jsonify(chat_response(content, tool_calls, done=True, **stats))
+
+        def generate():
+            time.sleep(prefill)
+            if tool_calls:
+                # Ollama entrega las llamadas a herramienta completas en un solo fragmento
+                time.sleep(per_token * eval_count)
+                yield json.dumps(chat_response(tool_calls=tool_calls)) + "\n"
+            else:
+                for token in tokens:
+                    yield json.dumps(chat_response(token)) + "\n"
+                    time.sleep(per_token)
+            yield json.dumps(chat_response(done=True, **stats)) + "\n"
+
+        return Response(generate(), mimetype="application/x-ndjson")
+
+    return app
+
+
+def _load_module(name: str, path: Path):
+    # Los servicios importan `observability` y `generator` desde src/, como en sus imágenes Docker
+    if str(SRC_DIR) not in sys.path:
+        sys.path.insert(0, str(SRC_DIR))
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def _chunk_text(text: str, size: int = 1000) -> List[str]:
+    """Trocea por párrafos en bloques de ~`size` caracteres (como rag_loader)."""
+    chunks, current = [], ""
+    for paragraph in re.split(r"\n\s*\n", text):
+        if current and len(current) + len(paragraph) > size:
+            chunks.append(current.strip())
+            current = ""
+        current += paragraph + "\n\n"
+    if current.strip():
+        chunks.append(current.strip())
+    return chunks
+
+
+def create_rag_app(ollama_port: int, documents_dir: Path = DOCUMENTS_DIR):
+    """api_rag con un Qdrant en memoria cargado con los documentos (embeddings falsos)."""
+    os.environ["OLLAMA_HOST"], os.environ["OLLAMA_PORT"] = "127.0.0.1", str(ollama_port)
+    module = _load_module("loadtest_api_rag", SRC_DIR / "api" / "api_rag" / "main.py")
+
+    from qdrant_client import QdrantClient
+    from qdrant_client.models import Distance, PointStruct, VectorParams
+
+    client = QdrantClient(":memory:")
+    client.create_collection(module.COLLECTION_NAME, vectors_config=VectorParams(size=EMBEDDING_DIM, distance=Distance.COSINE))
+    points = []
+    for path in sorted(documents_dir.glob("*.txt")):
+        for index, text in enumerate(_chunk_text(path.read_text(encoding="utf-8"))):
+            points.append(PointStruct(
+                id=len(points),
+                vector=fake_embedding(text),
+                payload={"text": text, "filename": path.name, "chunk_index": index, "file_type": "txt"},
+            ))
+    client.upsert(module.COLLECTION_NAME, points=points)
+    module.qdrant_client = client
+    return module.app, len(points)
+
+
+def create_services_app(db_path: Path):
+    """api_services sobre SQLite con servicios, slots de 7 días y reservas simuladas."""
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+    if str(SRC_DIR) not in sys.path:
+        sys.path.insert(0, str(SRC_DIR))
+    generator = importlib.import_module("generator.main")
+    session = generator.get_session()
+    generator.generate_services(session)
+    generator.generate_slots(session)
+    generator.generate_bookings(session)
+    session.close()
+    return _load_module("loadtest_api_services", SRC_DIR / "api" / "api_services" / "app.py").app
+
+
+class StubServices:
+    """Arranca los sustitutos en hilos de este proceso (puertos libres si se pasa 0)."""
+
+    def __init__(
+        self,
+        ollama_config: FakeOllamaConfig,
+        host: str = "127.0.0.1",
+        ollama_port: int = 0,
+        rag_port: int = 0,
+        services_port: int = 0,
+        workdir: Optional[str] = None,
+    ):
+        self.ollama_config = ollama_config
+        self.host = host
+        self.ports = {"ollama": ollama_port, "rag": rag_port, "services": services_port}
+        self.workdir = Path(workdir or tempfile.mkdtemp(prefix="loadtest-"))
+        self._servers = []
+
+    def _serve(self, app, port: int) -> int:
+        server = make_server(self.host, port, app, threaded=True)
+        threading.Thread(target=server.serve_forever, name=f"stub-{app.name}", daemon=True).start()
+        self._servers.append(server)
+        return server.server_port
+
+    def start(self) -> "StubServices":
+        self.workdir.mkdir(parents=True, exist_ok=True)
+        self.ports["ollama"] = self._serve(create_fake_ollama(self.ollama_config), self.ports["ollama"])
+        rag_app, self.rag_chunks = create_rag_app(self.ports["ollama"])
+        self.ports["rag"] = self._serve(rag_app, self.ports["rag"])
+        self.ports["services"] = self._serve(create_services_app(self.workdir / "services.db"), self.ports["services"])
+        return self
+
+    def url(self, name: str) -> str:
+        return f"http://{self.host}:{self.ports[name]}"
+
+    def agent_env(self) -> Dict[str, str]:
+        """Variables de entorno que apuntan el agente a los sustitutos (métricas en SQLite)."""
+        return {
+            "OLLAMA_HOST": self.url("ollama"),
+            "RAG_SERVICE_URL": self.url("rag"),
+            "GYM_API_URL": self.url("services"),
+            "OLLAMA_MODEL_NAME": self.ollama_config.model,
+            "METRICS_DB_URL": f"sqlite:///{self.workdir / 'metrics.db'}",
+        }
+
+    def close(self) -> None:
+        for server in self._servers:
+            server.shutdown()
+        self._servers = []
+
+
+def add_stub_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--llm-ttft-ms", default="800:2500", help="Tiempo hasta el primer token, mediana:p95 (ms)")
+    parser.add_argument("--llm-tokens-per-second", type=float, default=30.0)
+    parser.add_argument("--llm-error-rate", type=float, default=0.0, help="Fracción de llamadas a /api/chat que fallan con 500")
+    parser.add_argument("--embedding-ms", default="20:60", help="Latencia de los embeddings, mediana:p95 (ms)")
+
+
+def ollama_config_from_args(args) -> FakeOllamaConfig:
+    return FakeOllamaConfig(
+        time_to_first_token=LatencyModel.parse(args.llm_ttft_ms),
+        tokens_per_second=args.llm_tokens_per_second,
+        embedding_latency=LatencyModel.parse(args.embedding_ms),
+        error_rate=args.llm_error_rate,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_stub_arguments(parser)
+    parser.add_argument("--ollama-port", type=int, default=11500)
+    parser.add_argument("--rag-port", type=int, default=18080)
+    parser.add_argument("--services-port", type=int, default=18000)
+    args = parser.parse_args()
+
+    stubs = StubServices(ollama_config_from_args(args), ollama_port=args.ollama_port, rag_port=args.rag_port, services_port=args.services_port)
+    stubs.start()
+    print(f"Sustitutos en marcha ({stubs.rag_chunks} chunks en Qdrant, datos en {stubs.workdir}). Para el agente:")
+    for key, value in stubs.agent_env().items():
+        print(f"export {key}={value}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        stubs.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,17 @@
 # Modules package for the agent backend
+import os
+import sys
+
+# `observability` (compartido con api_rag y api_services) vive en src/, como en sus imágenes Docker
+_SRC_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if _SRC_DIR not in sys.path:
+    sys.path.insert(0, _SRC_DIR)
+
 from .config import RAG_SERVICE_URL, GYM_API_URL, OLLAMA_MODEL_NAME
 from .tools import external_rag_search_tool, check_gym_availability, book_gym_slot, ALL_TOOLS_LIST
 from .state import AgentState, get_current_agent_scratchpad, update_state_after_llm, update_state_after_tool
 from .prompt import RAG_SYSTEM_PROMPT
+from .intent_router import IntentMatch, classify_intent
 from .agent import RagAgent
 from .cli import main
 
@@ -19,6 +28,8 @@ __all__ = [
     'update_state_after_llm',
     'update_state_after_tool',
     'RAG_SYSTEM_PROMPT',
+    'IntentMatch',
+    'classify_intent',
     'RagAgent',
     'main'
 ] 
\ No newline at end of file
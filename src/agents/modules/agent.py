@@ -1,25 +1,35 @@
 import traceback
 import uuid
-import json
-import re
 import os
+import time
 from datetime import datetime
 
-from langchain_core.messages import SystemMessage, AIMessage, ToolMessage, HumanMessage
+from langchain_core.messages import SystemMessage, AIMessage, ToolMessage, HumanMessage, message_chunk_to_message
 from langchain_ollama import ChatOllama
 from langchain_core.utils.function_calling import convert_to_openai_tool
 from langgraph.checkpoint.memory import MemorySaver
 from langgraph.graph import END, StateGraph
 
 # Importa tu checkpointer personalizado y el estado
-from .config import OLLAMA_MODEL_NAME
+from .config import OLLAMA_MODEL_NAME, FAST_PATH_ENABLED, FAST_PATH_MIN_CONFIDENCE, SEMANTIC_CACHE_ENABLED, LLM_STREAMING_ENABLED
 from .state import AgentState, get_current_agent_scratchpad
+from .intent_router import classify_intent, is_booking_related
+from .semantic_cache import SemanticCache
+from .tools import extract_rag_chunk_ids, fetch_rag_chunk_ids
+from .tool_call_parser import ToolCallStreamParser, extract_tool_calls
 from .redis_checkpointer import RedisCheckpointer
 from .prompt import RAG_SYSTEM_PROMPT
+from .histogram import get_histogram
+from .tracing import start_span, traced
 
 import logging
 logger = logging.getLogger(__name__)
 
+RAG_TOOL_NAME = 'external_rag_search_tool'
+LLM_TOKEN_BUCKETS = (256, 512, 1024, 2048, 4096, 8192, 16384, 32768, 65536, 131072)
+LLM_THROUGHPUT_BUCKETS = (1, 2, 5, 10, 20, 30, 50, 75, 100, 150, 200, 400)
+GYM_TOOL_NAMES = {'check_gym_availability', 'book_gym_slot'}
+
 class RagAgent:
     def __init__(self, tools: list, ollama_model_name: str = OLLAMA_MODEL_NAME):
         self._tools_map = {t.name: t for t in tools}
@@ -36,11 +46,43 @@ class RagAgent:
             logger.error(f"❌ ERROR inicializando LLM ({ollama_model_name}): {e}\n{traceback.format_exc()}")
             raise
 
+        self._semantic_cache = None
+        if SEMANTIC_CACHE_ENABLED:
+            try:
+                self._semantic_cache = SemanticCache()
+            except Exception as e:
+                logger.warning(f"⚠️ Caché semántica deshabilitada, no se pudo inicializar: {e}")
+
         workflow = StateGraph(AgentState)
-        workflow.add_node('call_llm', self.call_llm_node)
-        workflow.add_node('invoke_tools_node', self.invoke_tools_node)
+        # Cada nodo abre un span `node.<nombre>` dentro de la traza del turno
+        workflow.add_node('cache_lookup', traced('node.cache_lookup')(self.semantic_cache_lookup_node))
+        workflow.add_node('fast_path', traced('node.fast_path')(self.fast_path_node))
+        workflow.add_node('call_llm', traced('node.call_llm')(self.call_llm_node))
+        workflow.add_node('invoke_tools_node', traced('node.invoke_tools')(self.invoke_tools_node))
+        workflow.add_node('cache_store', traced('node.cache_store')(self.semantic_cache_store_node))
+
+        workflow.set_entry_point('cache_lookup')
+
+        # Caché semántica: una pregunta informativa ya respondida termina aquí sin tocar el LLM.
+        workflow.add_conditional_edges(
+            'cache_lookup',
+            self.semantic_cache_router,
+            {
+                'fast_path': 'fast_path',
+                '__end__': END
+            }
+        )
 
-        workflow.set_entry_point('call_llm')
+        # Fast-path: intenciones triviales se resuelven sin LLM o invocando directamente la herramienta.
+        workflow.add_conditional_edges(
+            'fast_path',
+            self.fast_path_router,
+            {
+                'call_llm': 'call_llm',
+                'invoke_tool': 'invoke_tools_node',
+                '__end__': END
+            }
+        )
         
         # Flujo simplificado: El LLM decide si usar una herramienta o terminar.
         workflow.add_conditional_edges(
@@ -48,11 +90,12 @@ class RagAgent:
             self.should_invoke_tool_router,
             {
                 'invoke_tool': 'invoke_tools_node',
-                '__end__': END # Usar __end__ para terminar explícitamente la ejecución
+                '__end__': 'cache_store' # Antes de terminar, se intenta cachear la respuesta final
             }
         )
         # Después de usar una herramienta, siempre volvemos a llamar al LLM con el resultado.
         workflow.add_edge('invoke_tools_node', 'call_llm')
+        workflow.add_edge('cache_store', END)
 
         try:
             # Usando TU implementación de RedisCheckpointer
@@ -64,39 +107,177 @@ class RagAgent:
             self.graph = workflow.compile(checkpointer=MemorySaver())
             logger.warning("⚠️ Usando MemorySaver como fallback - Las conversaciones no persistirán")
 
+    @staticmethod
+    def _in_booking_flow(state: AgentState) -> bool:
+        """
+        Indica si el último mensaje puede ser una respuesta dentro de una reserva del gimnasio:
+        flags de reserva activos o un turno anterior que usó herramientas del gimnasio (el
+        mensaje puede ser la hora, el nombre o un "sí"). El grafo no actualiza los flags, así
+        que lo que cuenta es el historial.
+        """
+        if state.get('pending_gym_slot_confirmation') or state.get('gym_slot_iso_to_book'):
+            return True
+        for msg in reversed(state.get('messages', [])[:-1]):
+            if isinstance(msg, HumanMessage):
+                break
+            if isinstance(msg, ToolMessage) and msg.name in GYM_TOOL_NAMES:
+                return True
+        return False
+
+    def _is_cacheable_question(self, state: AgentState) -> bool:
+        """
+        Solo se cachean preguntas informativas. Cualquier mensaje del flujo de reservas del
+        gimnasio (con estado) queda excluido: menciones al gimnasio o a reservas, o una
+        reserva en curso (ver _in_booking_flow).
+        """
+        messages = state['messages']
+        question = messages[-1].content if messages and isinstance(messages[-1], HumanMessage) else None
+        if not isinstance(question, str) or not question.strip():
+            return False
+        if is_booking_related(question) or classify_intent(question).response:
+            return False
+        return not self._in_booking_flow(state)
+
+    def semantic_cache_lookup_node(self, state: AgentState) -> dict:
+        """
+        Busca la pregunta en la caché semántica. Una entrada solo se reutiliza si los chunks
+        que el RAG devuelve hoy para las mismas consultas coinciden con los que respaldaron
+        la respuesta original.
+        """
+        if not self._semantic_cache or not self._is_cacheable_question(state):
+            return {'messages': []}
+
+        question = state['messages'][-1].content
+        entry = self._semantic_cache.lookup(question)
+        if not entry:
+            return {'messages': []}
+
+        current_chunk_ids = set()
+        for rag_query in entry.get('rag_queries', []):
+            chunk_ids = fetch_rag_chunk_ids(**rag_query)
+            if chunk_ids is None:
+                return {'messages': []}
+            current_chunk_ids.update(chunk_ids)
+
+        if sorted(current_chunk_ids) != entry.get('chunk_ids'):
+            logger.info("  [Semantic Cache] Las fuentes de la entrada cacheada han cambiado. Se invalida.", extra={"step": "fast_path"})
+            self._semantic_cache.invalidate(entry['id'])
+            return {'messages': []}
+
+        return {'messages': [AIMessage(content=entry['answer'])]}
+
+    def semantic_cache_router(self, state: AgentState) -> str:
+        """Termina si la caché produjo la respuesta; si no, continúa por el fast-path."""
+        return '__end__' if isinstance(state['messages'][-1], AIMessage) else 'fast_path'
+
+    def semantic_cache_store_node(self, state: AgentState) -> dict:
+        """Guarda la respuesta final del turno si se apoyó exclusivamente en el RAG."""
+        if not self._semantic_cache:
+            return {'messages': []}
+
+        messages = state['messages']
+        turn_start = next((i for i in range(len(messages) - 1, -1, -1) if isinstance(messages[i], HumanMessage)), None)
+        if turn_start is None:
+            return {'messages': []}
+
+        turn_messages = messages[turn_start + 1:]
+        final_message = turn_messages[-1] if turn_messages else None
+        if not isinstance(final_message, AIMessage) or final_message.tool_calls or not final_message.content:
+            return {'messages': []}
+        if str(final_message.content).startswith("Error al procesar con LLM"):
+            return {'messages': []}
+        if not self._is_cacheable_question({**state, 'messages': messages[:turn_start + 1]}):
+            return {'messages': []}
+
+        rag_queries, chunk_ids = [], []
+        for msg in turn_messages:
+            if isinstance(msg, AIMessage):
+                for tool_call in msg.tool_calls or []:
+                    if tool_call.get('name') in GYM_TOOL_NAMES:
+                        return {'messages': []}
+                    if tool_call.get('name') == RAG_TOOL_NAME:
+                        args = tool_call.get('args', {})
+                        rag_queries.append({
+                            'query': args.get('query', ''),
+                            'limit': args.get('limit', 3),
+                            'score_threshold': args.get('score_threshold', 0.3),
+                        })
+            elif isinstance(msg, ToolMessage) and msg.name == RAG_TOOL_NAME:
+                chunk_ids.extend(extract_rag_chunk_ids(str(msg.content)))
+
+        # Sin fuentes del RAG no hay forma de validar la respuesta más adelante
+        if not rag_queries or not chunk_ids:
+            return {'messages': []}
+
+        self._semantic_cache.store(messages[turn_start].content, final_message.content, chunk_ids, rag_queries)
+        return {'messages': []}
+
+    def fast_path_node(self, state: AgentState) -> dict:
+        """
+        Clasificador de intenciones previo al LLM. Si la confianza es suficiente responde
+        directamente (intenciones canned) o genera la llamada a herramienta sin preguntar al LLM.
+        En cualquier otro caso no añade mensajes y el router delega en call_llm.
+        """
+        last_message = state['messages'][-1] if state.get('messages') else None
+
+        if not FAST_PATH_ENABLED or not isinstance(last_message, HumanMessage):
+            return {'messages': []}
+
+        # Nunca interceptamos un flujo de reserva en curso
+        if self._in_booking_flow(state):
+            logger.debug("  [Fast Path] Reserva del gimnasio en curso. Se delega en el LLM.", extra={"step": "fast_path"})
+            return {'messages': []}
+
+        match = classify_intent(str(last_message.content))
+        if match.confidence < FAST_PATH_MIN_CONFIDENCE:
+            logger.debug("  [Fast Path] Intención '%s' con confianza %.2f. Se delega en el LLM.", match.intent, match.confidence, extra={"step": "fast_path"})
+            return {'messages': []}
+
+        if match.response:
+            logger.info("  [Fast Path] Respuesta directa para intención '%s'.", match.intent, extra={"step": "fast_path", "intent": match.intent})
+            return {'messages': [AIMessage(content=match.response)]}
+
+        if match.tool_name in self._tools_map:
+            logger.info(
+                "  [Fast Path] Intención '%s': invocando '%s' sin LLM con args: %s", match.intent, match.tool_name, match.tool_args,
+                extra={"step": "fast_path", "intent": match.intent, "tool": match.tool_name},
+            )
+            tool_call = {"name": match.tool_name, "args": match.tool_args or {}, "id": f"fp_tc_{uuid.uuid4().hex}"}
+            return {'messages': [AIMessage(content="", tool_calls=[tool_call])]}
+
+        return {'messages': []}
+
+    def fast_path_router(self, state: AgentState) -> str:
+        """Decide el siguiente nodo tras el fast-path en función del último mensaje."""
+        last_message = state['messages'][-1]
+        if isinstance(last_message, AIMessage):
+            return 'invoke_tool' if last_message.tool_calls else '__end__'
+        return 'call_llm'
+
     def should_invoke_tool_router(self, state: AgentState) -> str:
         """
         Router mejorado que inspecciona la última respuesta de la IA.
         Busca llamadas a herramientas tanto en .tool_calls como en .content (workaround).
         """
-        logger.debug("  [Router: Decidiendo siguiente paso...]")
+        logger.debug("  [Router: Decidiendo siguiente paso...]", extra={"step": "router"})
         last_message = state['messages'][-1]
         
         if not isinstance(last_message, AIMessage):
             return '__end__'
 
-        if isinstance(last_message.content, str):
-            json_match = re.search(r'\{.*\}', last_message.content, re.DOTALL)
-            if json_match:
-                json_str = json_match.group(0)
-                try:
-                    content_json = json.loads(json_str)
-                    tool_name = content_json.get("name") or content_json.get("tool")
-                    tool_args = content_json.get("arguments") or content_json.get("tool_input")
-
-                    if tool_name in self._tools_map and isinstance(tool_args, dict):
-                        logger.warning(f"    [Router WORKAROUND] Detectada llamada a herramienta '{tool_name}' en .content.")
-                        last_message.tool_calls = [{"name": tool_name, "args": tool_args, "id": f"llm_tc_{uuid.uuid4().hex}"}]
-                        last_message.content = "" 
-                        return 'invoke_tool'
-                except (json.JSONDecodeError, AttributeError):
-                     pass
+        if isinstance(last_message.content, str) and not last_message.tool_calls:
+            content_tool_calls = extract_tool_calls(last_message.content, self._tools_map.keys())
+            if content_tool_calls:
+                logger.warning(f"    [Router WORKAROUND] Detectadas {len(content_tool_calls)} llamadas a herramienta en .content: {[tc['name'] for tc in content_tool_calls]}")
+                last_message.tool_calls = content_tool_calls
+                last_message.content = ""
+                return 'invoke_tool'
 
         if hasattr(last_message, 'tool_calls') and last_message.tool_calls:
-            logger.info("    [Router] LLM solicitó herramienta correctamente vía .tool_calls.")
+            logger.info("    [Router] LLM solicitó herramienta correctamente vía .tool_calls.", extra={"step": "router"})
             return 'invoke_tool'
 
-        logger.info("    [Router] El LLM no solicitó herramienta. La ejecución termina.")
+        logger.info("    [Router] El LLM no solicitó herramienta. La ejecución termina.", extra={"step": "router"})
         return '__end__'
 
     def call_llm_node(self, state: AgentState) -> dict:
@@ -107,15 +288,115 @@ class RagAgent:
         current_messages_for_llm = [SystemMessage(content=system_prompt_with_scratchpad)]
         current_messages_for_llm.extend([m for m in messages if not isinstance(m, SystemMessage)])
         
-        logger.info(f"  [LLM Node] Llamando al LLM con {len(current_messages_for_llm)} mensajes.")
+        logger.info("  [LLM Node] Llamando al LLM con %d mensajes.", len(current_messages_for_llm), extra={"step": "call_llm"})
         
-        try:
-            ai_message_response = self._llm.invoke(current_messages_for_llm)
-        except Exception as e:
-            logger.error(f"❌ ERROR durante la invocación del LLM: {e}\n{traceback.format_exc()}")
-            ai_message_response = AIMessage(content=f"Error al procesar con LLM: {e}", tool_calls=[])
+        start_time = time.perf_counter()
+        outcome = "ok"
+        usage = {"llm_calls": 1}
+        with start_span("llm.call", **{"llm.model": OLLAMA_MODEL_NAME, "llm.streaming": LLM_STREAMING_ENABLED, "llm.input_messages": len(current_messages_for_llm)}) as span:
+            try:
+                stream_stats = {}
+                if LLM_STREAMING_ENABLED:
+                    ai_message_response = self._stream_llm(current_messages_for_llm, span, stream_stats)
+                else:
+                    ai_message_response = self._llm.invoke(current_messages_for_llm)
+                usage = self._llm_usage(ai_message_response, stream_stats)
+                for key, value in usage.items():
+                    if key != "llm_calls":
+                        span.set_attribute(f"llm.{key}", value)
+            except Exception as e:
+                outcome = "error"
+                span.set_attribute("llm.error", str(e)[:500])
+                logger.error(f"❌ ERROR durante la invocación del LLM: {e}\n{traceback.format_exc()}")
+                ai_message_response = AIMessage(content=f"Error al procesar con LLM: {e}", tool_calls=[])
+        get_histogram(
+            "llm_call_seconds", mode="stream" if LLM_STREAMING_ENABLED else "invoke", outcome=outcome
+        ).observe(time.perf_counter() - start_time)
+        self._observe_llm_usage(usage)
         
-        return {'messages': [ai_message_response]}
+        return {'messages': [ai_message_response], 'llm_usage': usage}
+
+    @staticmethod
+    def _llm_usage(ai_message: AIMessage, stream_stats: dict) -> dict:
+        """
+        Consumo de una llamada con los contadores que devuelve Ollama: tokens del prompt
+        (longitud del contexto) y generados, y duración del prefill y de la generación.
+        Si el stream se cortó antes del final (llamada a herramienta detectada) Ollama no los
+        envía: se estiman con el tiempo al primer token y el número de fragmentos recibidos.
+        """
+        metadata = getattr(ai_message, 'response_metadata', None) or {}
+        if metadata.get('eval_count') is not None:
+            prompt_tokens = metadata.get('prompt_eval_count') or 0
+            return {
+                "llm_calls": 1,
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": metadata['eval_count'],
+                "prefill_ms": round((metadata.get('prompt_eval_duration') or 0) / 1e6, 3),  # Ollama da nanosegundos
+                "generation_ms": round((metadata.get('eval_duration') or 0) / 1e6, 3),
+                "max_prompt_tokens": prompt_tokens,
+            }
+        return {
+            "llm_calls": 1,
+            "estimated_calls": 1,
+            "completion_tokens": stream_stats.get("chunks", 0),
+            "prefill_ms": stream_stats.get("time_to_first_token_ms", 0),
+            "generation_ms": stream_stats.get("generation_ms", 0),
+        }
+
+    @staticmethod
+    def _observe_llm_usage(usage: dict) -> None:
+        if usage.get("max_prompt_tokens"):
+            get_histogram("llm_prompt_tokens", LLM_TOKEN_BUCKETS).observe(usage["max_prompt_tokens"])
+        if usage.get("prefill_ms"):
+            get_histogram("llm_prefill_seconds").observe(usage["prefill_ms"] / 1000)
+        if usage.get("generation_ms") and usage.get("completion_tokens"):
+            tokens_per_second = usage["completion_tokens"] / (usage["generation_ms"] / 1000)
+            get_histogram("llm_generation_tokens_per_second", LLM_THROUGHPUT_BUCKETS).observe(tokens_per_second)
+
+    def _stream_llm(self, messages_for_llm: list, span=None, stream_stats: dict = None) -> AIMessage:
+        """
+        Llama al LLM en modo streaming y analiza el contenido a medida que llegan los tokens.
+        En cuanto se completa una llamada a herramienta escrita como JSON en .content se corta
+        la generación (se cierra el stream) y se despacha la herramienta sin esperar al resto.
+        """
+        parser = ToolCallStreamParser(self._tools_map.keys())
+        accumulated = None
+        stream_stats = stream_stats if stream_stats is not None else {}
+        stream_stats["chunks"] = 0
+        start_time = time.perf_counter()
+        first_token_time = None
+        stream = self._llm.stream(messages_for_llm)
+        try:
+            for chunk in stream:
+                if first_token_time is None:
+                    # Si el stream se corta antes del final Ollama no envía sus tiempos: el
+                    # primer token marca el fin del prefill
+                    first_token_time = time.perf_counter()
+                    stream_stats["time_to_first_token_ms"] = round((first_token_time - start_time) * 1000, 3)
+                    if span is not None:
+                        span.set_attribute("llm.time_to_first_token_ms", stream_stats["time_to_first_token_ms"])
+                        span.add_event("first_token")
+                stream_stats["chunks"] += 1
+                stream_stats["generation_ms"] = round((time.perf_counter() - first_token_time) * 1000, 3)
+                accumulated = chunk if accumulated is None else accumulated + chunk
+                if isinstance(chunk.content, str) and chunk.content and parser.feed(chunk.content):
+                    logger.info(
+                        "  [LLM Node] Llamada a herramienta completa detectada en streaming: '%s'. Se corta la generación.",
+                        parser.tool_calls[0]['name'], extra={"step": "call_llm"},
+                    )
+                    break
+        finally:
+            if hasattr(stream, 'close'):
+                stream.close()
+
+        if accumulated is None:
+            return AIMessage(content="")
+
+        ai_message = message_chunk_to_message(accumulated)
+        if parser.tool_calls and not ai_message.tool_calls:
+            ai_message.tool_calls = parser.tool_calls
+            ai_message.content = ""
+        return ai_message
 
     def invoke_tools_node(self, state: AgentState) -> dict:
         """Invoca las herramientas solicitadas. Devuelve solo los nuevos mensajes de herramienta."""
@@ -130,15 +411,21 @@ class RagAgent:
             tool_args = tool_call.get('args', {})
             tool_call_id = tool_call.get('id')
 
-            logger.info(f"    [Tools Node] Invocando herramienta: '{tool_name}' con args: {tool_args}")
+            logger.info("    [Tools Node] Invocando herramienta: '%s' con args: %s", tool_name, tool_args, extra={"step": "invoke_tool", "tool": tool_name})
             if tool_name not in self._tools_map:
                 result_content = f"Error: Herramienta desconocida: '{tool_name}'."
             else:
-                try:
-                    result_content = self._tools_map[tool_name].invoke(tool_args)
-                except Exception as e:
-                    logger.error(f"      [Tools Node] ERROR ejecutando herramienta {tool_name}: {e}\n{traceback.format_exc()}")
-                    result_content = f"Error al ejecutar la herramienta {tool_name}: {str(e)}"
+                start_time = time.perf_counter()
+                outcome = "ok"
+                with start_span(f"tool.{tool_name}", **{"tool.call_id": tool_call_id}) as span:
+                    try:
+                        result_content = self._tools_map[tool_name].invoke(tool_args)
+                    except Exception as e:
+                        outcome = "error"
+                        span.set_attribute("tool.error", str(e)[:500])
+                        logger.error(f"      [Tools Node] ERROR ejecutando herramienta {tool_name}: {e}\n{traceback.format_exc()}")
+                        result_content = f"Error al ejecutar la herramienta {tool_name}: {str(e)}"
+                get_histogram("tool_duration_seconds", tool=tool_name, outcome=outcome).observe(time.perf_counter() - start_time)
             
             tool_messages.append(ToolMessage(tool_call_id=tool_call_id, name=tool_name, content=str(result_content)))
 
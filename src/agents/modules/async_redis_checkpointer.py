@@ -0,0 +1,179 @@
+import asyncio
+import logging
+import traceback
+from typing import Dict, Any, Optional, List, Tuple, AsyncIterator
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import Checkpoint, CheckpointMetadata, CheckpointTuple
+
+from .redis_checkpointer import RedisCheckpointer, INVALIDATION_CHANNEL
+from .redis_client import create_async_redis_client, create_pipeline
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncRedisCheckpointer(RedisCheckpointer):
+    """
+    Variante asíncrona de RedisCheckpointer sobre redis.asyncio.
+
+    Implementa aget_tuple/alist/aput/aput_writes con un único pool de conexiones asíncrono
+    compartido por todas las corrutinas, reutilizando las mismas keys, scripts Lua y
+    formato de serialización que la versión síncrona: ambas pueden leer y escribir las
+    mismas sesiones a la vez durante la migración. Los métodos síncronos heredados siguen
+    disponibles para los grafos que se ejecutan con invoke/stream.
+
+    El pool asíncrono se asocia al event loop en el que se usa por primera vez. Con
+    REDIS_CLUSTER_ENABLED se usa redis.asyncio.cluster.RedisCluster.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.async_client = create_async_redis_client(decode_responses=False)
+        logger.info("✅ AsyncRedisCheckpointer inicializado")
+
+    async def aclose(self) -> None:
+        """Cierra las conexiones del cliente asíncrono y el hilo de invalidaciones."""
+        self.close()
+        await self.async_client.aclose()
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        try:
+            thread_id, checkpoint_ns = self._get_thread_and_ns(config)
+            requested_id = config["configurable"].get("checkpoint_id")
+
+            logger.debug("🔧 [AGET] thread_id: %s, checkpoint_ns: %s, checkpoint_id: %s", thread_id, checkpoint_ns, requested_id, extra={"step": "checkpoint.get", "thread_id": thread_id})
+
+            cached = self._hot_cache_get(thread_id, checkpoint_ns, requested_id)
+            if cached is not None:
+                return cached
+            generation = self.hot_cache.generation if self.hot_cache is not None else None
+
+            with self._timed("get", thread_id):
+                pipe = create_pipeline(self.async_client, transaction=False)
+                self._queue_session_read(pipe, thread_id, checkpoint_ns, requested_id)
+                session = self._parse_session_read(await pipe.execute())
+                checkpoint_tuple = self._tuple_from_session(thread_id, checkpoint_ns, requested_id, session)
+                if checkpoint_tuple is None and self.session_archive is not None and await self._arehydrate_session(thread_id, checkpoint_ns):
+                    pipe = create_pipeline(self.async_client, transaction=False)
+                    self._queue_session_read(pipe, thread_id, checkpoint_ns, requested_id)
+                    session = self._parse_session_read(await pipe.execute())
+                    checkpoint_tuple = self._tuple_from_session(thread_id, checkpoint_ns, requested_id, session)
+            self._hot_cache_store_read(thread_id, checkpoint_ns, requested_id, checkpoint_tuple, generation)
+            return checkpoint_tuple
+
+        except Exception as e:
+            logger.error(f"Error obteniendo checkpoint (async): {e}\n{traceback.format_exc()}")
+            return None
+
+    async def alist(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[Dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> AsyncIterator[CheckpointTuple]:
+        if not config:
+            logger.warning("AsyncRedisCheckpointer.alist requiere un thread_id; no se listan checkpoints de todos los threads")
+            return
+
+        thread_id, checkpoint_ns = self._get_thread_and_ns(config)
+        requested_id, before_id = self._list_bounds(config, before)
+
+        try:
+            if requested_id:
+                checkpoint_ids = [requested_id] if not before_id or requested_id < before_id else []
+            else:
+                history_key = self._make_history_key(thread_id, checkpoint_ns)
+                raw_ids = await self.async_client.zrevrangebylex(history_key, self._history_max(before_id), "-")
+                if not raw_ids and self.session_archive is not None and await self._arehydrate_session(thread_id, checkpoint_ns):
+                    raw_ids = await self.async_client.zrevrangebylex(history_key, self._history_max(before_id), "-")
+                checkpoint_ids = [raw.decode() for raw in raw_ids]
+
+            if not checkpoint_ids:
+                # Sesiones guardadas antes de existir el historial: solo el último checkpoint
+                if not before_id:
+                    latest = await self.aget_tuple(config)
+                    if latest and self._metadata_matches(latest.metadata, filter):
+                        yield latest
+                return
+
+            with self._timed("list", thread_id):
+                pipe = create_pipeline(self.async_client, transaction=False)
+                self._queue_list_reads(pipe, thread_id, checkpoint_ns, checkpoint_ids)
+                results = await pipe.execute()
+
+        except Exception as e:
+            logger.error(f"Error listando checkpoints de {thread_id} (async): {e}\n{traceback.format_exc()}")
+            return
+
+        for checkpoint_tuple in self._iter_listed_tuples(thread_id, checkpoint_ns, checkpoint_ids, results, filter, limit):
+            yield checkpoint_tuple
+
+    async def _arehydrate_session(self, thread_id: str, checkpoint_ns: str) -> bool:
+        # El almacén frío es síncrono (disco / SQLAlchemy): se lee fuera del event loop
+        snapshot = await asyncio.to_thread(self._load_archived, thread_id, checkpoint_ns)
+        if snapshot is None:
+            return False
+        pipe = create_pipeline(self.async_client)
+        self._queue_restore(pipe, thread_id, checkpoint_ns, snapshot)
+        await pipe.execute()
+        await asyncio.to_thread(self._finish_rehydrate, thread_id, checkpoint_ns)
+        return True
+
+    async def _arebuild_delta_branch(self, put_state: Dict[str, Any]) -> None:
+        thread_id, checkpoint_ns = put_state["thread_id"], put_state["checkpoint_ns"]
+        pipe = create_pipeline(self.async_client)
+        self._queue_branch_lookup(pipe, thread_id, checkpoint_ns, put_state["parent_checkpoint_id"])
+        lookup = await pipe.execute()
+
+        pipe = create_pipeline(self.async_client)
+        self._queue_rewrite_delta_messages(pipe, put_state)
+        self._queue_discard_branch(pipe, thread_id, checkpoint_ns, put_state["checkpoint_id"], lookup)
+        await pipe.execute()
+        logger.info("♻️ Lista de mensajes reescrita para %s: %d mensajes", thread_id, len(put_state['messages']), extra={"step": "checkpoint.put", "thread_id": thread_id})
+
+    async def aput(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: Dict[str, Any],
+    ) -> RunnableConfig:
+        try:
+            with self._timed("put", config["configurable"].get("thread_id")):
+                put_state = self._prepare_put(config, checkpoint, metadata)
+
+                pipe = create_pipeline(self.async_client)
+                invalidation = self._queue_put(pipe, put_state)
+                results = await pipe.execute()
+                if invalidation:
+                    await self.async_client.publish(INVALIDATION_CHANNEL, invalidation)
+
+                if self._needs_delta_rebuild(results):
+                    await self._arebuild_delta_branch(put_state)
+                return self._finish_put(put_state)
+
+        except Exception as e:
+            logger.error(f"❌ Error guardando checkpoint (async): {e}\n{traceback.format_exc()}")
+            raise
+
+    async def aput_writes(
+        self,
+        config: RunnableConfig,
+        writes: List[Tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        try:
+            with self._timed("put_writes", config["configurable"].get("thread_id")):
+                pipe = create_pipeline(self.async_client)
+                invalidation = self._queue_put_writes(pipe, config, writes, task_id)
+                await pipe.execute()
+            self._hot_cache_invalidate(config)
+            if invalidation:
+                await self.async_client.publish(INVALIDATION_CHANNEL, invalidation)
+
+        except Exception as e:
+            logger.error(f"❌ Error guardando escrituras pendientes (async): {e}\n{traceback.format_exc()}")
+            raise
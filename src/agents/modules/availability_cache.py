@@ -0,0 +1,112 @@
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from .config import AVAILABILITY_CACHE_TTL_SECONDS, AVAILABILITY_CACHE_MAX_ENTRIES
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class _InFlightCall:
+    """Petición en curso compartida por todas las llamadas concurrentes con la misma clave."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class AvailabilityCache:
+    """
+    Caché TTL en memoria para respuestas de /availability, con clave (servicio, start_time).
+
+    - Las entradas caducan a los `ttl_seconds` y se limita el número total (LRU).
+    - Single-flight: si varias peticiones idénticas llegan a la vez, solo una llama a la API
+      y el resto espera su resultado.
+    - Una reserva (exitosa o en conflicto) invalida todas las entradas del mismo día. Cada
+      invalidación sube la generación del día: una petición en curso que empezó antes no
+      guarda su respuesta (ya no refleja la reserva).
+    """
+
+    def __init__(self, ttl_seconds: float = AVAILABILITY_CACHE_TTL_SECONDS, max_entries: int = AVAILABILITY_CACHE_MAX_ENTRIES):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[float, Any]]" = OrderedDict()
+        self._in_flight: Dict[Tuple[str, str], _InFlightCall] = {}
+        # (servicio, día) -> nº de invalidaciones; solo mientras haya peticiones en curso de ese día
+        self._generations: Dict[Tuple[str, str], int] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_fetch(
+        self,
+        service: str,
+        start_time: str,
+        fetch: Callable[[], Any],
+        cacheable: Callable[[Any], bool] = lambda result: True,
+    ) -> Any:
+        """Devuelve la respuesta cacheada o la obtiene con `fetch` (una sola vez por clave)."""
+        key = (service, start_time)
+        day_key = (service, start_time.split("T")[0])
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached and cached[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return cached[1]
+
+            call = self._in_flight.get(key)
+            is_leader = call is None
+            if is_leader:
+                call = self._in_flight[key] = _InFlightCall()
+                generation = self._generations.get(day_key, 0)
+                self.misses += 1
+
+        if not is_leader:
+            logger.debug(f"AvailabilityCache: esperando petición en curso para {key}")
+            call.done.wait()
+            if call.error:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fetch()
+            if self.ttl_seconds > 0 and cacheable(call.result):
+                with self._lock:
+                    if self._generations.get(day_key, 0) != generation:
+                        logger.debug(f"AvailabilityCache: {key} invalidada durante la petición, no se guarda")
+                    else:
+                        self._entries[key] = (time.monotonic() + self.ttl_seconds, call.result)
+                        self._entries.move_to_end(key)
+                        while len(self._entries) > self.max_entries:
+                            self._entries.popitem(last=False)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+                if not any((k[0], k[1].split("T")[0]) == day_key for k in self._in_flight):
+                    self._generations.pop(day_key, None)
+            call.done.set()
+
+    def invalidate(self, service: str, start_time: str) -> int:
+        """Elimina las entradas del servicio para el mismo día que `start_time`."""
+        day = start_time.split("T")[0]
+        with self._lock:
+            keys = [k for k in self._entries if k[0] == service and k[1].split("T")[0] == day]
+            for key in keys:
+                del self._entries[key]
+            if any(k[0] == service and k[1].split("T")[0] == day for k in self._in_flight):
+                self._generations[(service, day)] = self._generations.get((service, day), 0) + 1
+        if keys:
+            logger.info(f"🧹 AvailabilityCache: {len(keys)} entradas invalidadas para {service} el {day}")
+        return len(keys)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,116 @@
+import time
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from langgraph.checkpoint.base import CheckpointTuple, copy_checkpoint
+
+from .config import CHECKPOINT_HOT_CACHE_MAX_ENTRIES, CHECKPOINT_HOT_CACHE_TTL_SECONDS
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class CheckpointHotCache:
+    """
+    Caché LRU en proceso del último checkpoint de cada thread (primer nivel delante de Redis).
+
+    Cada entrada guarda el CheckpointTuple ya deserializado junto con su checkpoint_id, que
+    hace de sello de versión: una invalidación que llega con el mismo id que la entrada
+    (nuestra propia escritura) no la elimina. Las entradas caducan a los `ttl_seconds` como
+    red de seguridad por si se pierde alguna invalidación.
+
+    Se devuelven copias del checkpoint: los dicts de canales y versiones y las listas (p. ej.
+    la de mensajes) son nuevos en cada lectura; los objetos de mensaje se comparten.
+    """
+
+    def __init__(self, max_entries: int = CHECKPOINT_HOT_CACHE_MAX_ENTRIES, ttl_seconds: float = CHECKPOINT_HOT_CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[float, CheckpointTuple]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        # Se incrementa en cada invalidación: permite descartar lecturas de Redis que
+        # empezaron antes de una invalidación y terminarían cacheando una versión vieja
+        self.generation = 0
+
+    @staticmethod
+    def _copy(checkpoint_tuple: CheckpointTuple) -> CheckpointTuple:
+        checkpoint = copy_checkpoint(checkpoint_tuple.checkpoint)
+        checkpoint["channel_values"] = {
+            channel: list(value) if isinstance(value, list) else value
+            for channel, value in checkpoint["channel_values"].items()
+        }
+        return checkpoint_tuple._replace(
+            checkpoint=checkpoint,
+            pending_writes=list(checkpoint_tuple.pending_writes or []),
+        )
+
+    def get(self, thread_id: str, checkpoint_ns: str, checkpoint_id: Optional[str] = None) -> Optional[CheckpointTuple]:
+        """Devuelve el último checkpoint cacheado del thread (o None si no está o no es `checkpoint_id`)."""
+        key = (thread_id, checkpoint_ns)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            checkpoint_tuple = entry[1]
+            if checkpoint_id and checkpoint_tuple.checkpoint.get("id") != checkpoint_id:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return self._copy(checkpoint_tuple)
+
+    def put(
+        self,
+        thread_id: str,
+        checkpoint_ns: str,
+        checkpoint_tuple: CheckpointTuple,
+        generation: Optional[int] = None,
+    ) -> None:
+        """
+        Guarda el último checkpoint de un thread. Con `generation` (leída antes de ir a
+        Redis) no se guarda nada si desde entonces ha habido alguna invalidación.
+        """
+        key = (thread_id, checkpoint_ns)
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            current = self._entries.get(key)
+            # Nunca sustituir una versión más nueva por una más antigua (ids uuid6 ordenables)
+            if current and current[1].checkpoint.get("id", "") > checkpoint_tuple.checkpoint.get("id", ""):
+                return
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, self._copy(checkpoint_tuple))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, thread_id: str, checkpoint_ns: str, checkpoint_id: Optional[str] = None) -> bool:
+        """
+        Elimina la entrada del thread salvo que ya esté en la versión `checkpoint_id`.
+        Devuelve True si se eliminó algo.
+        """
+        key = (thread_id, checkpoint_ns)
+        with self._lock:
+            self.generation += 1
+            entry = self._entries.get(key)
+            if entry is None:
+                return False
+            if checkpoint_id and entry[1].checkpoint.get("id") == checkpoint_id:
+                return False
+            del self._entries[key]
+        logger.debug(f"CheckpointHotCache: entrada invalidada para {thread_id}")
+        return True
+
+    def clear(self) -> None:
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,208 @@
+import json
+import zlib
+import base64
+import threading
+from typing import Any, Callable, Dict, Tuple
+
+from langchain_core.messages import BaseMessage, HumanMessage, AIMessage, SystemMessage, ToolMessage
+
+from .config import CHECKPOINT_SERIALIZER, CHECKPOINT_COMPRESSION, CHECKPOINT_COMPRESSION_THRESHOLD
+
+import logging
+logger = logging.getLogger(__name__)
+
+# --- Formato binario versionado de los checkpoints ---
+# [MAGIC (3 bytes)][versión de formato (1)][códec (1)][compresión (1)][payload]
+# Los datos sin MAGIC son checkpoints antiguos en JSON plano y se siguen leyendo.
+MAGIC = b"\xc7CP"
+FORMAT_VERSION = 1
+HEADER_SIZE = len(MAGIC) + 3
+
+CODEC_IDS = {"json": 0, "msgpack": 1}
+COMPRESSION_IDS = {"none": 0, "zlib": 1, "zstd": 2, "lz4": 3}
+
+
+# --- Mensajes de LangChain <-> dict ---
+
+def message_to_dict(msg: Any) -> Any:
+    """Convierte un mensaje de LangChain en un dict serializable."""
+    if hasattr(msg, 'dict'):
+        # LangChain message object
+        return {
+            "type": msg.__class__.__name__,
+            "content": msg.content,
+            "additional_kwargs": getattr(msg, 'additional_kwargs', {}),
+            "tool_calls": getattr(msg, 'tool_calls', []),
+            "tool_call_id": getattr(msg, 'tool_call_id', None),
+            "name": getattr(msg, 'name', None),
+        }
+    # Fallback para otros tipos
+    return str(msg)
+
+
+def message_from_dict(msg_data: Any) -> BaseMessage:
+    """Reconstruye un mensaje de LangChain desde su dict serializado."""
+    if not (isinstance(msg_data, dict) and "type" in msg_data):
+        # Fallback para mensajes no estructurados
+        return HumanMessage(content=str(msg_data))
+
+    msg_type = msg_data["type"]
+    content = msg_data.get("content", "")
+
+    if msg_type == "HumanMessage":
+        return HumanMessage(content=content)
+    if msg_type == "AIMessage":
+        ai_msg = AIMessage(
+            content=content,
+            additional_kwargs=msg_data.get("additional_kwargs", {}),
+        )
+        if msg_data.get("tool_calls"):
+            ai_msg.tool_calls = msg_data["tool_calls"]
+        return ai_msg
+    if msg_type == "SystemMessage":
+        return SystemMessage(content=content)
+    if msg_type == "ToolMessage":
+        tool_msg = ToolMessage(
+            content=content,
+            tool_call_id=msg_data.get("tool_call_id", ""),
+        )
+        if msg_data.get("name"):
+            tool_msg.name = msg_data["name"]
+        return tool_msg
+
+    logger.warning(f"Tipo de mensaje desconocido: {msg_type}")
+    return HumanMessage(content=str(msg_data))
+
+
+# --- Códecs ---
+
+def _json_default(obj: Any) -> Any:
+    if isinstance(obj, (bytes, bytearray)):
+        return {"__bytes__": base64.b64encode(obj).decode("ascii")}
+    return str(obj)
+
+
+def _json_object_hook(obj: Dict[str, Any]) -> Any:
+    if len(obj) == 1 and "__bytes__" in obj:
+        return base64.b64decode(obj["__bytes__"])
+    return obj
+
+
+def _json_dumps(obj: Any) -> bytes:
+    return json.dumps(obj, ensure_ascii=False, default=_json_default).encode("utf-8")
+
+
+def _json_loads(data: bytes) -> Any:
+    return json.loads(data, object_hook=_json_object_hook)
+
+
+def _load_codec(name: str) -> Tuple[Callable[[Any], bytes], Callable[[bytes], Any]]:
+    if name == "json":
+        return _json_dumps, _json_loads
+    if name == "msgpack":
+        import msgpack
+        return (
+            lambda obj: msgpack.packb(obj, use_bin_type=True, default=str),
+            lambda data: msgpack.unpackb(data, raw=False, strict_map_key=False),
+        )
+    raise ValueError(f"Códec de checkpoints no soportado: {name}")
+
+
+def _load_compression(name: str) -> Tuple[Callable[[bytes], bytes], Callable[[bytes], bytes]]:
+    if name == "none":
+        return (lambda data: data), (lambda data: data)
+    if name == "zlib":
+        return (lambda data: zlib.compress(data, 6)), zlib.decompress
+    if name == "zstd":
+        import zstandard
+        # ZstdCompressor/ZstdDecompressor no son thread-safe: un par por hilo (peticiones, archivador, invalidaciones)
+        local = threading.local()
+
+        def compress(data: bytes) -> bytes:
+            compressor = getattr(local, "compressor", None)
+            if compressor is None:
+                compressor = local.compressor = zstandard.ZstdCompressor(level=3)
+            return compressor.compress(data)
+
+        def decompress(data: bytes) -> bytes:
+            decompressor = getattr(local, "decompressor", None)
+            if decompressor is None:
+                decompressor = local.decompressor = zstandard.ZstdDecompressor()
+            return decompressor.decompress(data)
+
+        return compress, decompress
+    if name == "lz4":
+        import lz4.frame
+        return lz4.frame.compress, lz4.frame.decompress
+    raise ValueError(f"Compresión de checkpoints no soportada: {name}")
+
+
+class CheckpointSerializer:
+    """
+    Serializador de checkpoints con códec (json/msgpack) y compresión (zlib/zstd/lz4)
+    configurables. La compresión solo se aplica a payloads de más de `compression_threshold`
+    bytes. Cada payload lleva una cabecera versionada, de modo que `loads` decodifica
+    cualquier combinación (y el JSON antiguo) independientemente de la configuración actual.
+    """
+
+    def __init__(
+        self,
+        codec: str = CHECKPOINT_SERIALIZER,
+        compression: str = CHECKPOINT_COMPRESSION,
+        compression_threshold: int = CHECKPOINT_COMPRESSION_THRESHOLD,
+    ):
+        try:
+            self._encode, _ = _load_codec(codec)
+        except ImportError:
+            logger.warning(f"⚠️ Códec '{codec}' no disponible, usando JSON")
+            codec = "json"
+            self._encode, _ = _load_codec(codec)
+        try:
+            self._compress, _ = _load_compression(compression)
+        except ImportError:
+            logger.warning(f"⚠️ Compresión '{compression}' no disponible, usando zlib")
+            compression = "zlib"
+            self._compress, _ = _load_compression(compression)
+
+        self.codec = codec
+        self.compression = compression
+        self.compression_threshold = compression_threshold
+        self._codec_id = CODEC_IDS[codec]
+        self._compression_id = COMPRESSION_IDS[compression]
+        self._decoders: Dict[int, Callable[[bytes], Any]] = {}
+        self._decompressors: Dict[int, Callable[[bytes], bytes]] = {}
+
+    def dumps(self, obj: Any) -> bytes:
+        payload = self._encode(obj)
+        compression_id = 0
+        if self._compression_id and len(payload) > self.compression_threshold:
+            payload = self._compress(payload)
+            compression_id = self._compression_id
+        return MAGIC + bytes((FORMAT_VERSION, self._codec_id, compression_id)) + payload
+
+    def loads(self, data: Any) -> Any:
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        if not data.startswith(MAGIC):
+            # Formato antiguo: JSON plano
+            return json.loads(data)
+
+        version, codec_id, compression_id = data[len(MAGIC):HEADER_SIZE]
+        if version != FORMAT_VERSION:
+            raise ValueError(f"Versión de formato de checkpoint desconocida: {version}")
+        payload = data[HEADER_SIZE:]
+        if compression_id:
+            payload = self._get_decompressor(compression_id)(payload)
+        return self._get_decoder(codec_id)(payload)
+
+    def _get_decoder(self, codec_id: int) -> Callable[[bytes], Any]:
+        if codec_id not in self._decoders:
+            name = next(n for n, i in CODEC_IDS.items() if i == codec_id)
+            self._decoders[codec_id] = _load_codec(name)[1]
+        return self._decoders[codec_id]
+
+    def _get_decompressor(self, compression_id: int) -> Callable[[bytes], bytes]:
+        if compression_id not in self._decompressors:
+            name = next(n for n, i in COMPRESSION_IDS.items() if i == compression_id)
+            self._decompressors[compression_id] = _load_compression(name)[1]
+        return self._decompressors[compression_id]
@@ -0,0 +1,130 @@
+import bisect
+import threading
+from typing import Dict, Any, Iterable, List, Tuple, Optional
+
+# --- Histogramas de latencia en memoria ---
+# Buckets fijos (en segundos) compartidos por todas las métricas de latencia del agente.
+DEFAULT_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class Histogram:
+    """Histograma de buckets fijos, thread-safe, con percentiles aproximados."""
+
+    def __init__(self, name: str, buckets: Tuple[float, ...] = DEFAULT_LATENCY_BUCKETS, labels: Optional[Dict[str, str]] = None):
+        self.name = name
+        self.labels = labels or {}
+        self.buckets = tuple(sorted(buckets))
+        self._counts = [0] * (len(self.buckets) + 1)  # El último bucket es +Inf
+        self._count = 0
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._count += 1
+            self._sum += value
+
+    def percentile(self, q: float) -> Optional[float]:
+        """Percentil aproximado (interpolación lineal dentro del bucket). q en [0, 1]."""
+        with self._lock:
+            counts = list(self._counts)
+            total = self._count
+        if total == 0:
+            return None
+
+        rank = q * total
+        cumulative = 0
+        for i, count in enumerate(counts):
+            if count and cumulative + count >= rank:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                upper = self.buckets[i] if i < len(self.buckets) else self.buckets[-1]
+                return lower + (upper - lower) * ((rank - cumulative) / count)
+            cumulative += count
+        return self.buckets[-1]
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            counts = list(self._counts)
+            total, total_sum = self._count, self._sum
+
+        cumulative, buckets = 0, {}
+        for bound, count in zip(list(self.buckets) + ["+Inf"], counts):
+            cumulative += count
+            buckets[str(bound)] = cumulative
+
+        return {
+            "name": self.name,
+            "labels": self.labels,
+            "count": total,
+            "sum": round(total_sum, 6),
+            "buckets": buckets,
+            "p50": self.percentile(0.50),
+            "p95": self.percentile(0.95),
+            "p99": self.percentile(0.99),
+        }
+
+
+_registry: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], Histogram] = {}
+_registry_lock = threading.Lock()
+
+
+def get_histogram(name: str, buckets: Tuple[float, ...] = DEFAULT_LATENCY_BUCKETS, **labels: str) -> Histogram:
+    """Devuelve (creándolo si hace falta) el histograma registrado para name + labels."""
+    key = (name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+    histogram = _registry.get(key)
+    if histogram is None:
+        with _registry_lock:
+            histogram = _registry.setdefault(key, Histogram(name, buckets, dict(key[1])))
+    return histogram
+
+
+def snapshot_histograms() -> List[Dict[str, Any]]:
+    """Instantánea de todos los histogramas registrados en el proceso."""
+    with _registry_lock:
+        histograms = list(_registry.values())
+    return [h.snapshot() for h in histograms]
+
+
+# --- Exposición en formato de texto de Prometheus / OpenMetrics ---
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape_label_value(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape_label_value(value)}"' for name, value in sorted(labels.items())) + "}"
+
+
+def render_prometheus(gauges: Iterable[Tuple[str, Dict[str, str], float]] = ()) -> str:
+    """
+    Serializa todos los histogramas registrados (y los `gauges` indicados como
+    (nombre, labels, valor)) en el formato de texto que consume Prometheus.
+    """
+    lines: List[str] = []
+    snapshots = sorted(snapshot_histograms(), key=lambda h: (h["name"], sorted(h["labels"].items())))
+    current_name = None
+    for snapshot in snapshots:
+        name, labels = snapshot["name"], snapshot["labels"]
+        if name != current_name:
+            lines.append(f"# TYPE {name} histogram")
+            current_name = name
+        for bound, cumulative in snapshot["buckets"].items():
+            lines.append(f"{name}_bucket{_format_labels({**labels, 'le': bound})} {cumulative}")
+        lines.append(f"{name}_sum{_format_labels(labels)} {snapshot['sum']}")
+        lines.append(f"{name}_count{_format_labels(labels)} {snapshot['count']}")
+
+    declared = set()
+    for name, labels, value in sorted(gauges, key=lambda gauge: gauge[0]):
+        if value is None:
+            continue
+        if name not in declared:
+            lines.append(f"# TYPE {name} gauge")
+            declared.add(name)
+        lines.append(f"{name}{_format_labels(labels)} {float(value)}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,203 @@
+import time
+import random
+import threading
+from typing import Dict, Any, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .config import (
+    HTTP_POOL_MAXSIZE,
+    HTTP_CONNECT_TIMEOUT,
+    HTTP_MAX_RETRIES,
+    HTTP_RETRY_BACKOFF_SECONDS,
+    HTTP_RETRY_BACKOFF_MAX_SECONDS,
+    CIRCUIT_BREAKER_FAILURE_THRESHOLD,
+    CIRCUIT_BREAKER_RESET_SECONDS,
+    CIRCUIT_BREAKER_PROBE_TIMEOUT_SECONDS,
+)
+from .histogram import get_histogram
+from .tracing import start_span, inject_trace_headers
+
+import logging
+logger = logging.getLogger(__name__)
+
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+RETRYABLE_STATUS_CODES = {502, 503, 504}
+# Errores de red transitorios que se reintentan (el resto de RequestException cuentan como fallo pero no se reintentan)
+RETRYABLE_EXCEPTIONS = (requests.exceptions.ConnectionError, requests.exceptions.Timeout, requests.exceptions.ChunkedEncodingError)
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """El circuito del upstream está abierto: se falla rápido sin hacer la petición."""
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker clásico (closed -> open -> half_open).
+    Tras `failure_threshold` fallos consecutivos se abre durante `reset_timeout` segundos;
+    después deja pasar una única petición de prueba que decide si se cierra o se reabre.
+    Si la prueba no registra resultado en `probe_timeout` segundos se deja pasar otra.
+    """
+
+    def __init__(
+        self,
+        failure_threshold: int = CIRCUIT_BREAKER_FAILURE_THRESHOLD,
+        reset_timeout: float = CIRCUIT_BREAKER_RESET_SECONDS,
+        probe_timeout: float = CIRCUIT_BREAKER_PROBE_TIMEOUT_SECONDS,
+    ):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.probe_timeout = probe_timeout
+        self.state = "closed"
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._probe_started_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow_request(self) -> bool:
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self.state = "half_open"
+                self._probe_in_flight = False
+            if self.state == "half_open" and self._probe_in_flight and time.monotonic() - self._probe_started_at >= self.probe_timeout:
+                logger.warning(f"⚡ La petición de prueba del circuit breaker no terminó en {self.probe_timeout:.0f}s, se permite otra")
+                self._probe_in_flight = False
+            if self.state == "half_open" and not self._probe_in_flight:
+                self._probe_in_flight = True
+                self._probe_started_at = time.monotonic()
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.state = "closed"
+            self._failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self.state == "half_open" or self._failures >= self.failure_threshold:
+                if self.state != "open":
+                    logger.warning(f"⚡ Circuit breaker abierto tras {self._failures} fallos consecutivos")
+                self.state = "open"
+                self._opened_at = time.monotonic()
+                self._probe_in_flight = False
+
+
+class UpstreamClient:
+    """
+    Cliente HTTP compartido para un upstream: sesión con pool keep-alive, reintentos con
+    backoff exponencial y jitter (solo para llamadas idempotentes), circuit breaker y
+    histograma de latencia `upstream_request_seconds{upstream, outcome}`.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        base_url: str,
+        read_timeout: float,
+        connect_timeout: float = HTTP_CONNECT_TIMEOUT,
+        pool_maxsize: int = HTTP_POOL_MAXSIZE,
+        max_retries: int = HTTP_MAX_RETRIES,
+    ):
+        self.name = name
+        self.base_url = base_url.rstrip("/")
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.breaker = CircuitBreaker()
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_maxsize, max_retries=0, pool_block=False)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def _observe(self, outcome: str, elapsed: float) -> None:
+        get_histogram("upstream_request_seconds", upstream=self.name, outcome=outcome).observe(elapsed)
+
+    def _backoff(self, attempt: int) -> float:
+        # Full jitter: evita que todas las réplicas reintenten a la vez
+        return random.uniform(0, min(HTTP_RETRY_BACKOFF_MAX_SECONDS, HTTP_RETRY_BACKOFF_SECONDS * (2 ** attempt)))
+
+    def request(self, method: str, path: str, *, idempotent: Optional[bool] = None, timeout: Any = None, **kwargs) -> requests.Response:
+        """
+        Ejecuta una petición contra el upstream. Los errores de red y los 502/503/504 cuentan
+        como fallo para el circuit breaker y se reintentan solo si la llamada es idempotente.
+        Lanza CircuitOpenError (subclase de requests.ConnectionError) si el circuito está abierto.
+        """
+        method = method.upper()
+        if idempotent is None:
+            idempotent = method in IDEMPOTENT_METHODS
+        attempts = 1 + (self.max_retries if idempotent else 0)
+        url = f"{self.base_url}/{path.lstrip('/')}"
+
+        with start_span(f"http {self.name}", **{"http.method": method, "url.path": path}) as span:
+            # Propaga la traza al upstream (cabecera W3C traceparent del span de esta llamada)
+            kwargs["headers"] = inject_trace_headers(kwargs.get("headers"))
+            response = self._request_with_retries(method, url, attempts, timeout, span, **kwargs)
+            span.set_attribute("http.status_code", response.status_code)
+            return response
+
+    def _request_with_retries(self, method: str, url: str, attempts: int, timeout: Any, span: Any, **kwargs) -> requests.Response:
+        for attempt in range(attempts):
+            span.set_attribute("http.attempts", attempt + 1)
+            if not self.breaker.allow_request():
+                self._observe("circuit_open", 0.0)
+                raise CircuitOpenError(f"Circuito abierto para el upstream '{self.name}'")
+
+            start_time = time.perf_counter()
+            try:
+                response = self.session.request(method, url, timeout=timeout or self.timeout, **kwargs)
+            except Exception as e:
+                # Cualquier excepción cuenta como fallo: si no, una prueba en half_open no liberaría el circuito
+                self._observe("error", time.perf_counter() - start_time)
+                self.breaker.record_failure()
+                if not isinstance(e, RETRYABLE_EXCEPTIONS) or attempt + 1 >= attempts:
+                    raise
+                logger.warning(f"↻ Reintentando {method} {url} ({attempt + 1}/{attempts - 1}) tras error: {e}")
+                time.sleep(self._backoff(attempt))
+                continue
+
+            elapsed = time.perf_counter() - start_time
+            if response.status_code in RETRYABLE_STATUS_CODES:
+                self._observe("error", elapsed)
+                self.breaker.record_failure()
+                if attempt + 1 < attempts:
+                    logger.warning(f"↻ Reintentando {method} {url} ({attempt + 1}/{attempts - 1}) tras HTTP {response.status_code}")
+                    time.sleep(self._backoff(attempt))
+                    continue
+                return response
+
+            self._observe("ok", elapsed)
+            self.breaker.record_success()
+            return response
+
+    def get(self, path: str, **kwargs) -> requests.Response:
+        return self.request("GET", path, **kwargs)
+
+    def post(self, path: str, **kwargs) -> requests.Response:
+        return self.request("POST", path, **kwargs)
+
+
+_clients: Dict[str, UpstreamClient] = {}
+_clients_lock = threading.Lock()
+
+
+def get_upstream_client(name: str, base_url: str, read_timeout: float) -> UpstreamClient:
+    """Devuelve el cliente compartido del upstream `name` (uno por proceso)."""
+    client = _clients.get(name)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(name)
+            if client is None:
+                client = _clients[name] = UpstreamClient(name, base_url, read_timeout)
+    return client
+
+
+def upstream_status() -> Dict[str, Dict[str, Any]]:
+    """Estado de los circuit breakers de todos los upstreams registrados."""
+    return {name: {"base_url": c.base_url, "circuit": c.breaker.state} for name, c in _clients.items()}
@@ -0,0 +1,147 @@
+import re
+import unicodedata
+from datetime import datetime, timedelta
+from typing import NamedTuple, Optional, Dict, Any
+
+import logging
+logger = logging.getLogger(__name__)
+
+# --- Clasificador determinista de intenciones (fast-path previo al LLM) ---
+# Solo resuelve mensajes triviales y sin ambigüedad. Ante cualquier duda devuelve
+# una confianza baja para que el grafo delegue en el LLM.
+
+class IntentMatch(NamedTuple):
+    intent: str
+    confidence: float
+    response: Optional[str] = None
+    tool_name: Optional[str] = None
+    tool_args: Optional[Dict[str, Any]] = None
+
+
+CANNED_RESPONSES = {
+    "saludo": "¡Hola! Soy Lola, la asistente virtual del Hotel Barceló. Puedo darte información sobre el hotel y ayudarte a reservar el gimnasio. ¿En qué puedo ayudarte?",
+    "agradecimiento": "¡De nada! Si necesitas algo más sobre el hotel o quieres reservar el gimnasio, aquí estoy.",
+    "despedida": "¡Hasta pronto! Que disfrutes de tu estancia en el Hotel Barceló.",
+}
+
+# Mensajes que son EXCLUSIVAMENTE un saludo/agradecimiento/despedida (texto ya normalizado)
+_CANNED_PATTERNS = {
+    "saludo": re.compile(r"^(hola+|hey|buenas|buenos dias|buenas tardes|buenas noches|hola buenos dias|hola buenas tardes|hola buenas noches|hola buenas|hola lola)$"),
+    "agradecimiento": re.compile(r"^((ok|vale|perfecto|genial|estupendo) )?(gracias|muchas gracias|mil gracias|muchisimas gracias|gracias lola)( (lola|por todo|por tu ayuda))?$"),
+    "despedida": re.compile(r"^(adios|hasta luego|hasta pronto|hasta manana|chao|nos vemos|bye)$"),
+}
+
+_GYM_PATTERN = re.compile(r"\b(gimnasio|gym|gimnasios)\b")
+_AVAILABILITY_PATTERN = re.compile(r"\b(disponibilidad|disponible|disponibles|hueco|huecos|libre|libres|plaza|plazas|sitio|horarios?)\b")
+_BOOKING_PATTERN = re.compile(r"\b(reserva|reservar|reservame|reservarme|apunta|apuntame|cancela|cancelar)\b")
+
+# Preguntas informativas sobre el hotel que siempre se resuelven con el RAG
+_POLICY_PATTERN = re.compile(
+    r"\b(check[ -]?in|check[ -]?out|entrada|salida|desayuno|almuerzo|cena|restaurante|piscina|spa|sauna|"
+    r"mascotas?|perros?|parking|aparcamiento|wifi|wi fi|toallas?|recepcion|politica|politicas|"
+    r"cancelacion|equipaje|consigna|lavanderia|traslado|aeropuerto|accesibilidad|silla de ruedas)\b"
+)
+_QUESTION_PATTERN = re.compile(r"^(a que|que|cual|cuales|cuando|donde|como|hay|tienen|tiene|teneis|se puede|puedo|aceptan|admiten|es posible)\b")
+
+_HOUR_PATTERN = re.compile(r"\b(?:(?:a|sobre|hacia|para) las (\d{1,2})(?::(\d{2}))?|(\d{1,2}):(\d{2}))\b")
+_ISO_DATE_PATTERN = re.compile(r"\b(\d{4}-\d{2}-\d{2})\b")
+
+MAX_FAST_PATH_WORDS = 20
+
+
+def normalize_text(text: str) -> str:
+    """Pasa a minúsculas, elimina acentos y signos de puntuación."""
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    text = re.sub(r"[^\w\s:\-]", " ", text)
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def _resolve_target_date(original: str, normalized: str, now: datetime) -> Optional[str]:
+    """Convierte expresiones de fecha/hora sencillas al formato YYYY-MM-DDTHH:MM:SS."""
+    iso_match = _ISO_DATE_PATTERN.search(original)
+    if iso_match:
+        try:
+            day = datetime.fromisoformat(iso_match.group(1)).date()
+        except ValueError:
+            return None
+    elif re.search(r"\bpasado manana\b", normalized):
+        day = (now + timedelta(days=2)).date()
+    elif re.search(r"(?<!la )\bmanana\b", normalized):
+        day = (now + timedelta(days=1)).date()
+    elif re.search(r"\bhoy\b", normalized):
+        day = now.date()
+    else:
+        return None
+
+    # Quitamos la fecha ISO para que sus dígitos no se confundan con una hora
+    text_for_hour = _ISO_DATE_PATTERN.sub(" ", normalized)
+    hour, minute = 8, 0
+    hour_match = _HOUR_PATTERN.search(text_for_hour)
+    if hour_match:
+        hour = int(hour_match.group(1) or hour_match.group(3))
+        minute = int(hour_match.group(2) or hour_match.group(4) or 0)
+        if hour < 12 and re.search(r"\bde la (tarde|noche)\b", normalized):
+            hour += 12
+        if hour > 23 or minute > 59:
+            return None
+    elif re.search(r"\bmediodia\b", normalized):
+        hour = 12
+    elif re.search(r"\bpor la tarde\b", normalized):
+        hour = 13
+
+    return f"{day.isoformat()}T{hour:02d}:{minute:02d}:00"
+
+
+def classify_intent(text: str, now: Optional[datetime] = None) -> IntentMatch:
+    """
+    Clasifica un mensaje del usuario mediante reglas/palabras clave.
+    Devuelve siempre un IntentMatch; si no se reconoce nada la intención es 'desconocida'
+    con confianza 0.0 y el grafo debe delegar en el LLM.
+    """
+    now = now or datetime.now()
+    normalized = normalize_text(text)
+
+    if not normalized:
+        return IntentMatch("desconocida", 0.0)
+
+    for intent, pattern in _CANNED_PATTERNS.items():
+        if pattern.match(normalized):
+            return IntentMatch(intent, 0.95, response=CANNED_RESPONSES[intent])
+
+    if len(normalized.split()) > MAX_FAST_PATH_WORDS:
+        return IntentMatch("desconocida", 0.0)
+
+    mentions_gym = bool(_GYM_PATTERN.search(normalized))
+    mentions_booking = bool(_BOOKING_PATTERN.search(normalized))
+
+    if mentions_gym:
+        # Las reservas requieren confirmación y nombre: siempre las gestiona el LLM
+        if mentions_booking or not _AVAILABILITY_PATTERN.search(normalized):
+            return IntentMatch("gimnasio", 0.3)
+        target_date = _resolve_target_date(text, normalized, now)
+        if not target_date:
+            return IntentMatch("gimnasio", 0.4)
+        return IntentMatch(
+            "disponibilidad_gimnasio",
+            0.9,
+            tool_name="check_gym_availability",
+            tool_args={"target_date": target_date},
+        )
+
+    if _POLICY_PATTERN.search(normalized) and not mentions_booking:
+        confidence = 0.85 if (_QUESTION_PATTERN.search(normalized) or "?" in text) else 0.6
+        return IntentMatch(
+            "informacion_hotel",
+            confidence,
+            tool_name="external_rag_search_tool",
+            tool_args={"query": text.strip()},
+        )
+
+    return IntentMatch("desconocida", 0.0)
+
+
+def is_booking_related(text: str) -> bool:
+    """Indica si el mensaje pertenece al flujo (con estado) del gimnasio/reservas."""
+    normalized = normalize_text(text)
+    return bool(_GYM_PATTERN.search(normalized) or _BOOKING_PATTERN.search(normalized))
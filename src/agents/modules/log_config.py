@@ -0,0 +1,115 @@
+import json
+import random
+import logging
+import threading
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+from .config import LOG_FORMAT, LOG_LEVEL, LOG_LEVELS, LOG_RATE_LIMIT_PER_MINUTE, LOG_STEP_SAMPLE_RATE
+from .tracing import current_span
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+# Atributos propios de LogRecord: el resto vienen de `extra=` y son los campos estructurados
+_RECORD_ATTRS = frozenset(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+# Plantillas distintas que se siguen como mucho (los mensajes con f-string son todos distintos)
+MAX_TRACKED_TEMPLATES = 10000
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Una línea JSON por registro: ts, level, logger, msg, trace_id/span_id del span activo
+    y los campos pasados con `extra=` (step, thread_id, tool...). El mensaje solo se formatea
+    aquí, es decir, cuando el registro supera niveles y filtros.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        span = current_span()
+        if span is not None and span.trace_id:
+            entry["trace_id"] = span.trace_id
+            entry["span_id"] = span.span_id
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class HotPathFilter(logging.Filter):
+    """
+    Acota el volumen de los registros INFO/DEBUG (WARNING o superior pasan siempre):
+
+    - Los eventos por paso del grafo (los que llevan `extra={"step": ...}`) se muestrean
+      con `step_sample_rate` (contador `sampled_out`).
+    - Cada plantilla (logger + mensaje sin formatear) admite `per_minute` registros por
+      ventana de un minuto; el resto se descartan (`suppressed`) y el primero de la ventana
+      siguiente lleva el campo `suppressed` con los descartados.
+    """
+
+    def __init__(self, per_minute: int = LOG_RATE_LIMIT_PER_MINUTE, step_sample_rate: float = LOG_STEP_SAMPLE_RATE):
+        super().__init__()
+        self.per_minute = per_minute
+        self.step_sample_rate = step_sample_rate
+        # (logger, plantilla) -> [inicio de la ventana, registros admitidos, descartados]
+        self._windows: Dict[tuple, list] = {}
+        self._lock = threading.Lock()
+        self.sampled_out = 0
+        self.suppressed = 0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        if self.step_sample_rate < 1.0 and hasattr(record, "step") and random.random() >= self.step_sample_rate:
+            self.sampled_out += 1
+            return False
+        if self.per_minute <= 0:
+            return True
+
+        key = (record.name, record.msg)
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None or record.created - window[0] >= 60:
+                if window is None and len(self._windows) >= MAX_TRACKED_TEMPLATES:
+                    self._windows.clear()
+                if window is not None and window[2]:
+                    record.suppressed = window[2]
+                self._windows[key] = [record.created, 1, 0]
+                return True
+            if window[1] >= self.per_minute:
+                window[2] += 1
+                self.suppressed += 1
+                return False
+            window[1] += 1
+        return True
+
+
+def configure_logging(
+    log_format: str = LOG_FORMAT,
+    level: str = LOG_LEVEL,
+    levels: Optional[Dict[str, str]] = None,
+    stream=None,
+) -> logging.Handler:
+    """
+    Sustituye los handlers del logger raíz por uno de texto o JSON (`log_format`) con el
+    HotPathFilter, fija el nivel global y los niveles por logger (LOG_LEVELS). Un logger
+    por debajo de su nivel no crea el registro ni formatea el mensaje, así que conviene
+    usar formato perezoso (logger.info("... %s", valor)) en las rutas calientes.
+    """
+    handler = logging.StreamHandler(stream)
+    handler.setFormatter(JsonFormatter() if log_format == "json" else logging.Formatter(TEXT_FORMAT))
+    handler.addFilter(HotPathFilter())
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(level)
+    for name, logger_level in (LOG_LEVELS if levels is None else levels).items():
+        logging.getLogger(name).setLevel(logger_level)
+    return handler
@@ -1,7 +1,13 @@
 from datetime import datetime
 from typing import Optional, List, Dict, Any
 from contextlib import contextmanager
+from collections import deque
+import atexit
 import logging
+import math
+import random
+import threading
+import time
 from sqlalchemy import (
     create_engine,
     MetaData,
@@ -13,22 +19,67 @@ from sqlalchemy import (
     DateTime,
     select,
     func,
+    inspect,
+    text,
 )
 from sqlalchemy.exc import SQLAlchemyError
 
-DB_CONFIG = {
-    'host': 'postgres',
-    'port': 5432,
-    'database': 'postgres',
-    'username': 'postgres',
-    'password': 'postgres'
-}
+from .config import (
+    METRICS_ENABLED,
+    METRICS_DB_URL,
+    METRICS_DB_CONNECT_TIMEOUT,
+    METRICS_SCHEMA_RETRY_MAX_SECONDS,
+    METRICS_ASYNC_WRITER,
+    METRICS_FLUSH_INTERVAL_MS,
+    METRICS_BATCH_SIZE,
+    METRICS_BUFFER_SIZE,
+    METRICS_DEFAULT_SAMPLE_RATE,
+    METRICS_SAMPLE_RATES,
+    METRICS_ALLOWED_LABELS,
+    METRICS_MAX_METRIC_NAMES,
+    METRICS_MAX_LABEL_SETS_PER_METRIC,
+    METRICS_ROLLUP_ENABLED,
+    METRICS_RETENTION_INTERVAL_SECONDS,
+)
+from .metrics_rollup import MetricsRollup, format_labels
 
-DATABASE_URL = f"postgresql://{DB_CONFIG['username']}:{DB_CONFIG['password']}@{DB_CONFIG['host']}:{DB_CONFIG['port']}/{DB_CONFIG['database']}"
+DATABASE_URL = METRICS_DB_URL
 logger = logging.getLogger(__name__)
 
+# Conjunto de labels al que se reducen las series nuevas de una métrica que supera su límite
+OVERFLOW_LABELS = "overflow=true"
+
 
 class MetricLogger:
+    """
+    Registra métricas en la tabla `agent_metrics` de PostgreSQL (singleton por proceso).
+
+    Con `async_writer` (METRICS_ASYNC_WRITER) log_metric no toca la base de datos: deja la
+    fila en un buffer circular en memoria (`buffer_size` filas) y un hilo en segundo plano
+    la escribe con un INSERT de varias filas cada `flush_interval_ms` o en cuanto hay
+    `batch_size` filas pendientes. Si la base de datos va lenta y el buffer se llena, se
+    descartan las filas más antiguas (contador `dropped`); los lotes que fallan al escribirse
+    se cuentan en `failed`. Lo pendiente se escribe al cerrar el proceso (atexit).
+
+    Con `rollups` (METRICS_ROLLUP_ENABLED) cada lote actualiza además, en la misma
+    transacción, los rollups por minuto y hora de MetricsRollup, que sirven los percentiles
+    de `query_percentiles`; el hilo escritor aplica la retención cada
+    METRICS_RETENTION_INTERVAL_SECONDS.
+
+    El constructor no toca la base de datos: las tablas se crean una sola vez, en el hilo
+    escritor (o en el primer INSERT sin escritor asíncrono), reintentando con backoff
+    exponencial hasta METRICS_SCHEMA_RETRY_MAX_SECONDS mientras PostgreSQL no responda.
+    Mientras tanto las filas esperan en el buffer. Usar get_metric_logger() en lugar del
+    constructor: si no se puede crear el engine devuelve un NullMetricLogger.
+
+    Volumen acotado: cada métrica es un nombre fijo más un conjunto pequeño de labels
+    (METRICS_ALLOWED_LABELS; el resto se ignoran, contador `labels_dropped`) y se muestrea
+    con su tasa (METRICS_SAMPLE_RATES / METRICS_DEFAULT_SAMPLE_RATE, contador `sampled_out`).
+    La tasa se guarda en `sample_rate` para que los rollups ponderen cada fila. En este
+    proceso se admiten como mucho METRICS_MAX_METRIC_NAMES nombres (los nuevos se rechazan,
+    `rejected`) y METRICS_MAX_LABEL_SETS_PER_METRIC conjuntos de labels por nombre (los
+    nuevos se agrupan en "overflow=true", `overflowed`).
+    """
     _instance: Optional["MetricLogger"] = None
     _engine = None
 
@@ -44,6 +95,11 @@ class MetricLogger:
         pool_pre_ping: bool = True,
         pool_size: int = 5,
         max_overflow: int = 10,
+        async_writer: bool = METRICS_ASYNC_WRITER,
+        flush_interval_ms: int = METRICS_FLUSH_INTERVAL_MS,
+        batch_size: int = METRICS_BATCH_SIZE,
+        buffer_size: int = METRICS_BUFFER_SIZE,
+        rollups: bool = METRICS_ROLLUP_ENABLED,
     ):
         if hasattr(self, "_initialized"):
             return
@@ -52,12 +108,15 @@ class MetricLogger:
         self.table_name = table_name
 
         if MetricLogger._engine is None:
+            # create_engine no abre conexiones; con PostgreSQL se acota además el connect
+            connect_args = {"connect_timeout": METRICS_DB_CONNECT_TIMEOUT} if self.db_url.startswith("postgresql") else {}
             MetricLogger._engine = create_engine(
                 self.db_url,
                 pool_pre_ping=pool_pre_ping,
                 pool_size=pool_size,
                 max_overflow=max_overflow,
                 echo=False,
+                connect_args=connect_args,
             )
         self.engine = MetricLogger._engine
 
@@ -70,38 +129,333 @@ class MetricLogger:
             Column("llm", String(100), nullable=False, index=True),
             Column("metric", String(100), nullable=False, index=True),
             Column("value", Float, nullable=False),
+            Column("labels", String(255), nullable=False, server_default=""),
+            Column("sample_rate", Float, nullable=False, server_default="1"),
         )
 
-        try:
-            self.metadata.create_all(self.engine)
-            logger.info(f"Tabla {self.table_name} verificada/creada")
-        except SQLAlchemyError as e:
-            logger.error(f"Error creando tabla {self.table_name}: {e}")
-            raise
+        self.rollup: Optional[MetricsRollup] = None
+        if rollups:
+            try:
+                self.rollup = MetricsRollup(self.engine, self.metadata, self.table_name)
+            except ValueError as e:
+                logger.warning(f"⚠️ Rollups de métricas deshabilitados: {e}")
+
+        self.sample_rates = dict(METRICS_SAMPLE_RATES)
+        self.default_sample_rate = METRICS_DEFAULT_SAMPLE_RATE
+        self.allowed_labels = frozenset(METRICS_ALLOWED_LABELS)
+        self.max_metric_names = METRICS_MAX_METRIC_NAMES
+        self.max_label_sets = METRICS_MAX_LABEL_SETS_PER_METRIC
+        # metric -> conjuntos de labels vistos en este proceso
+        self._label_sets: Dict[str, set] = {}
+        self._cardinality_lock = threading.Lock()
+        self.sampled_out = 0
+        self.labels_dropped = 0
+        self.rejected = 0
+        self.overflowed = 0
+        self.invalid = 0
+
+        self.schema_ready = False
+        self._schema_lock = threading.Lock()
+        self._schema_backoff = 1.0
+        self._next_schema_attempt = 0.0
+
+        self.async_writer = async_writer
+        self.flush_interval = flush_interval_ms / 1000
+        self.batch_size = max(1, batch_size)
+        self._buffer: deque = deque(maxlen=max(self.batch_size, buffer_size))
+        self._buffer_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._writer: Optional[threading.Thread] = None
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        if self.async_writer:
+            self._writer = threading.Thread(target=self._run_writer, name="metric-writer", daemon=True)
+            self._writer.start()
+            atexit.register(self.close)
 
         self._initialized = True
 
+    @property
+    def status(self) -> str:
+        return "ready" if self.schema_ready else ("unavailable" if self._next_schema_attempt else "initializing")
+
+    def _ensure_schema(self) -> bool:
+        """Crea las tablas la primera vez que se necesitan. Tras un fallo espera (backoff) antes de reintentar."""
+        if self.schema_ready:
+            return True
+        with self._schema_lock:
+            if self.schema_ready:
+                return True
+            if time.monotonic() < self._next_schema_attempt:
+                return False
+            try:
+                self.metadata.create_all(self.engine)
+                self._add_missing_columns()
+            except SQLAlchemyError as e:
+                self._next_schema_attempt = time.monotonic() + self._schema_backoff
+                logger.warning(f"⚠️ Base de datos de métricas no disponible, reintento en {self._schema_backoff:.0f}s: {e}")
+                self._schema_backoff = min(self._schema_backoff * 2, METRICS_SCHEMA_RETRY_MAX_SECONDS)
+                return False
+            self.schema_ready = True
+            logger.info(f"Tabla {self.table_name} verificada/creada")
+            return True
+
+    def _add_missing_columns(self) -> None:
+        """create_all no altera tablas existentes: añade las columnas nuevas (labels, sample_rate) a una agent_metrics antigua."""
+        existing = {column["name"] for column in inspect(self.engine).get_columns(self.table_name)}
+        missing = [column for column in self.table.columns if column.name not in existing]
+        if not missing:
+            return
+        with self.engine.begin() as conn:
+            for column in missing:
+                column_type = column.type.compile(dialect=self.engine.dialect)
+                conn.execute(text(
+                    f"ALTER TABLE {self.table_name} ADD COLUMN {column.name} {column_type} "
+                    f"NOT NULL DEFAULT '{column.server_default.arg}'"
+                ))
+                logger.info(f"Columna {self.table_name}.{column.name} añadida")
+
     @contextmanager
     def _get_connection(self):
         with self.engine.begin() as conn:
             yield conn
 
+    def _admit_labels(self, metric: str, labels: Optional[Dict[str, Any]]) -> Optional[str]:
+        """Aplica la lista de labels permitidas y los límites de cardinalidad. None si se rechaza la métrica."""
+        if labels:
+            allowed = {key: value for key, value in labels.items() if key in self.allowed_labels and value is not None}
+            if len(allowed) != len(labels):
+                self.labels_dropped += 1
+            label_string = format_labels(allowed)
+        else:
+            label_string = ""
+
+        with self._cardinality_lock:
+            label_sets = self._label_sets.get(metric)
+            if label_sets is None:
+                if len(self._label_sets) >= self.max_metric_names:
+                    self.rejected += 1
+                    if self.rejected == 1:
+                        logger.warning(f"⚠️ Límite de {self.max_metric_names} métricas alcanzado, se descarta '{metric}' y las nuevas")
+                    return None
+                label_sets = self._label_sets[metric] = set()
+            if label_string not in label_sets:
+                if len(label_sets) >= self.max_label_sets:
+                    self.overflowed += 1
+                    if self.overflowed == 1:
+                        logger.warning(f"⚠️ '{metric}' supera {self.max_label_sets} conjuntos de labels, los nuevos se agrupan en {OVERFLOW_LABELS}")
+                    return OVERFLOW_LABELS
+                label_sets.add(label_string)
+        return label_string
+
     def log_metric(
-        self, timestamp: datetime, llm: str, metric: str, value: float
+        self, timestamp: datetime, llm: str, metric: str, value: float, labels: Optional[Dict[str, Any]] = None
     ) -> bool:
-        stmt = self.table.insert().values(
-            timestamp=timestamp, llm=llm, metric=metric, value=value
-        )
+        try:
+            value = float(value)
+        except (TypeError, ValueError):
+            value = math.nan
+        if not math.isfinite(value):
+            # inf/nan no caben en los bins del rollup y harían fallar el lote entero
+            self.invalid += 1
+            if self.invalid == 1:
+                logger.warning(f"⚠️ Valor no finito descartado para la métrica '{metric}' (y los siguientes)")
+            return False
+        sample_rate = self.sample_rates.get(metric, self.default_sample_rate)
+        if sample_rate < 1.0 and random.random() >= sample_rate:
+            self.sampled_out += 1
+            return True
+        label_string = self._admit_labels(metric, labels)
+        if label_string is None:
+            return False
+
+        row = {
+            "timestamp": timestamp,
+            "llm": llm,
+            "metric": metric,
+            "value": value,
+            "labels": label_string,
+            "sample_rate": min(sample_rate, 1.0),
+        }
+        if not self.async_writer:
+            if not self._ensure_schema():
+                self.dropped += 1
+                return False
+            return self._insert_rows([row])
+
+        with self._buffer_lock:
+            if len(self._buffer) == self._buffer.maxlen:
+                # Buffer lleno (la base de datos no da abasto): se pierde la fila más antigua
+                self.dropped += 1
+            self._buffer.append(row)
+            batch_ready = len(self._buffer) >= self.batch_size
+        if batch_ready:
+            self._wakeup.set()
+        logger.debug(f"Métrica encolada: {llm}.{metric}{{{label_string}}} = {value}")
+        return True
+
+    def _insert_rows(self, rows: List[Dict[str, Any]]) -> bool:
+        """Escribe las filas con un único INSERT de varias filas."""
         try:
             with self._get_connection() as conn:
-                conn.execute(stmt)
-            logger.debug(f"Métrica registrada: {llm}.{metric} = {value}")
+                conn.execute(self.table.insert().values(rows))
+                if self.rollup is not None:
+                    self.rollup.add_rows(conn, rows)
+            self.written += len(rows)
+            logger.debug(f"{len(rows)} métricas registradas")
             return True
-        except SQLAlchemyError as e:
-            logger.error(f"Error registrando métrica: {e}")
+        except Exception as e:
+            # No solo SQLAlchemyError: el lote ya salió del buffer y tiene que contar como fallido
+            self.failed += len(rows)
+            logger.error(f"Error registrando {len(rows)} métricas: {e}")
             return False
 
+    def _run_writer(self) -> None:
+        next_retention = time.monotonic() + METRICS_RETENTION_INTERVAL_SECONDS
+        while not self._stop.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                if not self._ensure_schema():
+                    continue
+                self.flush()
+                if METRICS_RETENTION_INTERVAL_SECONDS > 0 and time.monotonic() >= next_retention:
+                    next_retention = time.monotonic() + METRICS_RETENTION_INTERVAL_SECONDS
+                    self.apply_retention()
+            except Exception as e:
+                logger.error(f"Error inesperado en el escritor de métricas: {e}")
+
+    def apply_retention(self) -> Dict[str, int]:
+        """Borra las filas crudas y los rollups que superan su retención."""
+        if self.rollup is None:
+            return {}
+        deleted = self.rollup.apply_retention(self.table)
+        if any(deleted.values()):
+            logger.info(f"🧹 Retención de métricas aplicada: {deleted}")
+        return deleted
+
+    def query_percentiles(
+        self,
+        metric: str,
+        start: datetime,
+        end: datetime,
+        llm: Optional[str] = None,
+        resolution: Optional[str] = None,
+        labels: Optional[Dict[str, Any]] = None,
+    ) -> Dict[str, Any]:
+        """count/avg/min/max y p50/p95/p99 de `metric` (filtrada por `labels`) en [start, end), calculados con los rollups."""
+        if self.rollup is None:
+            raise RuntimeError("Los rollups de métricas están deshabilitados (METRICS_ROLLUP_ENABLED)")
+        if not self._ensure_schema():
+            raise RuntimeError("La base de datos de métricas no está disponible")
+        return self.rollup.query(metric, start, end, llm=llm, resolution=resolution, labels=labels)
+
+    def flush(self) -> int:
+        """Escribe las filas pendientes del buffer en lotes de `batch_size`. Devuelve las escritas."""
+        if not self._ensure_schema():
+            return 0
+        written = 0
+        while True:
+            with self._buffer_lock:
+                batch = [self._buffer.popleft() for _ in range(min(self.batch_size, len(self._buffer)))]
+            if not batch:
+                return written
+            if not self._insert_rows(batch):
+                return written
+            written += len(batch)
+
+    def stats(self) -> Dict[str, int]:
+        with self._buffer_lock:
+            buffered = len(self._buffer)
+        with self._cardinality_lock:
+            series = sum(len(label_sets) for label_sets in self._label_sets.values())
+        return {
+            "buffered": buffered,
+            "written": self.written,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "sampled_out": self.sampled_out,
+            "labels_dropped": self.labels_dropped,
+            "rejected": self.rejected,
+            "overflowed": self.overflowed,
+            "invalid": self.invalid,
+            "metric_names": len(self._label_sets),
+            "series": series,
+        }
+
+    def close(self, timeout: float = 5.0) -> None:
+        """Detiene el hilo escritor y escribe lo que quede pendiente en el buffer."""
+        if self._writer is not None:
+            self._stop.set()
+            self._wakeup.set()
+            self._writer.join(timeout)
+            self._writer = None
+        pending = self.flush()
+        if pending:
+            logger.info(f"📊 {pending} métricas pendientes escritas al cerrar")
+
     def dispose(self) -> None:
+        self.close()
         if self.engine:
             self.engine.dispose()
             logger.info("Engine disposed.")
+
+
+class NullMetricLogger:
+    """Sumidero no-op con la misma interfaz que MetricLogger (métricas deshabilitadas o sin engine)."""
+
+    rollup = None
+    schema_ready = False
+    status = "disabled"
+
+    def log_metric(
+        self, timestamp: datetime, llm: str, metric: str, value: float, labels: Optional[Dict[str, Any]] = None
+    ) -> bool:
+        return False
+
+    def flush(self) -> int:
+        return 0
+
+    def stats(self) -> Dict[str, int]:
+        return dict.fromkeys(
+            ("buffered", "written", "dropped", "failed", "sampled_out", "labels_dropped", "rejected", "overflowed", "invalid", "metric_names", "series"), 0
+        )
+
+    def apply_retention(self) -> Dict[str, int]:
+        return {}
+
+    def query_percentiles(self, *args, **kwargs) -> Dict[str, Any]:
+        raise RuntimeError("Las métricas están deshabilitadas")
+
+    def close(self, timeout: float = 5.0) -> None:
+        pass
+
+    def dispose(self) -> None:
+        pass
+
+
+_metric_logger = None
+_metric_logger_lock = threading.Lock()
+
+
+def get_metric_logger():
+    """
+    Devuelve el MetricLogger del proceso, creándolo en la primera llamada (no al importar).
+    Nunca lanza: con METRICS_ENABLED=false, o si no se puede crear el engine (URL inválida,
+    driver no instalado), devuelve un NullMetricLogger.
+    """
+    global _metric_logger
+    if _metric_logger is None:
+        with _metric_logger_lock:
+            if _metric_logger is None:
+                if not METRICS_ENABLED:
+                    _metric_logger = NullMetricLogger()
+                else:
+                    try:
+                        _metric_logger = MetricLogger()
+                    except Exception as e:
+                        logger.warning(f"⚠️ MetricLogger deshabilitado, se usa un sumidero no-op: {e}")
+                        _metric_logger = NullMetricLogger()
+    return _metric_logger
@@ -0,0 +1,297 @@
+import re
+import math
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import (
+    MetaData,
+    Table,
+    Column,
+    Integer,
+    String,
+    Float,
+    DateTime,
+    select,
+    func,
+    literal,
+)
+
+from .config import (
+    METRICS_ROLLUP_RELATIVE_ACCURACY,
+    METRICS_RAW_RETENTION_DAYS,
+    METRICS_ROLLUP_MINUTE_RETENTION_DAYS,
+    METRICS_ROLLUP_HOUR_RETENTION_DAYS,
+)
+
+import logging
+logger = logging.getLogger(__name__)
+
+# Resoluciones de los rollups: nombre -> tamaño del bucket temporal
+RESOLUTIONS = {"1m": timedelta(minutes=1), "1h": timedelta(hours=1)}
+# Bin reservado para valores <= 0 (el logaritmo no está definido)
+ZERO_BIN = -(2 ** 31)
+# Los valores de las labels solo conservan caracteres seguros y se truncan
+_LABEL_VALUE_PATTERN = re.compile(r"[^A-Za-z0-9_.:+-]")
+MAX_LABEL_VALUE_LENGTH = 64
+
+
+def sanitize_label_value(value: Any) -> str:
+    return _LABEL_VALUE_PATTERN.sub("_", str(value))[:MAX_LABEL_VALUE_LENGTH]
+
+
+def format_labels(labels: Optional[Dict[str, Any]]) -> str:
+    """Forma canónica de un conjunto de labels ("k1=v1,k2=v2", claves ordenadas) que se guarda en la columna `labels`."""
+    if not labels:
+        return ""
+    return ",".join(f"{key}={sanitize_label_value(value)}" for key, value in sorted(labels.items()))
+
+
+def _label_token_pattern(key: str, value: Any) -> str:
+    # Patrón LIKE que encuentra "k=v" como elemento completo de ",labels,"
+    token = f",{key}={sanitize_label_value(value)},"
+    return "%" + token.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+
+
+def bucket_start(timestamp: datetime, resolution: str) -> datetime:
+    """Inicio (UTC) del bucket temporal de `resolution` al que pertenece `timestamp`."""
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    timestamp = timestamp.astimezone(timezone.utc)
+    if resolution == "1h":
+        return timestamp.replace(minute=0, second=0, microsecond=0)
+    return timestamp.replace(second=0, microsecond=0)
+
+
+class LogBinning:
+    """
+    Bins logarítmicos (como DDSketch): el valor v cae en el bin ceil(log_gamma(v)), con
+    gamma = (1 + a) / (1 - a). Devolver el punto medio del bin garantiza un error relativo
+    <= `relative_accuracy` en cualquier percentil, sea cual sea la escala de la métrica
+    (ms, tokens, tokens/s), y los bins de distintos buckets se suman sin perder precisión.
+    """
+
+    def __init__(self, relative_accuracy: float = METRICS_ROLLUP_RELATIVE_ACCURACY):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+
+    def bin(self, value: float) -> int:
+        if value <= 0:
+            return ZERO_BIN
+        return math.ceil(math.log(value) / self._log_gamma)
+
+    def value(self, index: int) -> float:
+        if index == ZERO_BIN:
+            return 0.0
+        return 2 * self.gamma ** index / (self.gamma + 1)
+
+
+class MetricsRollup:
+    """
+    Rollups incrementales de `agent_metrics` por minuto y por hora y por (llm, metric, labels):
+
+    - `{table}_rollup`: count, sum, min y max de cada bucket.
+    - `{table}_rollup_bins`: histograma logarítmico (ver LogBinning) para los percentiles.
+
+    MetricLogger llama a `add_rows` en la misma transacción que inserta las filas crudas:
+    cada lote se agrega en memoria y se suma con un upsert por clave (nunca se vuelven a
+    leer las filas crudas). `apply_retention` borra filas crudas y rollups antiguos, y
+    `query` calcula count/avg/min/max/percentiles de un rango leyendo solo los rollups.
+
+    Las filas muestreadas pesan 1 / sample_rate, así count y sum estiman los valores reales
+    (por eso son Float) y los percentiles no se sesgan aunque cada métrica tenga su tasa.
+    """
+
+    def __init__(self, engine, metadata: MetaData, table_name: str = "agent_metrics", binning: Optional[LogBinning] = None):
+        self.engine = engine
+        self.binning = binning or LogBinning()
+        self.summary = Table(
+            f"{table_name}_rollup",
+            metadata,
+            Column("resolution", String(4), primary_key=True),
+            Column("bucket_start", DateTime(timezone=True), primary_key=True),
+            Column("llm", String(100), primary_key=True),
+            Column("metric", String(100), primary_key=True),
+            Column("labels", String(255), primary_key=True),
+            Column("count", Float, nullable=False),
+            Column("sum", Float, nullable=False),
+            Column("min", Float, nullable=False),
+            Column("max", Float, nullable=False),
+        )
+        self.bins = Table(
+            f"{table_name}_rollup_bins",
+            metadata,
+            Column("resolution", String(4), primary_key=True),
+            Column("bucket_start", DateTime(timezone=True), primary_key=True),
+            Column("llm", String(100), primary_key=True),
+            Column("metric", String(100), primary_key=True),
+            Column("labels", String(255), primary_key=True),
+            Column("bin", Integer, primary_key=True, autoincrement=False),
+            Column("count", Float, nullable=False),
+        )
+
+        dialect = engine.dialect.name
+        if dialect == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert
+            self._least, self._greatest = func.least, func.greatest
+        elif dialect == "sqlite":
+            from sqlalchemy.dialects.sqlite import insert
+            self._least, self._greatest = func.min, func.max
+        else:
+            raise ValueError(f"Rollups de métricas no soportados para la base de datos {dialect}")
+        self._insert = insert
+
+    def _aggregate(self, rows: Iterable[Dict[str, Any]]) -> Tuple[Dict[tuple, List[float]], Dict[tuple, float]]:
+        summaries: Dict[tuple, List[float]] = {}
+        bins: Dict[tuple, float] = {}
+        for row in rows:
+            value = float(row["value"])
+            weight = 1.0 / (row.get("sample_rate") or 1.0)
+            bin_index = self.binning.bin(value)
+            for resolution in RESOLUTIONS:
+                key = (resolution, bucket_start(row["timestamp"], resolution), row["llm"], row["metric"], row.get("labels", ""))
+                summary = summaries.get(key)
+                if summary is None:
+                    summaries[key] = [weight, value * weight, value, value]
+                else:
+                    summary[0] += weight
+                    summary[1] += value * weight
+                    summary[2] = min(summary[2], value)
+                    summary[3] = max(summary[3], value)
+                bins[key + (bin_index,)] = bins.get(key + (bin_index,), 0.0) + weight
+        return summaries, bins
+
+    def add_rows(self, conn, rows: Sequence[Dict[str, Any]]) -> None:
+        """Suma un lote de filas crudas a los rollups (dentro de la transacción `conn`)."""
+        summaries, bins = self._aggregate(rows)
+        if not summaries:
+            return
+
+        # Claves ordenadas: varias réplicas actualizando los mismos buckets bloquean las
+        # filas en el mismo orden y no se producen interbloqueos
+        stmt = self._insert(self.summary).values([
+            {"resolution": k[0], "bucket_start": k[1], "llm": k[2], "metric": k[3], "labels": k[4],
+             "count": v[0], "sum": v[1], "min": v[2], "max": v[3]}
+            for k, v in sorted(summaries.items())
+        ])
+        table = self.summary.c
+        conn.execute(stmt.on_conflict_do_update(
+            index_elements=["resolution", "bucket_start", "llm", "metric", "labels"],
+            set_={
+                "count": table["count"] + stmt.excluded["count"],
+                "sum": table["sum"] + stmt.excluded["sum"],
+                "min": self._least(table["min"], stmt.excluded["min"]),
+                "max": self._greatest(table["max"], stmt.excluded["max"]),
+            },
+        ))
+
+        stmt = self._insert(self.bins).values([
+            {"resolution": k[0], "bucket_start": k[1], "llm": k[2], "metric": k[3], "labels": k[4], "bin": k[5], "count": v}
+            for k, v in sorted(bins.items())
+        ])
+        conn.execute(stmt.on_conflict_do_update(
+            index_elements=["resolution", "bucket_start", "llm", "metric", "labels", "bin"],
+            set_={"count": self.bins.c["count"] + stmt.excluded["count"]},
+        ))
+
+    def apply_retention(self, raw_table: Table, now: Optional[datetime] = None) -> Dict[str, int]:
+        """Borra filas crudas y rollups más antiguos que su retención. Devuelve las filas borradas."""
+        now = now or datetime.now(timezone.utc)
+        deleted = {}
+        with self.engine.begin() as conn:
+            deleted["raw"] = conn.execute(
+                raw_table.delete().where(raw_table.c.timestamp < now - timedelta(days=METRICS_RAW_RETENTION_DAYS))
+            ).rowcount
+            for resolution, days in (("1m", METRICS_ROLLUP_MINUTE_RETENTION_DAYS), ("1h", METRICS_ROLLUP_HOUR_RETENTION_DAYS)):
+                cutoff = now - timedelta(days=days)
+                deleted[resolution] = 0
+                for table in (self.summary, self.bins):
+                    deleted[resolution] += conn.execute(
+                        table.delete().where(table.c.resolution == resolution, table.c.bucket_start < cutoff)
+                    ).rowcount
+        return deleted
+
+    @staticmethod
+    def choose_resolution(start: datetime, end: datetime, now: Optional[datetime] = None) -> str:
+        """Por minuto para rangos de hasta un día aún dentro de su retención; si no, por hora."""
+        now = now or datetime.now(timezone.utc)
+        if end - start > timedelta(days=1) or start < now - timedelta(days=METRICS_ROLLUP_MINUTE_RETENTION_DAYS):
+            return "1h"
+        return "1m"
+
+    def query(
+        self,
+        metric: str,
+        start: datetime,
+        end: datetime,
+        llm: Optional[str] = None,
+        quantiles: Sequence[float] = (0.5, 0.95, 0.99),
+        resolution: Optional[str] = None,
+        labels: Optional[Dict[str, Any]] = None,
+    ) -> Dict[str, Any]:
+        """
+        Resumen de `metric` en [start, end): count, sum, avg, min, max y percentiles. El rango
+        se amplía al inicio del bucket de `start` (minuto u hora según la resolución). Con
+        `labels` solo se agregan los conjuntos de labels que contienen todos esos pares.
+        """
+        resolution = resolution or self.choose_resolution(start, end)
+        if resolution not in RESOLUTIONS:
+            raise ValueError(f"Resolución no soportada: {resolution}")
+
+        def where(table):
+            conditions = [
+                table.c.resolution == resolution,
+                table.c.metric == metric,
+                table.c.bucket_start >= bucket_start(start, resolution),
+                table.c.bucket_start < end,
+            ]
+            if llm:
+                conditions.append(table.c.llm == llm)
+            for key, value in (labels or {}).items():
+                conditions.append((literal(",") + table.c.labels + literal(",")).like(_label_token_pattern(key, value), escape="\\"))
+            return conditions
+
+        with self.engine.connect() as conn:
+            count, total, minimum, maximum = conn.execute(
+                select(
+                    func.sum(self.summary.c["count"]),
+                    func.sum(self.summary.c["sum"]),
+                    func.min(self.summary.c["min"]),
+                    func.max(self.summary.c["max"]),
+                ).where(*where(self.summary))
+            ).one()
+            bin_counts = conn.execute(
+                select(self.bins.c.bin, func.sum(self.bins.c["count"]))
+                .where(*where(self.bins))
+                .group_by(self.bins.c.bin)
+                .order_by(self.bins.c.bin)
+            ).all()
+
+        result: Dict[str, Any] = {
+            "metric": metric,
+            "llm": llm,
+            "labels": labels or {},
+            "from": start.isoformat(),
+            "to": end.isoformat(),
+            "resolution": resolution,
+            "count": round(count or 0),
+            "sum": total,
+            "avg": total / count if count else None,
+            "min": minimum,
+            "max": maximum,
+        }
+        for q in quantiles:
+            result[f"p{q * 100:g}"] = self._quantile(bin_counts, count or 0, q, minimum, maximum)
+        return result
+
+    def _quantile(self, bin_counts, total: float, q: float, minimum: Optional[float], maximum: Optional[float]) -> Optional[float]:
+        if not total:
+            return None
+        rank = q * (total - 1)
+        cumulative = 0
+        for bin_index, count in bin_counts:
+            cumulative += count
+            if cumulative > rank:
+                # El punto medio del bin puede quedar fuera del rango real observado
+                return min(max(self.binning.value(bin_index), minimum), maximum)
+        return maximum
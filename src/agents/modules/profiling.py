@@ -0,0 +1,35 @@
+"""
+Perfilado del agente: el muestreo de pilas y el cProfile de peticiones lentas viven en
+src/observability (compartido con api_rag y api_services); aquí solo se aplica la
+configuración PROFILING_* del agente.
+"""
+from collections import Counter
+
+from observability.profiling import IDLE_LEAVES, SlowRequestProfiler as _SlowRequestProfiler, format_collapsed
+from observability import profiling as _profiling
+
+from .config import PROFILING_DIR, PROFILING_SAMPLE_INTERVAL_MS, PROFILING_MAX_FILES
+
+__all__ = ["IDLE_LEAVES", "SlowRequestProfiler", "format_collapsed", "profile_path", "sample_stacks", "write_collapsed"]
+
+
+def sample_stacks(seconds: float, interval_ms: float = PROFILING_SAMPLE_INTERVAL_MS, include_idle: bool = False) -> Counter:
+    return _profiling.sample_stacks(seconds, interval_ms, include_idle)
+
+
+def profile_path(name: str, extension: str) -> str:
+    return _profiling.profile_path(name, extension, PROFILING_DIR, PROFILING_MAX_FILES)
+
+
+def write_collapsed(stacks: Counter, name: str = "sampling") -> str:
+    return _profiling.write_collapsed(stacks, PROFILING_DIR, PROFILING_MAX_FILES, name)
+
+
+class SlowRequestProfiler(_SlowRequestProfiler):
+    """
+    En /chat cProfile perfila el hilo que ejecuta el grafo (LangGraph ejecuta inline los
+    nodos de un paso con una sola tarea). Los perfiles se guardan en PROFILING_DIR.
+    """
+
+    def __init__(self, threshold_ms: float):
+        super().__init__(threshold_ms, PROFILING_DIR, PROFILING_MAX_FILES)
@@ -1,145 +1,422 @@
 import json
+import time
+import uuid
+import zlib
 import logging
+import threading
 import traceback
-from typing import Dict, Any, Optional, List, Tuple
+from contextlib import contextmanager
+from typing import Dict, Any, Optional, List, Tuple, Iterator
 from datetime import datetime, timezone
 import redis
 from langchain_core.runnables import RunnableConfig
-from langgraph.checkpoint.base import BaseCheckpointSaver, Checkpoint, CheckpointMetadata, CheckpointTuple
+from langgraph.checkpoint.base import BaseCheckpointSaver, Checkpoint, CheckpointMetadata, CheckpointTuple, WRITES_IDX_MAP
 
-from .config import REDIS_CONNECTION_POOL_CONFIG, REDIS_PREFIX, SESSION_TTL_SECONDS
+from .config import (
+    REDIS_PREFIX,
+    REDIS_CLUSTER_ENABLED,
+    SESSION_INDEX_SHARDS,
+    SESSION_TTL_SECONDS,
+    CHECKPOINT_STORAGE_MODE,
+    CHECKPOINT_HISTORY_LIMIT,
+    SESSION_SLIDING_TTL,
+    CHECKPOINT_CLIENT_CACHE_ENABLED,
+    CHECKPOINT_CLIENT_CACHE_MAX_ENTRIES,
+    CHECKPOINT_HOT_CACHE_ENABLED,
+    SESSION_ARCHIVE_BACKEND,
+    SESSION_ARCHIVE_IDLE_MINUTES,
+    SESSION_ARCHIVE_INTERVAL_SECONDS,
+    SESSION_ARCHIVE_COMPRESSION,
+    CHECKPOINT_SLOW_OP_MS,
+)
+from .checkpoint_serializer import CheckpointSerializer, message_to_dict, message_from_dict
+from .checkpoint_hot_cache import CheckpointHotCache
+from .session_archive import create_session_archive
+from .histogram import get_histogram
+from .tracing import start_span
+from .redis_client import create_redis_client, create_pipeline, cluster_tag, mget
 
 logger = logging.getLogger(__name__)
 
+MAX_TRACKED_THREADS = 10000  # Límite del mapa local de nº de mensajes conocidos por thread
+
+# Buckets de checkpoint_operation_seconds (más finos que los de latencia del agente) y de checkpoint_size_bytes
+CHECKPOINT_LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+CHECKPOINT_SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+# Canal pub/sub por el que cada réplica avisa de los threads que ha modificado
+INVALIDATION_CHANNEL = f"{REDIS_PREFIX}:checkpoint-invalidation"
+
+# Campo del hash de checkpoints con el id del checkpoint que representa la lista de mensajes
+MESSAGES_OWNER_FIELD = "messages|checkpoint_id"
+
+# Añade al final de la lista de mensajes solo los que aún no están guardados.
+# KEYS[1] = lista de mensajes, KEYS[2] = head del checkpoint, KEYS[3] = hash de checkpoints
+# ARGV[1] = nº total de mensajes del checkpoint, ARGV[2] = TTL, ARGV[3] = head serializado,
+# ARGV[4] = checkpoint_id del padre ("" si no tiene), ARGV[5] = checkpoint_id nuevo,
+# ARGV[6..] = últimos mensajes del checkpoint (cola que puede contener mensajes ya guardados)
+# Devuelve el nº de mensajes añadidos, o -1 si la lista no es un prefijo del checkpoint
+# (historial reescrito, bifurcación desde otro checkpoint o lista expirada) y hay que reescribirla entera.
+APPEND_MESSAGES_SCRIPT = """
+local total = tonumber(ARGV[1])
+local ttl = tonumber(ARGV[2])
+local tail = #ARGV - 5
+local current = redis.call('LLEN', KEYS[1])
+local already_in_tail = current - (total - tail)
+if current > total or already_in_tail < 0 then
+    return -1
+end
+-- Con el mismo nº de mensajes la lista puede ser de otra rama: solo vale si es la del padre
+if current > 0 and redis.call('HGET', KEYS[3], '__OWNER__') ~= ARGV[4] then
+    return -1
+end
+for i = already_in_tail + 1, tail do
+    redis.call('RPUSH', KEYS[1], ARGV[5 + i])
+end
+if current > 0 or tail > 0 then
+    redis.call('EXPIRE', KEYS[1], ttl)
+end
+redis.call('HSET', KEYS[3], '__OWNER__', ARGV[5])
+redis.call('SETEX', KEYS[2], ttl, ARGV[3])
+return tail - already_in_tail
+""".replace("__OWNER__", MESSAGES_OWNER_FIELD)
+
+# Lee todo lo necesario para get_tuple en un solo viaje y, si se pide, renueva el TTL de la sesión.
+# KEYS = head, metadata, lista de mensajes, escrituras pendientes, hash del historial, ZSET del historial
+# ARGV[1] = TTL a renovar (0 = no renovar), ARGV[2] = checkpoint_id pedido ("" = último)
+# Devuelve {head, metadata, mensajes, escrituras (lista plana campo/valor), checkpoint del historial, su metadata}
+READ_SESSION_SCRIPT = """
+local head = redis.call('GET', KEYS[1])
+local meta = redis.call('GET', KEYS[2])
+local messages = redis.call('LRANGE', KEYS[3], 0, -1)
+local writes = redis.call('HGETALL', KEYS[4])
+local history = {false, false}
+if ARGV[2] ~= '' then
+    history = redis.call('HMGET', KEYS[5], ARGV[2], ARGV[2] .. '|meta')
+end
+local ttl = tonumber(ARGV[1])
+if head and ttl > 0 then
+    for i = 1, 6 do
+        redis.call('EXPIRE', KEYS[i], ttl)
+    end
+end
+return {head, meta, messages, writes, history[1], history[2]}
+"""
+
+# Recorta el historial de un thread a los `limit` checkpoints más recientes.
+# KEYS[1] = ZSET del historial (score 0, orden lexicográfico = orden de los ids uuid6),
+# KEYS[2] = hash de checkpoints, KEYS[3] = hash de escrituras pendientes
+# ARGV[1] = límite. Devuelve el nº de checkpoints eliminados.
+PRUNE_HISTORY_SCRIPT = """
+local excess = redis.call('ZCARD', KEYS[1]) - tonumber(ARGV[1])
+if excess <= 0 then
+    return 0
+end
+local pruned = {}
+for _, id in ipairs(redis.call('ZRANGE', KEYS[1], 0, excess - 1)) do
+    redis.call('HDEL', KEYS[2], id, id .. '|meta')
+    pruned[id] = true
+end
+redis.call('ZREMRANGEBYRANK', KEYS[1], 0, excess - 1)
+for _, field in ipairs(redis.call('HKEYS', KEYS[3])) do
+    local id = string.match(field, '^([^|]*)|')
+    if id and pruned[id] then
+        redis.call('HDEL', KEYS[3], field)
+    end
+end
+return excess
+"""
+
+# Borra una sesión recién archivada solo si no ha cambiado desde que se leyó.
+# KEYS[1..6] = head, metadata, mensajes, escrituras, checkpoints, historial
+# ARGV[1] = metadata leída al archivar, ARGV[2] = nº de escrituras pendientes leídas
+# Devuelve el nº de keys borradas (0 si la sesión ha cambiado y debe seguir en Redis).
+DELETE_ARCHIVED_SESSION_SCRIPT = """
+if redis.call('GET', KEYS[2]) ~= ARGV[1] or redis.call('HLEN', KEYS[4]) ~= tonumber(ARGV[2]) then
+    return 0
+end
+return redis.call('DEL', unpack(KEYS))
+"""
+
+ARCHIVE_FORMAT_VERSION = 1
+
 class RedisCheckpointer(BaseCheckpointSaver):
     """
     Checkpointer personalizado que usa Redis para persistir el estado del agente.
     Mantiene compatibilidad completa con LangGraph mientras usa Redis como backend.
+    Modos de almacenamiento, historial, cachés, registro de sesiones, Redis Cluster y
+    archivado: ver src/agents/modules/README.md y los métodos de cada operación.
     """
     
-    def __init__(self):
+    def __init__(
+        self,
+        storage_mode: str = CHECKPOINT_STORAGE_MODE,
+        serializer: Optional[CheckpointSerializer] = None,
+        history_limit: int = CHECKPOINT_HISTORY_LIMIT,
+        client_cache: bool = CHECKPOINT_CLIENT_CACHE_ENABLED,
+        hot_cache: bool = CHECKPOINT_HOT_CACHE_ENABLED,
+        archive_backend: str = SESSION_ARCHIVE_BACKEND,
+    ):
         """Inicializa el checkpointer con conexión Redis."""
         super().__init__()
+        if storage_mode not in ("full", "delta"):
+            raise ValueError(f"Modo de almacenamiento de checkpoints no soportado: {storage_mode}")
+        self.storage_mode = storage_mode
+        self.serializer = serializer or CheckpointSerializer()
+        self.history_limit = max(1, history_limit)
+        # Nº de mensajes que este proceso sabe que ya están en la lista de cada thread
+        self._known_message_counts: Dict[Tuple[str, str], int] = {}
+        self.hot_cache = CheckpointHotCache() if hot_cache else None
+        # Identifica los avisos de invalidación de este proceso (no hay que aplicarlos)
+        self._instance_id = uuid.uuid4().hex
+        self._invalidation_listener = None
+        self.session_archive = create_session_archive(archive_backend)
+        # Los snapshots archivados se comprimen siempre, sin umbral
+        self.archive_serializer = CheckpointSerializer(compression=SESSION_ARCHIVE_COMPRESSION, compression_threshold=0)
+        self._archiver_stop = threading.Event()
         try:
-            # Crear pool de conexiones Redis
-            self.redis_pool = redis.ConnectionPool(**REDIS_CONNECTION_POOL_CONFIG)
-            self.redis_client = redis.Redis(connection_pool=self.redis_pool)
+            # Crear clientes Redis (nodo único con pool de conexiones o RedisCluster)
+            self.redis_client = create_redis_client()
+            # Cliente sin decode_responses para los payloads binarios de los checkpoints
+            self.redis_binary_client = create_redis_client(decode_responses=False)
+            self.redis_cached_client = self._create_cached_client() if client_cache else None
+            
+            self._read_session_script = self.redis_binary_client.register_script(READ_SESSION_SCRIPT)
+            self._append_messages_script = self.redis_binary_client.register_script(APPEND_MESSAGES_SCRIPT)
+            self._prune_history_script = self.redis_binary_client.register_script(PRUNE_HISTORY_SCRIPT)
+            self._delete_archived_script = self.redis_binary_client.register_script(DELETE_ARCHIVED_SESSION_SCRIPT)
             
             # Test de conexión
             self.redis_client.ping()
-            logger.info("✅ RedisCheckpointer inicializado correctamente")
+            
+            # Sesiones guardadas antes de existir el registro: indexarlas una sola vez
+            if not self.redis_client.exists(*self._sessions_index_keys()):
+                self.rebuild_session_index()
+            if self.hot_cache is not None:
+                self._start_invalidation_listener()
+            if self.session_archive is not None and SESSION_ARCHIVE_INTERVAL_SECONDS > 0:
+                self._start_archiver()
+            logger.info(f"✅ RedisCheckpointer inicializado correctamente (modo: {self.storage_mode}, serializador: {self.serializer.codec}+{self.serializer.compression})")
             
         except Exception as e:
             logger.error(f"❌ Error inicializando RedisCheckpointer: {e}\n{traceback.format_exc()}")
             raise RuntimeError(f"No se pudo conectar a Redis: {e}") from e
     
+    @staticmethod
+    def _create_cached_client() -> Optional[redis.Redis]:
+        """
+        Crea un cliente con caché local invalidada por Redis (client tracking, requiere RESP3,
+        Redis >= 6 y redis-py >= 5.1). Si no está disponible se sigue sin caché.
+        """
+        try:
+            from redis.cache import CacheConfig
+            client = create_redis_client(
+                decode_responses=False,
+                protocol=3,
+                cache_config=CacheConfig(max_size=CHECKPOINT_CLIENT_CACHE_MAX_ENTRIES),
+            )
+            client.ping()
+            logger.info(f"✅ Caché en cliente de Redis activada (máx. {CHECKPOINT_CLIENT_CACHE_MAX_ENTRIES} entradas)")
+            return client
+        except Exception as e:
+            logger.warning(f"⚠️ Caché en cliente de Redis no disponible, se continúa sin ella: {e}")
+            return None
+    
+    def _start_invalidation_listener(self) -> None:
+        """Suscribe un hilo en segundo plano a INVALIDATION_CHANNEL; sin él no se usa la caché en proceso."""
+        try:
+            pubsub = self.redis_client.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(**{INVALIDATION_CHANNEL: self._on_invalidation})
+            self._invalidation_listener = pubsub.run_in_thread(
+                sleep_time=1.0, daemon=True, exception_handler=self._on_invalidation_error,
+            )
+            logger.info(f"✅ Caché de checkpoints en proceso activada (máx. {self.hot_cache.max_entries} threads)")
+        except Exception as e:
+            logger.warning(f"⚠️ No se pudo suscribir a las invalidaciones, caché en proceso desactivada: {e}")
+            self.hot_cache = None
+    
+    def _on_invalidation(self, message: Dict[str, Any]) -> None:
+        try:
+            instance_id, thread_id, checkpoint_ns, checkpoint_id = json.loads(message["data"])
+        except (ValueError, TypeError):
+            logger.warning(f"Aviso de invalidación con formato desconocido: {message.get('data')!r}")
+            return
+        if instance_id != self._instance_id and self.hot_cache is not None:
+            self.hot_cache.invalidate(thread_id, checkpoint_ns, checkpoint_id)
+    
+    def _on_invalidation_error(self, error: Exception, pubsub, thread) -> None:
+        # Se han podido perder avisos mientras la conexión estaba caída: nada de lo cacheado es fiable
+        logger.warning(f"⚠️ Error en la suscripción de invalidaciones, se vacía la caché en proceso: {error}")
+        if self.hot_cache is not None:
+            self.hot_cache.clear()
+        time.sleep(1.0)
+    
+    def _start_archiver(self) -> None:
+        if SESSION_ARCHIVE_IDLE_MINUTES * 60 >= SESSION_TTL_SECONDS:
+            logger.warning("⚠️ SESSION_ARCHIVE_IDLE_MINUTES >= SESSION_TTL_HOURS: las sesiones expirarán antes de archivarse")
+        threading.Thread(target=self._run_archiver, name="session-archiver", daemon=True).start()
+        logger.info(f"✅ Archivado de sesiones activado ({type(self.session_archive).__name__}, inactividad > {SESSION_ARCHIVE_IDLE_MINUTES} min)")
+    
+    def _run_archiver(self) -> None:
+        while not self._archiver_stop.wait(SESSION_ARCHIVE_INTERVAL_SECONDS):
+            self.archive_idle_sessions()
+    
+    def close(self) -> None:
+        """Detiene los hilos en segundo plano (invalidaciones de la caché y archivador)."""
+        self._archiver_stop.set()
+        if self._invalidation_listener is not None:
+            self._invalidation_listener.stop()
+            self._invalidation_listener = None
+    
+    @contextmanager
+    def _timed(self, operation: str, thread_id: Optional[str] = None):
+        """
+        Mide una operación en checkpoint_operation_seconds{operation}, la registra como span
+        `checkpoint.{operation}` de la traza activa y avisa si es lenta.
+        """
+        start = time.perf_counter()
+        try:
+            with start_span(f"checkpoint.{operation}", thread_id=thread_id):
+                yield
+        finally:
+            elapsed = time.perf_counter() - start
+            get_histogram("checkpoint_operation_seconds", CHECKPOINT_LATENCY_BUCKETS, operation=operation).observe(elapsed)
+            if elapsed * 1000 >= CHECKPOINT_SLOW_OP_MS:
+                logger.warning("🐢 Operación de checkpoint lenta: %s de %s en %.1f ms", operation, thread_id, elapsed * 1000, extra={"step": f"checkpoint.{operation}", "thread_id": thread_id})
+    
     def _make_redis_key(self, thread_id: str, checkpoint_ns: str = "default") -> str:
         """Construye la key Redis para un thread específico."""
         # ✅ FIX: Asegurar que checkpoint_ns no sea vacío
         if not checkpoint_ns:
             checkpoint_ns = "default"
-        return f"{REDIS_PREFIX}:{thread_id}:{checkpoint_ns}"
+        return f"{REDIS_PREFIX}:{cluster_tag(f'{thread_id}:{checkpoint_ns}')}"
     
     def _make_metadata_key(self, thread_id: str, checkpoint_ns: str = "default") -> str:
-        """Construye la key Redis para metadatos de un thread."""
-        return f"{REDIS_PREFIX}:meta:{thread_id}:{checkpoint_ns}"
+        """Construye la key Redis para metadatos de un thread (mismo hash tag que el resto)."""
+        tag = cluster_tag(f"{thread_id}:{checkpoint_ns or 'default'}")
+        return f"{REDIS_PREFIX}:meta:{tag}"
+    
+    def _make_messages_key(self, thread_id: str, checkpoint_ns: str = "default") -> str:
+        """Construye la key de la lista append-only de mensajes (modo delta)."""
+        return f"{self._make_redis_key(thread_id, checkpoint_ns)}:messages"
+    
+    def _make_writes_key(self, thread_id: str, checkpoint_ns: str = "default") -> str:
+        """Construye la key del hash de escrituras pendientes (put_writes) de un thread."""
+        return f"{self._make_redis_key(thread_id, checkpoint_ns)}:writes"
+    
+    def _make_history_key(self, thread_id: str, checkpoint_ns: str = "default") -> str:
+        """Construye la key del ZSET con los ids del historial de checkpoints de un thread."""
+        return f"{self._make_redis_key(thread_id, checkpoint_ns)}:history"
+    
+    def _make_checkpoints_key(self, thread_id: str, checkpoint_ns: str = "default") -> str:
+        """Construye la key del hash id -> checkpoint (y 'id|meta' -> metadata) del historial."""
+        return f"{self._make_redis_key(thread_id, checkpoint_ns)}:checkpoints"
+    
+    def _session_keys(self, thread_id: str, checkpoint_ns: str = "default") -> List[str]:
+        """Todas las keys de una sesión: head, metadata, mensajes, escrituras, checkpoints e historial."""
+        return [
+            self._make_redis_key(thread_id, checkpoint_ns),
+            self._make_metadata_key(thread_id, checkpoint_ns),
+            self._make_messages_key(thread_id, checkpoint_ns),
+            self._make_writes_key(thread_id, checkpoint_ns),
+            self._make_checkpoints_key(thread_id, checkpoint_ns),
+            self._make_history_key(thread_id, checkpoint_ns),
+        ]
+    
+    @staticmethod
+    def _parse_metadata_key(metadata_key: Any) -> Tuple[str, str]:
+        """Inverso de _make_metadata_key: (thread_id, checkpoint_ns) de una key del registro."""
+        if isinstance(metadata_key, bytes):
+            metadata_key = metadata_key.decode()
+        tag = metadata_key[len(f"{REDIS_PREFIX}:meta:"):]
+        if REDIS_CLUSTER_ENABLED:
+            tag = tag[1:-1]
+        thread_id, _, checkpoint_ns = tag.rpartition(":")
+        return thread_id, checkpoint_ns
     
-    def _serialize_checkpoint(self, checkpoint: Checkpoint) -> str:
-        """Serializa un checkpoint a JSON para Redis."""
+    @staticmethod
+    def _make_sessions_index_key(shard: int = 0) -> str:
+        """Construye la key de un shard del registro de sesiones activas (score = último guardado)."""
+        if SESSION_INDEX_SHARDS == 1:
+            return f"{REDIS_PREFIX}:sessions"
+        return f"{REDIS_PREFIX}:{cluster_tag(f'sessions:{shard}')}"
+    
+    def _sessions_index_key_for(self, metadata_key: Any) -> str:
+        """Shard del registro en el que se indexa una sesión (por su key de metadata)."""
+        if isinstance(metadata_key, str):
+            metadata_key = metadata_key.encode()
+        return self._make_sessions_index_key(zlib.crc32(metadata_key) % SESSION_INDEX_SHARDS)
+    
+    def _sessions_index_keys(self) -> List[str]:
+        return [self._make_sessions_index_key(shard) for shard in range(SESSION_INDEX_SHARDS)]
+    
+    @staticmethod
+    def _get_thread_and_ns(config: RunnableConfig) -> Tuple[str, str]:
+        """Extrae thread_id y checkpoint_ns (nunca vacío) de la configuración."""
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "default")
+        # ✅ FIX: Asegurar que checkpoint_ns nunca sea None o vacío
+        return thread_id, checkpoint_ns or "default"
+    
+    @staticmethod
+    def _make_config(thread_id: str, checkpoint_ns: str, checkpoint_id: Optional[str]) -> RunnableConfig:
+        # "default" solo existe en las keys: LangGraph trata cualquier ns no vacío como un subgrafo
+        checkpoint_ns = "" if checkpoint_ns == "default" else checkpoint_ns
+        return {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint_id}}
+    
+    def _serialize_checkpoint(self, checkpoint: Checkpoint, include_messages: bool = True) -> bytes:
+        """
+        Serializa un checkpoint para Redis con CheckpointSerializer (la metadata va aparte, en JSON).
+        Con include_messages=False se genera el head del modo delta: los mensajes se
+        sustituyen por su número ('message_count') y se guardan aparte. Ambos modos leen
+        checkpoints guardados por el otro.
+        """
         try:
-            # Convertir checkpoint a dict serializable
+            # Copia superficial: nunca modificar los channel_values del checkpoint vivo
+            channel_values = dict(checkpoint.get("channel_values") or {})
             checkpoint_dict = {
                 "v": checkpoint.get("v", 1),
                 "id": checkpoint.get("id"),
                 "ts": checkpoint.get("ts"),
-                "channel_values": checkpoint.get("channel_values", {}),
+                "channel_values": channel_values,
                 "channel_versions": checkpoint.get("channel_versions", {}),
                 "versions_seen": checkpoint.get("versions_seen", {}),
                 "pending_sends": checkpoint.get("pending_sends", []),
             }
             
-            # Serializar mensajes de forma especial
-            if "channel_values" in checkpoint_dict and checkpoint_dict["channel_values"]:
-                channel_values = checkpoint_dict["channel_values"]
-                
-                # Manejar los mensajes de LangChain
-                if "messages" in channel_values:
-                    messages = channel_values["messages"]
-                    serialized_messages = []
-                    
-                    for msg in messages:
-                        if hasattr(msg, 'dict'):
-                            # LangChain message object
-                            serialized_messages.append({
-                                "type": msg.__class__.__name__,
-                                "content": msg.content,
-                                "additional_kwargs": getattr(msg, 'additional_kwargs', {}),
-                                "tool_calls": getattr(msg, 'tool_calls', []),
-                                "tool_call_id": getattr(msg, 'tool_call_id', None),
-                                "name": getattr(msg, 'name', None),
-                            })
-                        else:
-                            # Fallback para otros tipos
-                            serialized_messages.append(str(msg))
-                    
-                    channel_values["messages"] = serialized_messages
-            
-            return json.dumps(checkpoint_dict, ensure_ascii=False, default=str)
+            # Manejar los mensajes de LangChain
+            if "messages" in channel_values:
+                messages = channel_values.pop("messages")
+                if include_messages:
+                    channel_values["messages"] = [message_to_dict(msg) for msg in messages]
+                else:
+                    checkpoint_dict["message_count"] = len(messages)
+            
+            return self.serializer.dumps(checkpoint_dict)
             
         except Exception as e:
             logger.error(f"Error serializando checkpoint: {e}\n{traceback.format_exc()}")
             raise
     
-    def _deserialize_checkpoint(self, data: str) -> Checkpoint:
-        """Deserializa un checkpoint desde JSON."""
+    def _deserialize_checkpoint(self, data: bytes, delta_messages: Optional[List[bytes]] = None) -> Checkpoint:
+        """
+        Deserializa un checkpoint (formato binario o JSON antiguo). Si el head es del modo delta, los mensajes se
+        reconstruyen a partir de la lista de Redis (`delta_messages`), truncada a 'message_count'.
+        """
         try:
-            checkpoint_dict = json.loads(data)
+            checkpoint_dict = self.serializer.loads(data)
+            channel_values = checkpoint_dict.setdefault("channel_values", {})
             
-            # Reconstruir mensajes de LangChain
-            if ("channel_values" in checkpoint_dict and 
-                checkpoint_dict["channel_values"] and 
-                "messages" in checkpoint_dict["channel_values"]):
-                
-                from langchain_core.messages import (
-                    HumanMessage, AIMessage, SystemMessage, ToolMessage
-                )
-                
-                messages_data = checkpoint_dict["channel_values"]["messages"]
-                reconstructed_messages = []
-                
-                for msg_data in messages_data:
-                    if isinstance(msg_data, dict) and "type" in msg_data:
-                        msg_type = msg_data["type"]
-                        content = msg_data.get("content", "")
-                        
-                        if msg_type == "HumanMessage":
-                            reconstructed_messages.append(HumanMessage(content=content))
-                        elif msg_type == "AIMessage":
-                            ai_msg = AIMessage(
-                                content=content,
-                                additional_kwargs=msg_data.get("additional_kwargs", {}),
-                            )
-                            if msg_data.get("tool_calls"):
-                                ai_msg.tool_calls = msg_data["tool_calls"]
-                            reconstructed_messages.append(ai_msg)
-                        elif msg_type == "SystemMessage":
-                            reconstructed_messages.append(SystemMessage(content=content))
-                        elif msg_type == "ToolMessage":
-                            tool_msg = ToolMessage(
-                                content=content,
-                                tool_call_id=msg_data.get("tool_call_id", ""),
-                            )
-                            if msg_data.get("name"):
-                                tool_msg.name = msg_data["name"]
-                            reconstructed_messages.append(tool_msg)
-                        else:
-                            logger.warning(f"Tipo de mensaje desconocido: {msg_type}")
-                            reconstructed_messages.append(HumanMessage(content=str(msg_data)))
-                    else:
-                        # Fallback para mensajes no estructurados
-                        reconstructed_messages.append(HumanMessage(content=str(msg_data)))
-                
-                checkpoint_dict["channel_values"]["messages"] = reconstructed_messages
+            message_count = checkpoint_dict.pop("message_count", None)
+            if message_count is not None:
+                # Head del modo delta
+                raw_messages = (delta_messages or [])[:message_count]
+                if len(raw_messages) < message_count:
+                    logger.warning(f"Lista de mensajes incompleta: {len(raw_messages)}/{message_count}")
+                channel_values["messages"] = [message_from_dict(self.serializer.loads(raw)) for raw in raw_messages]
+            elif "messages" in channel_values:
+                # Reconstruir mensajes de LangChain (checkpoint completo)
+                channel_values["messages"] = [message_from_dict(msg_data) for msg_data in channel_values["messages"]]
             
             return checkpoint_dict
             
@@ -147,59 +424,323 @@ class RedisCheckpointer(BaseCheckpointSaver):
             logger.error(f"Error deserializando checkpoint: {e}\n{traceback.format_exc()}")
             raise
     
+    def _serialize_write_value(self, value: Any) -> Dict[str, Any]:
+        """Serializa un valor arbitrario de put_writes con el serde de LangGraph."""
+        type_, data = self.serde.dumps_typed(value)
+        return {"type": type_, "data": data}
+    
+    def _deserialize_write_value(self, value: Dict[str, Any]) -> Any:
+        return self.serde.loads_typed((value["type"], value["data"]))
+    
+    def _load_pending_writes(self, raw_writes: Optional[Dict[bytes, bytes]], checkpoint_id: Optional[str]) -> List[Tuple[str, str, Any]]:
+        """Filtra y ordena las escrituras pendientes del checkpoint indicado."""
+        pending = []
+        for raw in (raw_writes or {}).values():
+            try:
+                write = self.serializer.loads(raw)
+                if write.get("checkpoint_id") != checkpoint_id:
+                    continue
+                pending.append((write["task_id"], write["idx"], write["channel"], self._deserialize_write_value(write["value"])))
+            except Exception as e:
+                logger.warning(f"Escritura pendiente corrupta ignorada: {e}")
+        pending.sort(key=lambda w: (w[0], w[1]))
+        return [(task_id, channel, value) for task_id, _, channel, value in pending]
+    
+    @staticmethod
+    def _load_metadata(metadata_data: Optional[bytes], thread_id: str) -> Dict[str, Any]:
+        if not metadata_data:
+            return {}
+        try:
+            return json.loads(metadata_data)
+        except json.JSONDecodeError:
+            logger.warning(f"Metadata corrupta para {thread_id}, usando metadata vacía")
+            return {}
+    
+    def _build_tuple(
+        self,
+        thread_id: str,
+        checkpoint_ns: str,
+        checkpoint_data: bytes,
+        metadata: Dict[str, Any],
+        delta_messages: Optional[List[bytes]],
+        raw_writes: Optional[Dict[bytes, bytes]],
+    ) -> CheckpointTuple:
+        """Construye un CheckpointTuple (con enlace al padre) a partir de los datos leídos de Redis."""
+        with self._timed("deserialize", thread_id):
+            checkpoint = self._deserialize_checkpoint(checkpoint_data, delta_messages)
+            pending_writes = self._load_pending_writes(raw_writes, checkpoint.get("id"))
+        parent_checkpoint_id = metadata.get("parent_checkpoint_id")
+        
+        # Crear CheckpointMetadata
+        checkpoint_metadata = CheckpointMetadata(
+            source=metadata.get("source", "update"),
+            step=metadata.get("step", -1),
+            writes=metadata.get("writes", {}),
+            parents=metadata.get("parents", {}),
+        )
+        
+        return CheckpointTuple(
+            config=self._make_config(thread_id, checkpoint_ns, checkpoint.get("id")),
+            checkpoint=checkpoint,
+            metadata=checkpoint_metadata,
+            parent_config=self._make_config(thread_id, checkpoint_ns, parent_checkpoint_id) if parent_checkpoint_id else None,
+            pending_writes=pending_writes,
+        )
+    
+    @staticmethod
+    def _queue_script(pipe, script, keys: List[Any], args: List[Any]) -> None:
+        """
+        Encola un script Lua en un pipeline, síncrono o de redis.asyncio: el pipeline
+        comprueba y carga los scripts registrados antes de ejecutar. Los pipelines de
+        clúster no cargan scripts, así que ahí se envía el script completo con EVAL.
+        """
+        if REDIS_CLUSTER_ENABLED:
+            pipe.eval(script.script, len(keys), *keys, *args)
+            return
+        pipe.scripts.add(script)
+        pipe.evalsha(script.sha, len(keys), *keys, *args)
+    
+    def _queue_session_read(self, pipe, thread_id: str, checkpoint_ns: str, requested_id: Optional[str]) -> None:
+        """
+        Encola READ_SESSION_SCRIPT y, con TTL deslizante, la actualización del registro de
+        sesiones (ZADD XX: solo si la sesión sigue indexada; puede estar en otro nodo).
+        """
+        keys = self._session_keys(thread_id, checkpoint_ns)
+        metadata_key = keys[1]
+        self._queue_script(pipe, self._read_session_script, keys, [SESSION_TTL_SECONDS if SESSION_SLIDING_TTL else 0, requested_id or ""])
+        if SESSION_SLIDING_TTL:
+            pipe.zadd(self._sessions_index_key_for(metadata_key), {metadata_key: time.time()}, xx=True)
+    
+    @staticmethod
+    def _parse_session_read(results: List[Any]) -> Tuple[Any, ...]:
+        head, metadata, messages, writes, history_checkpoint, history_metadata = results[0]
+        return head, metadata, messages, dict(zip(writes[::2], writes[1::2])), history_checkpoint, history_metadata
+    
+    def _read_session(self, thread_id: str, checkpoint_ns: str, requested_id: Optional[str]) -> Tuple[Any, ...]:
+        """
+        Lee head, metadata, mensajes, escrituras pendientes y el checkpoint pedido del historial
+        con un único script Lua, que además renueva el TTL de la sesión (SESSION_SLIDING_TTL).
+        Devuelve (head, metadata, mensajes, escrituras, checkpoint del historial, su metadata).
+        """
+        if self.redis_cached_client is not None:
+            # Lecturas simples cacheables: las sesiones calientes no salen a Redis. El TTL
+            # se renueva en cada put, no en las lecturas (invalidaría la caché).
+            client = self.redis_cached_client
+            checkpoints_key = self._make_checkpoints_key(thread_id, checkpoint_ns)
+            history = client.hmget(checkpoints_key, requested_id, f"{requested_id}|meta") if requested_id else [None, None]
+            return (
+                client.get(self._make_redis_key(thread_id, checkpoint_ns)),
+                client.get(self._make_metadata_key(thread_id, checkpoint_ns)),
+                client.lrange(self._make_messages_key(thread_id, checkpoint_ns), 0, -1),
+                client.hgetall(self._make_writes_key(thread_id, checkpoint_ns)),
+                *history,
+            )
+        
+        pipe = create_pipeline(self.redis_binary_client, transaction=False)
+        self._queue_session_read(pipe, thread_id, checkpoint_ns, requested_id)
+        return self._parse_session_read(pipe.execute())
+    
+    def _tuple_from_session(
+        self,
+        thread_id: str,
+        checkpoint_ns: str,
+        requested_id: Optional[str],
+        session: Tuple[Any, ...],
+    ) -> Optional[CheckpointTuple]:
+        """Construye el CheckpointTuple de get_tuple a partir de la lectura de la sesión."""
+        checkpoint_data, metadata_data, delta_messages, raw_writes, history_checkpoint, history_metadata = session
+        
+        if requested_id:
+            if history_checkpoint:
+                checkpoint_data, metadata_data = history_checkpoint, history_metadata
+            elif not checkpoint_data or self.serializer.loads(checkpoint_data).get("id") != requested_id:
+                logger.debug("No se encontró el checkpoint %s para thread_id: %s", requested_id, thread_id, extra={"step": "checkpoint.get", "thread_id": thread_id})
+                return None
+        
+        if not checkpoint_data:
+            logger.debug("No se encontró checkpoint para thread_id: %s", thread_id, extra={"step": "checkpoint.get", "thread_id": thread_id})
+            return None
+        
+        if delta_messages:
+            self._known_message_counts[(thread_id, checkpoint_ns)] = len(delta_messages)
+        
+        checkpoint_tuple = self._build_tuple(
+            thread_id, checkpoint_ns, checkpoint_data,
+            self._load_metadata(metadata_data, thread_id), delta_messages, raw_writes,
+        )
+        
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(
+                "Checkpoint cargado para %s: %d mensajes", thread_id,
+                len(checkpoint_tuple.checkpoint.get('channel_values', {}).get('messages', [])),
+                extra={"step": "checkpoint.get", "thread_id": thread_id},
+            )
+        return checkpoint_tuple
+    
     def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        """
+        Devuelve el último checkpoint del thread o, si la configuración incluye
+        checkpoint_id, ese checkpoint concreto del historial.
+        """
         try:
-            thread_id = config["configurable"]["thread_id"]
-            checkpoint_ns = config["configurable"].get("checkpoint_ns", "default")
-            
-            # ✅ FIX: Asegurar que checkpoint_ns nunca sea None o vacío
-            if not checkpoint_ns:
-                checkpoint_ns = "default"
+            thread_id, checkpoint_ns = self._get_thread_and_ns(config)
+            requested_id = config["configurable"].get("checkpoint_id")
                 
-            logger.debug(f"🔧 [GET] thread_id: {thread_id}, checkpoint_ns: {checkpoint_ns}")
+            logger.debug("🔧 [GET] thread_id: %s, checkpoint_ns: %s, checkpoint_id: %s", thread_id, checkpoint_ns, requested_id, extra={"step": "checkpoint.get", "thread_id": thread_id})
             
-            redis_key = self._make_redis_key(thread_id, checkpoint_ns)
-            metadata_key = self._make_metadata_key(thread_id, checkpoint_ns)
+            cached = self._hot_cache_get(thread_id, checkpoint_ns, requested_id)
+            if cached is not None:
+                return cached
+            generation = self.hot_cache.generation if self.hot_cache is not None else None
             
-            # Obtener checkpoint y metadata
-            checkpoint_data = self.redis_client.get(redis_key)
-            metadata_data = self.redis_client.get(metadata_key)
+            with self._timed("get", thread_id):
+                session = self._read_session(thread_id, checkpoint_ns, requested_id)
+                checkpoint_tuple = self._tuple_from_session(thread_id, checkpoint_ns, requested_id, session)
+                if checkpoint_tuple is None and self.session_archive is not None and self._rehydrate_session(thread_id, checkpoint_ns):
+                    session = self._read_session(thread_id, checkpoint_ns, requested_id)
+                    checkpoint_tuple = self._tuple_from_session(thread_id, checkpoint_ns, requested_id, session)
+            self._hot_cache_store_read(thread_id, checkpoint_ns, requested_id, checkpoint_tuple, generation)
+            return checkpoint_tuple
             
+        except Exception as e:
+            logger.error(f"Error obteniendo checkpoint: {e}\n{traceback.format_exc()}")
+            return None
+    
+    def _hot_cache_get(self, thread_id: str, checkpoint_ns: str, requested_id: Optional[str]) -> Optional[CheckpointTuple]:
+        """
+        Un acierto no sale a Redis: el TTL deslizante de la sesión se renueva como mucho cada
+        CHECKPOINT_HOT_CACHE_TTL_SECONDS, cuando caduca la entrada local.
+        """
+        if self.hot_cache is None:
+            return None
+        checkpoint_tuple = self.hot_cache.get(thread_id, checkpoint_ns, requested_id)
+        if checkpoint_tuple is not None:
+            logger.debug("Checkpoint de %s servido desde la caché en proceso", thread_id, extra={"step": "checkpoint.get", "thread_id": thread_id})
+        return checkpoint_tuple
+    
+    def _hot_cache_store_read(
+        self,
+        thread_id: str,
+        checkpoint_ns: str,
+        requested_id: Optional[str],
+        checkpoint_tuple: Optional[CheckpointTuple],
+        generation: Optional[int],
+    ) -> None:
+        # Solo el último checkpoint; los del historial (time-travel) no se cachean
+        if self.hot_cache is not None and checkpoint_tuple is not None and not requested_id:
+            self.hot_cache.put(thread_id, checkpoint_ns, checkpoint_tuple, generation)
+    
+    def _hot_cache_invalidate(self, config: RunnableConfig) -> None:
+        if self.hot_cache is not None:
+            self.hot_cache.invalidate(*self._get_thread_and_ns(config))
+    
+    def _invalidation_message(self, thread_id: str, checkpoint_ns: str, checkpoint_id: Optional[str]) -> str:
+        return json.dumps([self._instance_id, thread_id, checkpoint_ns, checkpoint_id])
+    
+    def _queue_invalidation(self, pipe, thread_id: str, checkpoint_ns: str, checkpoint_id: Optional[str]) -> Optional[str]:
+        """
+        Encola el aviso a las demás réplicas de que el thread ha cambiado (checkpoint_id =
+        nueva versión, o None si hay que descartarlo siempre). Se publica aunque esta réplica
+        no tenga caché en proceso: las que sí la tienen dependen del aviso. En Redis Cluster
+        PUBLISH no se admite en pipelines: se devuelve el mensaje para publicarlo tras ejecutarlo.
+        """
+        message = self._invalidation_message(thread_id, checkpoint_ns, checkpoint_id)
+        if REDIS_CLUSTER_ENABLED:
+            return message
+        pipe.publish(INVALIDATION_CHANNEL, message)
+        return None
+    
+    @staticmethod
+    def _list_bounds(config: RunnableConfig, before: Optional[RunnableConfig]) -> Tuple[Optional[str], Optional[str]]:
+        """Devuelve (checkpoint_id pedido en config, checkpoint_id de `before`)."""
+        before_id = ((before or {}).get("configurable") or {}).get("checkpoint_id")
+        return config["configurable"].get("checkpoint_id"), before_id
+    
+    @staticmethod
+    def _history_max(before_id: Optional[str]) -> str:
+        # Ids uuid6: el orden lexicográfico es el orden temporal
+        return f"({before_id}" if before_id else "+"
+    
+    def _queue_list_reads(self, pipe, thread_id: str, checkpoint_ns: str, checkpoint_ids: List[str]) -> None:
+        fields = [field for checkpoint_id in checkpoint_ids for field in (checkpoint_id, f"{checkpoint_id}|meta")]
+        pipe.hmget(self._make_checkpoints_key(thread_id, checkpoint_ns), fields)
+        pipe.lrange(self._make_messages_key(thread_id, checkpoint_ns), 0, -1)
+        pipe.hgetall(self._make_writes_key(thread_id, checkpoint_ns))
+    
+    def _iter_listed_tuples(
+        self,
+        thread_id: str,
+        checkpoint_ns: str,
+        checkpoint_ids: List[str],
+        results: List[Any],
+        filter: Optional[Dict[str, Any]],
+        limit: Optional[int],
+    ) -> Iterator[CheckpointTuple]:
+        values, delta_messages, raw_writes = results
+        returned = 0
+        for i in range(len(checkpoint_ids)):
+            if limit is not None and returned >= limit:
+                break
+            checkpoint_data, metadata_data = values[2 * i], values[2 * i + 1]
             if not checkpoint_data:
-                logger.debug(f"No se encontró checkpoint para thread_id: {thread_id}")
-                return None
-            
-            # Deserializar checkpoint
-            checkpoint = self._deserialize_checkpoint(checkpoint_data)
-            
-            # Deserializar metadata si existe
-            metadata = {}
-            if metadata_data:
-                try:
-                    metadata = json.loads(metadata_data)
-                except json.JSONDecodeError:
-                    logger.warning(f"Metadata corrupta para {thread_id}, usando metadata vacía")
-            
-            # Crear CheckpointMetadata
-            checkpoint_metadata = CheckpointMetadata(
-                source=metadata.get("source", "update"),
-                step=metadata.get("step", -1),
-                writes=metadata.get("writes", {}),
-                parents=metadata.get("parents", {}),
-            )
+                continue
+            metadata = self._load_metadata(metadata_data, thread_id)
+            if not self._metadata_matches(metadata, filter):
+                continue
+            yield self._build_tuple(thread_id, checkpoint_ns, checkpoint_data, metadata, delta_messages, raw_writes)
+            returned += 1
+    
+    def list(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[Dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> Iterator[CheckpointTuple]:
+        """
+        Lista los checkpoints del historial de un thread, del más reciente al más antiguo.
+        `before` limita a checkpoints anteriores al indicado, `filter` compara por igualdad
+        contra la metadata guardada y `limit` acota el número de resultados.
+        """
+        if not config:
+            logger.warning("RedisCheckpointer.list requiere un thread_id; no se listan checkpoints de todos los threads")
+            return
+        
+        thread_id, checkpoint_ns = self._get_thread_and_ns(config)
+        requested_id, before_id = self._list_bounds(config, before)
+        
+        try:
+            if requested_id:
+                checkpoint_ids = [requested_id] if not before_id or requested_id < before_id else []
+            else:
+                history_key = self._make_history_key(thread_id, checkpoint_ns)
+                checkpoint_ids = [raw.decode() for raw in self.redis_binary_client.zrevrangebylex(history_key, self._history_max(before_id), "-")]
+                if not checkpoint_ids and self.session_archive is not None and self._rehydrate_session(thread_id, checkpoint_ns):
+                    checkpoint_ids = [raw.decode() for raw in self.redis_binary_client.zrevrangebylex(history_key, self._history_max(before_id), "-")]
             
-            logger.debug(f"Checkpoint cargado para {thread_id}: {len(checkpoint.get('channel_values', {}).get('messages', []))} mensajes")
+            if not checkpoint_ids:
+                # Sesiones guardadas antes de existir el historial: solo el último checkpoint
+                if not before_id:
+                    latest = self.get_tuple(config)
+                    if latest and self._metadata_matches(latest.metadata, filter):
+                        yield latest
+                return
             
-            return CheckpointTuple(
-                config=config,
-                checkpoint=checkpoint,
-                metadata=checkpoint_metadata,
-                parent_config=None,  # Por simplicidad, no manejamos parent configs
-            )
+            with self._timed("list", thread_id):
+                pipe = create_pipeline(self.redis_binary_client, transaction=False)
+                self._queue_list_reads(pipe, thread_id, checkpoint_ns, checkpoint_ids)
+                results = pipe.execute()
             
         except Exception as e:
-            logger.error(f"Error obteniendo checkpoint: {e}\n{traceback.format_exc()}")
-            return None
+            logger.error(f"Error listando checkpoints de {thread_id}: {e}\n{traceback.format_exc()}")
+            return
+        
+        yield from self._iter_listed_tuples(thread_id, checkpoint_ns, checkpoint_ids, results, filter, limit)
+    
+    @staticmethod
+    def _metadata_matches(metadata: Dict[str, Any], filter: Optional[Dict[str, Any]]) -> bool:
+        return all(metadata.get(key) == value for key, value in (filter or {}).items())
     
     def list_tuples(
         self, 
@@ -209,11 +750,243 @@ class RedisCheckpointer(BaseCheckpointSaver):
         before: Optional[RunnableConfig] = None,
         limit: Optional[int] = None
     ) -> List[CheckpointTuple]:
+        """Igual que `list`, pero devuelve una lista."""
+        return list(self.list(config, filter=filter, before=before, limit=limit))
+    
+    def _build_metadata(
+        self,
+        thread_id: str,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        parent_checkpoint_id: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """Construye la metadata extendida que se guarda junto al checkpoint."""
+        # ✅ ARREGLAR: Manejo correcto del metadata (puede ser dict o objeto)
+        if isinstance(metadata, dict):
+            # Si metadata es un dict
+            extended_metadata = {
+                "source": metadata.get("source", "update"),
+                "step": metadata.get("step", -1),
+                "writes": metadata.get("writes", {}),
+                "parents": metadata.get("parents", {}),
+            }
+        else:
+            # Si metadata es un objeto CheckpointMetadata
+            extended_metadata = {
+                "source": getattr(metadata, 'source', 'update'),
+                "step": getattr(metadata, 'step', -1),
+                "writes": getattr(metadata, 'writes', {}),
+                "parents": getattr(metadata, 'parents', {}),
+            }
+        
+        # Añadir metadata adicional
+        extended_metadata.update({
+            "saved_at": datetime.now(timezone.utc).isoformat(),
+            "thread_id": thread_id,
+            "user_login": "fab1an12",  # Usuario actual
+            "storage_mode": self.storage_mode,
+            "parent_checkpoint_id": parent_checkpoint_id,
+        })
+        
+        # Agregar info de los mensajes para logging
+        if (checkpoint.get("channel_values") and 
+            "messages" in checkpoint["channel_values"]):
+            message_count = len(checkpoint["channel_values"]["messages"])
+            extended_metadata["message_count"] = message_count
+            
+            # Info del último mensaje
+            if message_count > 0:
+                last_msg = checkpoint["channel_values"]["messages"][-1]
+                extended_metadata["last_message_type"] = type(last_msg).__name__
+        
+        return extended_metadata
+    
+    def _serialize_message_tail(self, thread_id: str, checkpoint_ns: str, messages: List[Any]) -> List[bytes]:
+        """Serializa los mensajes desde el último nº de mensajes conocido por este proceso (modo delta)."""
+        known = self._known_message_counts.get((thread_id, checkpoint_ns), 0)
+        tail_start = known if known <= len(messages) else 0
+        return [self.serializer.dumps(message_to_dict(msg)) for msg in messages[tail_start:]]
+    
+    def _queue_delta_messages(self, pipe, put_state: Dict[str, Any]) -> None:
+        """
+        Encola en `pipe` el script que añade solo los mensajes nuevos a la lista y escribe el head.
+        La lista recuerda de qué checkpoint es (MESSAGES_OWNER_FIELD): si el padre no es ese
+        checkpoint (update_state o bifurcación desde el historial) el script devuelve -1 aunque
+        el nº de mensajes coincida, y put la reescribe entera.
+        """
+        thread_id, checkpoint_ns = put_state["thread_id"], put_state["checkpoint_ns"]
+        self._queue_script(
+            pipe,
+            self._append_messages_script,
+            keys=[
+                self._make_messages_key(thread_id, checkpoint_ns),
+                self._make_redis_key(thread_id, checkpoint_ns),
+                self._make_checkpoints_key(thread_id, checkpoint_ns),
+            ],
+            args=[
+                len(put_state["messages"]), SESSION_TTL_SECONDS, put_state["payload"],
+                put_state["parent_checkpoint_id"] or "", put_state["checkpoint_id"], *put_state["message_tail"],
+            ],
+        )
+    
+    def _queue_rewrite_delta_messages(self, pipe, put_state: Dict[str, Any]) -> None:
+        """
+        Encola la reescritura completa de la lista de mensajes (historial reescrito, otra rama o
+        lista expirada) y del head: el script de _queue_delta_messages devuelve -1 sin escribirlo.
         """
-        Lista checkpoints para un thread. Por simplicidad, devolvemos solo el más reciente.
+        thread_id, checkpoint_ns, messages = put_state["thread_id"], put_state["checkpoint_ns"], put_state["messages"]
+        messages_key = self._make_messages_key(thread_id, checkpoint_ns)
+        pipe.delete(messages_key)
+        if messages:
+            pipe.rpush(messages_key, *[self.serializer.dumps(message_to_dict(msg)) for msg in messages])
+            pipe.expire(messages_key, SESSION_TTL_SECONDS)
+        pipe.hset(self._make_checkpoints_key(thread_id, checkpoint_ns), MESSAGES_OWNER_FIELD, put_state["checkpoint_id"])
+        pipe.setex(self._make_redis_key(thread_id, checkpoint_ns), SESSION_TTL_SECONDS, put_state["payload"])
+    
+    def _queue_branch_lookup(self, pipe, thread_id: str, checkpoint_ns: str, parent_checkpoint_id: Optional[str]) -> None:
+        """Encola la lectura de los checkpoints posteriores al padre y de los campos de escrituras."""
+        min_id = f"({parent_checkpoint_id}" if parent_checkpoint_id else "-"
+        pipe.zrangebylex(self._make_history_key(thread_id, checkpoint_ns), min_id, "+")
+        pipe.hkeys(self._make_writes_key(thread_id, checkpoint_ns))
+    
+    def _queue_discard_branch(self, pipe, thread_id: str, checkpoint_ns: str, checkpoint_id: str, lookup: List[Any]) -> int:
         """
-        tuple_result = self.get_tuple(config)
-        return [tuple_result] if tuple_result else []
+        Modo delta: tras reescribir la lista de mensajes al bifurcar desde un checkpoint anterior,
+        los checkpoints posteriores a él pertenecen a la rama abandonada y ya no se pueden
+        reconstruir, así que se encola su borrado del historial junto con sus escrituras pendientes.
+        Devuelve el nº de checkpoints descartados.
+        """
+        raw_ids, raw_write_fields = lookup
+        stale = [raw.decode() for raw in raw_ids if raw.decode() != checkpoint_id]
+        if not stale:
+            return 0
+        
+        writes_key = self._make_writes_key(thread_id, checkpoint_ns)
+        stale_writes = [field for field in raw_write_fields if field.decode().split("|", 1)[0] in stale]
+        pipe.zrem(self._make_history_key(thread_id, checkpoint_ns), *stale)
+        pipe.hdel(self._make_checkpoints_key(thread_id, checkpoint_ns), *stale, *[f"{stale_id}|meta" for stale_id in stale])
+        if stale_writes:
+            pipe.hdel(writes_key, *stale_writes)
+        logger.info("🌿 %d checkpoints de una rama abandonada eliminados del historial de %s", len(stale), thread_id, extra={"step": "checkpoint.put", "thread_id": thread_id})
+        return len(stale)
+    
+    def _rebuild_delta_branch(self, put_state: Dict[str, Any]) -> None:
+        """
+        Reescribe la lista de mensajes y descarta la rama abandonada (ver _queue_discard_branch):
+        en modo delta el historial es lineal.
+        """
+        thread_id, checkpoint_ns = put_state["thread_id"], put_state["checkpoint_ns"]
+        pipe = create_pipeline(self.redis_binary_client)
+        self._queue_branch_lookup(pipe, thread_id, checkpoint_ns, put_state["parent_checkpoint_id"])
+        lookup = pipe.execute()
+        
+        pipe = create_pipeline(self.redis_binary_client)
+        self._queue_rewrite_delta_messages(pipe, put_state)
+        self._queue_discard_branch(pipe, thread_id, checkpoint_ns, put_state["checkpoint_id"], lookup)
+        pipe.execute()
+        logger.info("♻️ Lista de mensajes reescrita para %s: %d mensajes", thread_id, len(put_state['messages']), extra={"step": "checkpoint.put", "thread_id": thread_id})
+    
+    def _prepare_put(self, config: RunnableConfig, checkpoint: Checkpoint, metadata: CheckpointMetadata) -> Dict[str, Any]:
+        """Serializa checkpoint y metadata; todo lo que put necesita antes de hablar con Redis."""
+        thread_id, checkpoint_ns = self._get_thread_and_ns(config)
+        logger.debug("🔧 [PUT] thread_id: %s, checkpoint_ns: %s", thread_id, checkpoint_ns, extra={"step": "checkpoint.put", "thread_id": thread_id})
+        
+        # El config recibido apunta al checkpoint del que parte este (su padre)
+        parent_checkpoint_id = config["configurable"].get("checkpoint_id")
+        messages = (checkpoint.get("channel_values") or {}).get("messages", [])
+        with self._timed("serialize", thread_id):
+            payload = self._serialize_checkpoint(checkpoint, include_messages=self.storage_mode != "delta")
+            message_tail = self._serialize_message_tail(thread_id, checkpoint_ns, messages) if self.storage_mode == "delta" else []
+        
+        get_histogram("checkpoint_size_bytes", CHECKPOINT_SIZE_BUCKETS, kind="payload").observe(len(payload))
+        message_histogram = get_histogram("checkpoint_size_bytes", CHECKPOINT_SIZE_BUCKETS, kind="message")
+        for raw_message in message_tail:
+            message_histogram.observe(len(raw_message))
+        
+        extended_metadata = self._build_metadata(thread_id, checkpoint, metadata, parent_checkpoint_id)
+        extended_metadata["checkpoint_bytes"] = len(payload)
+        extended_metadata["appended_message_bytes"] = sum(len(raw_message) for raw_message in message_tail)
+        return {
+            "thread_id": thread_id,
+            "checkpoint_ns": checkpoint_ns,
+            "checkpoint_id": checkpoint.get("id"),
+            "parent_checkpoint_id": parent_checkpoint_id,
+            "messages": messages,
+            "message_tail": message_tail,
+            "message_count": extended_metadata.get("message_count", 0),
+            "metadata_json": json.dumps(extended_metadata, ensure_ascii=False, default=str),
+            "payload": payload,
+            "checkpoint": checkpoint,
+            "metadata": metadata,
+        }
+    
+    def _queue_put(self, pipe, put_state: Dict[str, Any]) -> Optional[str]:
+        """
+        Encola en `pipe` todas las escrituras de put. El primer resultado es el del head.
+        Además del último checkpoint guarda los `history_limit` más recientes (ZSET de ids +
+        hash con checkpoint y metadata) y actualiza el registro de sesiones (ZSET por shard,
+        score = instante del guardado) que usa list_active_sessions en vez de un SCAN.
+        Devuelve el aviso de invalidación pendiente de publicar (ver _queue_invalidation).
+        """
+        thread_id, checkpoint_ns = put_state["thread_id"], put_state["checkpoint_ns"]
+        checkpoint_id, payload, metadata_json = put_state["checkpoint_id"], put_state["payload"], put_state["metadata_json"]
+        metadata_key = self._make_metadata_key(thread_id, checkpoint_ns)
+        history_key = self._make_history_key(thread_id, checkpoint_ns)
+        checkpoints_key = self._make_checkpoints_key(thread_id, checkpoint_ns)
+        
+        if self.storage_mode == "delta":
+            self._queue_delta_messages(pipe, put_state)
+        else:
+            pipe.setex(self._make_redis_key(thread_id, checkpoint_ns), SESSION_TTL_SECONDS, payload)
+        pipe.setex(metadata_key, SESSION_TTL_SECONDS, metadata_json)
+        pipe.zadd(self._sessions_index_key_for(metadata_key), {metadata_key: time.time()})
+        
+        # Historial acotado: el checkpoint (o su head en modo delta) y su metadata por id
+        pipe.hset(checkpoints_key, mapping={checkpoint_id: payload, f"{checkpoint_id}|meta": metadata_json})
+        pipe.zadd(history_key, {checkpoint_id: 0})
+        self._queue_script(
+            pipe,
+            self._prune_history_script,
+            keys=[history_key, checkpoints_key, self._make_writes_key(thread_id, checkpoint_ns)],
+            args=[self.history_limit],
+        )
+        pipe.expire(history_key, SESSION_TTL_SECONDS)
+        pipe.expire(checkpoints_key, SESSION_TTL_SECONDS)
+        return self._queue_invalidation(pipe, thread_id, checkpoint_ns, checkpoint_id)
+    
+    def _needs_delta_rebuild(self, results: List[Any]) -> bool:
+        # APPEND_MESSAGES_SCRIPT devuelve -1 si la lista no es un prefijo del checkpoint o es de otra rama
+        return self.storage_mode == "delta" and results[0] == -1
+    
+    def _finish_put(self, put_state: Dict[str, Any]) -> RunnableConfig:
+        thread_id, checkpoint_ns = put_state["thread_id"], put_state["checkpoint_ns"]
+        if self.storage_mode == "delta":
+            if len(self._known_message_counts) > MAX_TRACKED_THREADS:
+                self._known_message_counts.clear()
+            self._known_message_counts[(thread_id, checkpoint_ns)] = len(put_state["messages"])
+        
+        if self.hot_cache is not None:
+            # Write-through: Redis ya tiene el checkpoint, la caché pasa a esta versión
+            metadata = put_state["metadata"] or {}
+            parent_checkpoint_id = put_state["parent_checkpoint_id"]
+            self.hot_cache.put(thread_id, checkpoint_ns, CheckpointTuple(
+                config=self._make_config(thread_id, checkpoint_ns, put_state["checkpoint_id"]),
+                checkpoint=put_state["checkpoint"],
+                metadata=CheckpointMetadata(
+                    source=metadata.get("source", "update"),
+                    step=metadata.get("step", -1),
+                    writes=metadata.get("writes", {}),
+                    parents=metadata.get("parents", {}),
+                ),
+                parent_config=self._make_config(thread_id, checkpoint_ns, parent_checkpoint_id) if parent_checkpoint_id else None,
+                pending_writes=[],
+            ))
+        
+        logger.debug(
+            "✅ Checkpoint guardado para %s: %d mensajes, %d bytes", thread_id, put_state['message_count'], len(put_state['payload']),
+            extra={"step": "checkpoint.put", "thread_id": thread_id},
+        )
+        return self._make_config(thread_id, checkpoint_ns, put_state["checkpoint_id"])
     
     def put(
         self,
@@ -223,95 +996,88 @@ class RedisCheckpointer(BaseCheckpointSaver):
         new_versions: Dict[str, Any],
     ) -> RunnableConfig:
         try:
-            thread_id = config["configurable"]["thread_id"]
-            checkpoint_ns = config["configurable"].get("checkpoint_ns", "default")
-            
-            # ✅ FIX: Asegurar que checkpoint_ns nunca sea None o vacío
-            if not checkpoint_ns:
-                checkpoint_ns = "default"
-            
-            logger.debug(f"🔧 [PUT] thread_id: {thread_id}, checkpoint_ns: {checkpoint_ns}")
-            
-            redis_key = self._make_redis_key(thread_id, checkpoint_ns)
-            metadata_key = self._make_metadata_key(thread_id, checkpoint_ns)
-            
-            # Serializar checkpoint
-            checkpoint_json = self._serialize_checkpoint(checkpoint)
-            
-            # ✅ ARREGLAR: Manejo correcto del metadata (puede ser dict o objeto)
-            if isinstance(metadata, dict):
-                # Si metadata es un dict
-                extended_metadata = {
-                    "source": metadata.get("source", "update"),
-                    "step": metadata.get("step", -1),
-                    "writes": metadata.get("writes", {}),
-                    "parents": metadata.get("parents", {}),
-                }
-            else:
-                # Si metadata es un objeto CheckpointMetadata
-                extended_metadata = {
-                    "source": getattr(metadata, 'source', 'update'),
-                    "step": getattr(metadata, 'step', -1),
-                    "writes": getattr(metadata, 'writes', {}),
-                    "parents": getattr(metadata, 'parents', {}),
-                }
-            
-            # Añadir metadata adicional
-            extended_metadata.update({
-                "saved_at": datetime.now(timezone.utc).isoformat(),
-                "thread_id": thread_id,
-                "user_login": "fab1an12",  # Usuario actual
-            })
-            
-            # Agregar info de los mensajes para logging
-            if (checkpoint.get("channel_values") and 
-                "messages" in checkpoint["channel_values"]):
-                message_count = len(checkpoint["channel_values"]["messages"])
-                extended_metadata["message_count"] = message_count
+            with self._timed("put", config["configurable"].get("thread_id")):
+                put_state = self._prepare_put(config, checkpoint, metadata)
                 
-                # Info del último mensaje
-                if message_count > 0:
-                    last_msg = checkpoint["channel_values"]["messages"][-1]
-                    extended_metadata["last_message_type"] = type(last_msg).__name__
-            
-            metadata_json = json.dumps(extended_metadata, ensure_ascii=False, default=str)
-            
-            # Usar pipeline Redis para operaciones atómicas
-            pipe = self.redis_client.pipeline()
-            pipe.setex(redis_key, SESSION_TTL_SECONDS, checkpoint_json)
-            pipe.setex(metadata_key, SESSION_TTL_SECONDS, metadata_json)
-            pipe.execute()
-            
-            logger.info(f"✅ Checkpoint guardado para {thread_id}: {extended_metadata.get('message_count', 0)} mensajes")
-            
-            return config
+                # Usar pipeline Redis para operaciones atómicas
+                pipe = create_pipeline(self.redis_binary_client)
+                invalidation = self._queue_put(pipe, put_state)
+                results = pipe.execute()
+                if invalidation:
+                    self.redis_client.publish(INVALIDATION_CHANNEL, invalidation)
+                
+                if self._needs_delta_rebuild(results):
+                    self._rebuild_delta_branch(put_state)
+                return self._finish_put(put_state)
             
         except Exception as e:
             logger.error(f"❌ Error guardando checkpoint: {e}\n{traceback.format_exc()}")
             raise
     
+    def _queue_put_writes(self, pipe, config: RunnableConfig, writes: List[Tuple[str, Any]], task_id: str) -> Optional[str]:
+        thread_id, checkpoint_ns = self._get_thread_and_ns(config)
+        checkpoint_id = config["configurable"].get("checkpoint_id")
+        writes_key = self._make_writes_key(thread_id, checkpoint_ns)
+        
+        for idx, (channel, value) in enumerate(writes):
+            # Los canales especiales (errores, interrupciones) sobrescriben; el resto no
+            write_idx = WRITES_IDX_MAP.get(channel, idx)
+            field = f"{checkpoint_id}|{task_id}|{write_idx}"
+            write_data = self.serializer.dumps({
+                "checkpoint_id": checkpoint_id,
+                "task_id": task_id,
+                "idx": write_idx,
+                "channel": channel,
+                "value": self._serialize_write_value(value),
+            })
+            if write_idx < 0:
+                pipe.hset(writes_key, field, write_data)
+            else:
+                pipe.hsetnx(writes_key, field, write_data)
+        pipe.expire(writes_key, SESSION_TTL_SECONDS)
+        # Las escrituras pendientes forman parte del CheckpointTuple cacheado
+        return self._queue_invalidation(pipe, thread_id, checkpoint_ns, None)
+    
     def put_writes(
         self,
         config: RunnableConfig,
         writes: List[Tuple[str, Any]],
         task_id: str,
+        task_path: str = "",
     ) -> None:
         """
-        Implementación requerida por BaseCheckpointSaver.
-        Por simplicidad, no implementamos writes intermedias.
+        Guarda las escrituras intermedias de una tarea asociadas al checkpoint actual.
+        Permiten retomar un paso interrumpido sin volver a ejecutar las tareas ya completadas.
         """
-        pass
+        try:
+            with self._timed("put_writes", config["configurable"].get("thread_id")):
+                pipe = create_pipeline(self.redis_binary_client)
+                invalidation = self._queue_put_writes(pipe, config, writes, task_id)
+                pipe.execute()
+            self._hot_cache_invalidate(config)
+            if invalidation:
+                self.redis_client.publish(INVALIDATION_CHANNEL, invalidation)
+            
+        except Exception as e:
+            logger.error(f"❌ Error guardando escrituras pendientes: {e}\n{traceback.format_exc()}")
+            raise
     
     def clear_session(self, thread_id: str, checkpoint_ns: str = "default") -> bool:
         """
-        Limpia una sesión específica de Redis.
+        Limpia una sesión específica de Redis (y su copia archivada, si la hay).
         Método personalizado para gestión de sesiones.
         """
         try:
-            redis_key = self._make_redis_key(thread_id, checkpoint_ns)
             metadata_key = self._make_metadata_key(thread_id, checkpoint_ns)
             
-            deleted = self.redis_client.delete(redis_key, metadata_key)
+            deleted = self.redis_client.delete(*self._session_keys(thread_id, checkpoint_ns))
+            self.redis_client.zrem(self._sessions_index_key_for(metadata_key), metadata_key)
+            if self.session_archive is not None and self.session_archive.delete(thread_id, checkpoint_ns):
+                deleted += 1
+            self._known_message_counts.pop((thread_id, checkpoint_ns), None)
+            if self.hot_cache is not None:
+                self.hot_cache.invalidate(thread_id, checkpoint_ns)
+            self.redis_client.publish(INVALIDATION_CHANNEL, self._invalidation_message(thread_id, checkpoint_ns, None))
             logger.info(f"🗑️ Sesión {thread_id} limpiada: {deleted} keys eliminadas")
             return deleted > 0
             
@@ -325,47 +1091,243 @@ class RedisCheckpointer(BaseCheckpointSaver):
         Método personalizado para gestión de sesiones.
         """
         try:
-            metadata_key = self._make_metadata_key(thread_id, checkpoint_ns)
-            metadata_data = self.redis_client.get(metadata_key)
+            keys = self._session_keys(thread_id, checkpoint_ns)
+            pipe = create_pipeline(self.redis_client, transaction=False)
+            pipe.get(keys[1])
+            for key in keys:
+                pipe.memory_usage(key)
+            # MEMORY USAGE puede estar deshabilitado (p. ej. en Redis gestionados): no es fatal
+            metadata_data, *key_sizes = pipe.execute(raise_on_error=False)
             
-            if metadata_data:
-                return json.loads(metadata_data)
+            if isinstance(metadata_data, str):
+                session_info = json.loads(metadata_data)
+                # Memoria real que ocupa la sesión en Redis (todas sus keys, incluido el historial)
+                sizes = [size for size in key_sizes if isinstance(size, int)]
+                if sizes:
+                    session_info["redis_bytes"] = sum(sizes)
+                return session_info
             return None
             
         except Exception as e:
             logger.error(f"Error obteniendo info de sesión {thread_id}: {e}")
             return None
     
+    def get_stats(self) -> Dict[str, Any]:
+        """Estado del checkpointer para /metrics: memoria de Redis, sesiones activas y caché en proceso."""
+        stats: Dict[str, Any] = {
+            "storage_mode": self.storage_mode,
+            "hot_cache": self.hot_cache.stats() if self.hot_cache is not None else None,
+        }
+        try:
+            pipe = create_pipeline(self.redis_client, transaction=False)
+            for index_key in self._sessions_index_keys():
+                pipe.zcard(index_key)
+            stats["indexed_sessions"] = sum(pipe.execute())
+            
+            memory = self.redis_client.info("memory")
+            # En clúster INFO devuelve un dict por nodo
+            nodes = [memory] if "used_memory" in memory else list(memory.values())
+            stats["redis_used_memory_bytes"] = sum(node.get("used_memory", 0) for node in nodes)
+        except Exception as e:
+            logger.warning(f"No se pudieron obtener las estadísticas de Redis: {e}")
+        return stats
+    
     def list_active_sessions(self, limit: int = 100) -> List[Dict[str, Any]]:
         """
-        Lista sesiones activas.
+        Lista sesiones activas, de la más reciente a la más antigua.
         Método personalizado para gestión de sesiones.
         """
         try:
-            pattern = f"{REDIS_PREFIX}:meta:*"
-            sessions = []
-            
-            for key in self.redis_client.scan_iter(match=pattern, count=limit):
-                try:
-                    # Extraer thread_id de la key
-                    key_parts = key.split(":")
-                    if len(key_parts) >= 3:
-                        thread_id = key_parts[2]
-                        
-                        metadata_data = self.redis_client.get(key)
-                        if metadata_data:
-                            metadata = json.loads(metadata_data)
-                            metadata["thread_id"] = thread_id
-                            sessions.append(metadata)
-                            
-                except Exception as e:
-                    logger.warning(f"Error procesando sesión {key}: {e}")
-                    continue
+            index_keys = self._sessions_index_keys()
+            # Limpieza perezosa: una sesión sin guardados en SESSION_TTL_SECONDS ya ha expirado
+            cutoff = time.time() - SESSION_TTL_SECONDS
+            pipe = create_pipeline(self.redis_client, transaction=False)
+            for index_key in index_keys:
+                pipe.zremrangebyscore(index_key, "-inf", cutoff)
+            pipe.execute()
             
-            # Ordenar por fecha de guardado
-            sessions.sort(key=lambda x: x.get("saved_at", ""), reverse=True)
-            return sessions[:limit]
+            while True:
+                # Las `limit` sesiones más recientes de cada shard, mezcladas por fecha de guardado
+                pipe = create_pipeline(self.redis_client, transaction=False)
+                for index_key in index_keys:
+                    pipe.zrevrange(index_key, 0, limit - 1, withscores=True)
+                candidates = sorted(
+                    ((score, index_key, metadata_key)
+                     for index_key, members in zip(index_keys, pipe.execute())
+                     for metadata_key, score in members),
+                    reverse=True,
+                )[:limit]
+                
+                sessions, missing = [], []
+                metadata_values = mget(self.redis_client, [metadata_key for _, _, metadata_key in candidates])
+                for (_, index_key, metadata_key), metadata_data in zip(candidates, metadata_values):
+                    if not metadata_data:
+                        # Borrada o expirada antes de tiempo (p. ej. por evicción de memoria)
+                        missing.append((index_key, metadata_key))
+                        continue
+                    try:
+                        sessions.append(json.loads(metadata_data))
+                    except Exception as e:
+                        logger.warning(f"Error procesando sesión {metadata_key}: {e}")
+                
+                if not missing:
+                    return sessions
+                pipe = create_pipeline(self.redis_client, transaction=False)
+                for index_key, metadata_key in missing:
+                    pipe.zrem(index_key, metadata_key)
+                pipe.execute()
             
         except Exception as e:
             logger.error(f"Error listando sesiones activas: {e}")
-            return []
\ No newline at end of file
+            return []
+    
+    def rebuild_session_index(self) -> int:
+        """
+        Reconstruye el registro de sesiones a partir de las keys de metadata existentes.
+        Recorre el keyspace con SCAN (en clúster, todos los nodos), así que solo se usa como
+        migración, no en cada listado.
+        """
+        try:
+            indexed = 0
+            pipe = create_pipeline(self.redis_client, transaction=False)
+            for key in self.redis_client.scan_iter(match=f"{REDIS_PREFIX}:meta:*", count=1000):
+                ttl = self.redis_client.ttl(key)
+                # Reconstruir el instante del último guardado a partir del TTL restante
+                saved_at = time.time() - (SESSION_TTL_SECONDS - ttl) if ttl and ttl > 0 else time.time()
+                pipe.zadd(self._sessions_index_key_for(key), {key: saved_at})
+                indexed += 1
+            pipe.execute()
+            if indexed:
+                logger.info(f"🗂️ Registro de sesiones reconstruido: {indexed} sesiones indexadas")
+            return indexed
+            
+        except Exception as e:
+            logger.error(f"Error reconstruyendo el registro de sesiones: {e}")
+            return 0
+    
+    def archive_session(self, thread_id: str, checkpoint_ns: str = "default") -> bool:
+        """
+        Mueve una sesión de Redis al almacén frío: guarda un snapshot comprimido de todas sus
+        keys y después las borra, solo si la sesión no ha cambiado entretanto. get_tuple y list
+        la restauran en Redis la siguiente vez que se pide (_rehydrate_session).
+        """
+        if self.session_archive is None:
+            return False
+        keys = self._session_keys(thread_id, checkpoint_ns)
+        head_key, metadata_key, messages_key, writes_key, checkpoints_key, history_key = keys
+        try:
+            pipe = create_pipeline(self.redis_binary_client, transaction=False)
+            pipe.get(head_key)
+            pipe.get(metadata_key)
+            pipe.lrange(messages_key, 0, -1)
+            pipe.hgetall(writes_key)
+            pipe.hgetall(checkpoints_key)
+            pipe.zrange(history_key, 0, -1)
+            head, metadata, messages, writes, checkpoints, history = pipe.execute()
+            
+            if metadata is None:
+                # Expirada o borrada: solo queda quitarla del registro
+                self.redis_client.zrem(self._sessions_index_key_for(metadata_key), metadata_key)
+                return False
+            
+            snapshot = self.archive_serializer.dumps({
+                "format": ARCHIVE_FORMAT_VERSION,
+                "thread_id": thread_id,
+                "checkpoint_ns": checkpoint_ns,
+                "head": head,
+                "metadata": metadata,
+                "messages": messages,
+                # Hashes como listas planas: el códec JSON no admite keys binarias
+                "writes": [item for pair in writes.items() for item in pair],
+                "checkpoints": [item for pair in checkpoints.items() for item in pair],
+                "history": history,
+            })
+            self.session_archive.save(thread_id, checkpoint_ns, snapshot)
+            
+            pipe = create_pipeline(self.redis_binary_client, transaction=False)
+            self._queue_script(pipe, self._delete_archived_script, keys, [metadata, len(writes)])
+            if not pipe.execute()[0]:
+                # Ha habido actividad mientras se archivaba: la sesión sigue siendo caliente
+                self.session_archive.delete(thread_id, checkpoint_ns)
+                logger.debug(f"Sesión {thread_id} modificada durante el archivado, se mantiene en Redis")
+                return False
+            
+            self.redis_client.zrem(self._sessions_index_key_for(metadata_key), metadata_key)
+            self._known_message_counts.pop((thread_id, checkpoint_ns), None)
+            if self.hot_cache is not None:
+                self.hot_cache.invalidate(thread_id, checkpoint_ns)
+            self.redis_client.publish(INVALIDATION_CHANNEL, self._invalidation_message(thread_id, checkpoint_ns, None))
+            logger.info(f"🧊 Sesión {thread_id} archivada: {len(snapshot)} bytes, {len(history)} checkpoints")
+            return True
+            
+        except Exception as e:
+            logger.error(f"Error archivando sesión {thread_id}: {e}\n{traceback.format_exc()}")
+            return False
+    
+    def archive_idle_sessions(self, idle_seconds: int = SESSION_ARCHIVE_IDLE_MINUTES * 60, limit: int = 500) -> int:
+        """
+        Archiva las sesiones del registro sin actividad en los últimos `idle_seconds`
+        (como mucho `limit` por shard). Devuelve el nº de sesiones archivadas.
+        """
+        if self.session_archive is None:
+            return 0
+        try:
+            cutoff = time.time() - idle_seconds
+            archived = 0
+            for index_key in self._sessions_index_keys():
+                for metadata_key in self.redis_client.zrangebyscore(index_key, "-inf", cutoff, start=0, num=limit):
+                    if self.archive_session(*self._parse_metadata_key(metadata_key)):
+                        archived += 1
+            if archived:
+                logger.info(f"🧊 {archived} sesiones inactivas archivadas")
+            return archived
+            
+        except Exception as e:
+            logger.error(f"Error archivando sesiones inactivas: {e}")
+            return 0
+    
+    def _load_archived(self, thread_id: str, checkpoint_ns: str) -> Optional[Dict[str, Any]]:
+        """Lee el snapshot archivado de una sesión (None si no hay o el almacén no responde)."""
+        try:
+            payload = self.session_archive.load(thread_id, checkpoint_ns)
+            return self.archive_serializer.loads(payload) if payload else None
+        except Exception as e:
+            logger.error(f"Error leyendo la sesión archivada {thread_id}: {e}")
+            return None
+    
+    def _queue_restore(self, pipe, thread_id: str, checkpoint_ns: str, snapshot: Dict[str, Any]) -> None:
+        """Encola la restauración en Redis de un snapshot archivado, con TTL y en el registro."""
+        keys = self._session_keys(thread_id, checkpoint_ns)
+        head_key, metadata_key, messages_key, writes_key, checkpoints_key, history_key = keys
+        for key in keys:
+            # Una a una: los pipelines de clúster no admiten DEL de varias keys
+            pipe.delete(key)
+        if snapshot["head"]:
+            pipe.setex(head_key, SESSION_TTL_SECONDS, snapshot["head"])
+        pipe.setex(metadata_key, SESSION_TTL_SECONDS, snapshot["metadata"])
+        if snapshot["messages"]:
+            pipe.rpush(messages_key, *snapshot["messages"])
+        for key, flat in ((writes_key, snapshot["writes"]), (checkpoints_key, snapshot["checkpoints"])):
+            if flat:
+                pipe.hset(key, mapping=dict(zip(flat[::2], flat[1::2])))
+        if snapshot["history"]:
+            pipe.zadd(history_key, {checkpoint_id: 0 for checkpoint_id in snapshot["history"]})
+        for key in (messages_key, writes_key, checkpoints_key, history_key):
+            pipe.expire(key, SESSION_TTL_SECONDS)
+        pipe.zadd(self._sessions_index_key_for(metadata_key), {metadata_key: time.time()})
+    
+    def _finish_rehydrate(self, thread_id: str, checkpoint_ns: str) -> None:
+        # La copia de Redis pasa a ser la buena: la archivada quedaría obsoleta con el próximo put
+        self.session_archive.delete(thread_id, checkpoint_ns)
+        logger.info(f"🔥 Sesión {thread_id} restaurada desde el archivo")
+    
+    def _rehydrate_session(self, thread_id: str, checkpoint_ns: str) -> bool:
+        """Restaura en Redis una sesión archivada. Devuelve False si no estaba archivada."""
+        snapshot = self._load_archived(thread_id, checkpoint_ns)
+        if snapshot is None:
+            return False
+        pipe = create_pipeline(self.redis_binary_client)
+        self._queue_restore(pipe, thread_id, checkpoint_ns, snapshot)
+        pipe.execute()
+        self._finish_rehydrate(thread_id, checkpoint_ns)
+        return True
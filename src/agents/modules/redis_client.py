@@ -0,0 +1,69 @@
+from typing import Any, Union
+
+import redis
+import redis.asyncio as aioredis
+from redis.cluster import RedisCluster
+from redis.asyncio.cluster import RedisCluster as AsyncRedisCluster
+
+from .config import REDIS_CONNECTION_POOL_CONFIG, REDIS_CLUSTER_ENABLED
+
+import logging
+logger = logging.getLogger(__name__)
+
+# Opciones del pool que no aplican a RedisCluster (gestiona un pool por nodo, siempre db 0)
+_CLUSTER_IGNORED_OPTIONS = ("db", "retry_on_timeout")
+
+
+def cluster_tag(value: str) -> str:
+    """
+    Envuelve `value` en un hash tag de Redis Cluster ({...}) para que todas las keys que lo
+    contienen caigan en el mismo slot. Fuera del modo clúster devuelve el valor tal cual,
+    así las keys de un Redis de un solo nodo no cambian.
+    """
+    return f"{{{value}}}" if REDIS_CLUSTER_ENABLED else value
+
+
+def _client_options(decode_responses: bool, overrides: dict) -> dict:
+    options = {**REDIS_CONNECTION_POOL_CONFIG, "decode_responses": decode_responses, **overrides}
+    if REDIS_CLUSTER_ENABLED:
+        for option in _CLUSTER_IGNORED_OPTIONS:
+            options.pop(option, None)
+    return options
+
+
+def create_redis_client(decode_responses: bool = True, **overrides: Any) -> Union[redis.Redis, RedisCluster]:
+    """
+    Crea un cliente Redis síncrono: RedisCluster si REDIS_CLUSTER_ENABLED (descubre el resto
+    de nodos a partir de REDIS_HOST:REDIS_PORT y sigue las redirecciones MOVED/ASK durante
+    un resharding) o un cliente con pool de conexiones contra un único nodo.
+    """
+    options = _client_options(decode_responses, overrides)
+    if REDIS_CLUSTER_ENABLED:
+        return RedisCluster(**options)
+    return redis.Redis(connection_pool=redis.ConnectionPool(**options))
+
+
+def create_async_redis_client(decode_responses: bool = True, **overrides: Any) -> Union[aioredis.Redis, AsyncRedisCluster]:
+    """Equivalente de create_redis_client sobre redis.asyncio."""
+    options = _client_options(decode_responses, overrides)
+    if REDIS_CLUSTER_ENABLED:
+        return AsyncRedisCluster(**options)
+    return aioredis.Redis(connection_pool=aioredis.ConnectionPool(**options))
+
+
+def create_pipeline(client: Any, transaction: bool = True) -> Any:
+    """
+    Crea un pipeline. En clúster se usa siempre sin MULTI/EXEC: un pipeline puede tocar
+    keys de varios slots (p. ej. la sesión y el registro de sesiones) y los comandos se
+    agrupan por nodo.
+    """
+    return client.pipeline(transaction=transaction and not REDIS_CLUSTER_ENABLED)
+
+
+def mget(client: Any, keys: list) -> list:
+    """MGET que en clúster reparte las keys por slot (mget_nonatomic)."""
+    if not keys:
+        return []
+    if REDIS_CLUSTER_ENABLED:
+        return client.mget_nonatomic(keys)
+    return client.mget(keys)
@@ -0,0 +1,190 @@
+import json
+import math
+import time
+import uuid
+import operator
+import threading
+import traceback
+from typing import Dict, Any, Optional, List
+
+import redis
+
+from .config import (
+    REDIS_PREFIX,
+    OLLAMA_BASE_URL,
+    OLLAMA_MODEL_NAME,
+    EMBEDDING_MODEL,
+    EMBEDDING_READ_TIMEOUT,
+    SEMANTIC_CACHE_THRESHOLD,
+    SEMANTIC_CACHE_TTL_SECONDS,
+    SEMANTIC_CACHE_MAX_ENTRIES,
+)
+from .http_client import get_upstream_client
+from .redis_client import create_redis_client, create_pipeline, cluster_tag
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+def get_embedding(text: str) -> List[float]:
+    """Obtiene el embedding de un texto usando Ollama."""
+    ollama_client = get_upstream_client("ollama", OLLAMA_BASE_URL, EMBEDDING_READ_TIMEOUT)
+    response = ollama_client.post(
+        "/api/embeddings",
+        json={"model": EMBEDDING_MODEL, "prompt": text},
+        idempotent=True,
+    )
+    response.raise_for_status()
+    return response.json()["embedding"]
+
+
+def _normalize(vector: List[float]) -> List[float]:
+    norm = math.sqrt(sum(v * v for v in vector))
+    return [v / norm for v in vector] if norm else vector
+
+
+class SemanticCache:
+    """
+    Caché semántica de respuestas finales del agente almacenada en Redis.
+
+    Cada entrada guarda (embedding de la pregunta, respuesta final, ids de chunk del RAG,
+    consultas RAG usadas). Las entradas viven en keys con TTL y un índice ZSET por fecha
+    de creación. Cada proceso mantiene una copia local de los embeddings que solo se
+    recarga cuando cambia el contador de versión, así una búsqueda cuesta un GET a Redis
+    más el cálculo del embedding de la pregunta.
+    """
+
+    def __init__(
+        self,
+        redis_client: Optional[redis.Redis] = None,
+        namespace: str = OLLAMA_MODEL_NAME,
+        threshold: float = SEMANTIC_CACHE_THRESHOLD,
+        ttl_seconds: int = SEMANTIC_CACHE_TTL_SECONDS,
+        max_entries: int = SEMANTIC_CACHE_MAX_ENTRIES,
+    ):
+        self.redis_client = redis_client or create_redis_client()
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+
+        # Las respuestas dependen del modelo: cada modelo tiene su propio espacio de claves
+        # (en Redis Cluster, todas en el mismo slot gracias al hash tag)
+        self._prefix = f"{REDIS_PREFIX}:semcache:{cluster_tag(namespace)}"
+        self._index_key = f"{self._prefix}:index"
+        self._version_key = f"{self._prefix}:version"
+
+        self._lock = threading.Lock()
+        self._local_version = None
+        self._local_entries: Dict[str, Dict[str, Any]] = {}
+
+        self.redis_client.ping()
+        logger.info(f"✅ SemanticCache inicializada (umbral={threshold}, ttl={ttl_seconds}s)")
+
+    def _entry_key(self, entry_id: str) -> str:
+        return f"{self._prefix}:entry:{entry_id}"
+
+    def _refresh_local_index(self) -> None:
+        """Recarga los embeddings locales si otra réplica (o este proceso) ha escrito entradas."""
+        version = self.redis_client.get(self._version_key)
+        if version == self._local_version:
+            return
+
+        entry_ids = self.redis_client.zrange(self._index_key, 0, -1)
+        entries: Dict[str, Dict[str, Any]] = {}
+        expired = []
+        if entry_ids:
+            raw_entries = self.redis_client.mget([self._entry_key(entry_id) for entry_id in entry_ids])
+            for entry_id, raw in zip(entry_ids, raw_entries):
+                if not raw:
+                    expired.append(entry_id)
+                    continue
+                entry = json.loads(raw)
+                entry["embedding"] = _normalize(entry["embedding"])
+                entries[entry_id] = entry
+        if expired:
+            self.redis_client.zrem(self._index_key, *expired)
+
+        with self._lock:
+            self._local_entries = entries
+            self._local_version = version
+        logger.debug(f"SemanticCache: índice local recargado con {len(entries)} entradas")
+
+    def lookup(self, question: str) -> Optional[Dict[str, Any]]:
+        """
+        Busca la entrada más parecida a la pregunta. Devuelve la entrada (con 'similarity')
+        si supera el umbral, o None. Cualquier error se trata como fallo de caché.
+        """
+        try:
+            self._refresh_local_index()
+            if not self._local_entries:
+                return None
+
+            query_vector = _normalize(get_embedding(question))
+            now = time.time()
+            best_entry, best_score = None, -1.0
+            for entry in self._local_entries.values():
+                if entry.get("expires_at", 0) < now:
+                    continue
+                score = sum(map(operator.mul, query_vector, entry["embedding"]))
+                if score > best_score:
+                    best_entry, best_score = entry, score
+
+            if best_entry is None or best_score < self.threshold:
+                logger.debug("SemanticCache MISS (mejor similitud %.3f)", best_score, extra={"step": "fast_path"})
+                return None
+
+            logger.info("🎯 SemanticCache HIT (similitud %.3f) para: '%.80s'", best_score, question, extra={"step": "fast_path"})
+            return {**best_entry, "similarity": best_score}
+
+        except Exception as e:
+            logger.warning(f"⚠️ Error consultando la caché semántica: {e}")
+            return None
+
+    def store(self, question: str, answer: str, chunk_ids: List[str], rag_queries: List[Dict[str, Any]]) -> bool:
+        """Guarda una respuesta final junto con las fuentes del RAG que la respaldan."""
+        try:
+            embedding = get_embedding(question)
+            entry_id = uuid.uuid4().hex
+            now = time.time()
+            entry = {
+                "id": entry_id,
+                "question": question,
+                "answer": answer,
+                "chunk_ids": sorted(set(chunk_ids)),
+                "rag_queries": rag_queries,
+                "embedding": embedding,
+                "created_at": now,
+                "expires_at": now + self.ttl_seconds,
+            }
+
+            pipe = create_pipeline(self.redis_client)
+            pipe.setex(self._entry_key(entry_id), self.ttl_seconds, json.dumps(entry, ensure_ascii=False))
+            pipe.zadd(self._index_key, {entry_id: now})
+            pipe.zremrangebyscore(self._index_key, "-inf", now - self.ttl_seconds)
+            pipe.incr(self._version_key)
+            pipe.execute()
+
+            # Acotar el número de entradas eliminando las más antiguas
+            overflow = self.redis_client.zcard(self._index_key) - self.max_entries
+            if overflow > 0:
+                evicted = self.redis_client.zpopmin(self._index_key, overflow)
+                if evicted:
+                    self.redis_client.delete(*[self._entry_key(entry_id) for entry_id, _ in evicted])
+
+            logger.info("💾 SemanticCache: respuesta guardada para '%.80s' (%d chunks)", question, len(entry['chunk_ids']))
+            return True
+
+        except Exception as e:
+            logger.warning(f"⚠️ No se pudo guardar en la caché semántica: {e}\n{traceback.format_exc()}")
+            return False
+
+    def invalidate(self, entry_id: str) -> None:
+        """Elimina una entrada cuyas fuentes han cambiado."""
+        try:
+            pipe = create_pipeline(self.redis_client)
+            pipe.delete(self._entry_key(entry_id))
+            pipe.zrem(self._index_key, entry_id)
+            pipe.incr(self._version_key)
+            pipe.execute()
+        except Exception as e:
+            logger.warning(f"⚠️ No se pudo invalidar la entrada {entry_id} de la caché semántica: {e}")
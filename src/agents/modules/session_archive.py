@@ -0,0 +1,116 @@
+import os
+import hashlib
+import tempfile
+from datetime import datetime, timezone
+from typing import Optional
+
+from .config import SESSION_ARCHIVE_BACKEND, SESSION_ARCHIVE_DIR, SESSION_ARCHIVE_DB_URL
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class FileSessionArchive:
+    """
+    Almacén frío en disco: un fichero por sesión con el snapshot ya serializado y comprimido.
+    Los nombres son un hash de thread_id + checkpoint_ns, y las escrituras son atómicas
+    (fichero temporal + rename), así un archivado a medias nunca deja un snapshot corrupto.
+    """
+
+    def __init__(self, directory: str = SESSION_ARCHIVE_DIR):
+        self.directory = directory
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, thread_id: str, checkpoint_ns: str) -> str:
+        digest = hashlib.sha256(f"{thread_id}\0{checkpoint_ns}".encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, f"{digest}.bin")
+
+    def save(self, thread_id: str, checkpoint_ns: str, payload: bytes) -> None:
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(payload)
+            os.replace(tmp_path, self._path(thread_id, checkpoint_ns))
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def load(self, thread_id: str, checkpoint_ns: str) -> Optional[bytes]:
+        try:
+            with open(self._path(thread_id, checkpoint_ns), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def delete(self, thread_id: str, checkpoint_ns: str) -> bool:
+        try:
+            os.unlink(self._path(thread_id, checkpoint_ns))
+            return True
+        except FileNotFoundError:
+            return False
+
+
+class PostgresSessionArchive:
+    """Almacén frío en PostgreSQL: tabla con una fila (payload binario) por sesión."""
+
+    def __init__(self, db_url: str = SESSION_ARCHIVE_DB_URL, table_name: str = "agent_session_archive"):
+        from sqlalchemy import create_engine, MetaData, Table, Column, String, DateTime, LargeBinary
+
+        self.engine = create_engine(db_url, pool_pre_ping=True, pool_size=2, max_overflow=4, echo=False)
+        self.metadata = MetaData()
+        self.table = Table(
+            table_name,
+            self.metadata,
+            Column("thread_id", String(255), primary_key=True),
+            Column("checkpoint_ns", String(255), primary_key=True),
+            Column("archived_at", DateTime(timezone=True), nullable=False, index=True),
+            Column("payload", LargeBinary, nullable=False),
+        )
+        self.metadata.create_all(self.engine)
+        logger.info(f"Tabla {table_name} verificada/creada")
+
+    def save(self, thread_id: str, checkpoint_ns: str, payload: bytes) -> None:
+        from sqlalchemy.dialects.postgresql import insert
+
+        stmt = insert(self.table).values(
+            thread_id=thread_id,
+            checkpoint_ns=checkpoint_ns,
+            archived_at=datetime.now(timezone.utc),
+            payload=payload,
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["thread_id", "checkpoint_ns"],
+            set_={"archived_at": stmt.excluded.archived_at, "payload": stmt.excluded.payload},
+        )
+        with self.engine.begin() as conn:
+            conn.execute(stmt)
+
+    def load(self, thread_id: str, checkpoint_ns: str) -> Optional[bytes]:
+        from sqlalchemy import select
+
+        stmt = select(self.table.c.payload).where(
+            self.table.c.thread_id == thread_id,
+            self.table.c.checkpoint_ns == checkpoint_ns,
+        )
+        with self.engine.connect() as conn:
+            payload = conn.execute(stmt).scalar()
+        return bytes(payload) if payload is not None else None
+
+    def delete(self, thread_id: str, checkpoint_ns: str) -> bool:
+        stmt = self.table.delete().where(
+            self.table.c.thread_id == thread_id,
+            self.table.c.checkpoint_ns == checkpoint_ns,
+        )
+        with self.engine.begin() as conn:
+            return conn.execute(stmt).rowcount > 0
+
+
+def create_session_archive(backend: str = SESSION_ARCHIVE_BACKEND):
+    """Crea el almacén frío configurado en SESSION_ARCHIVE_BACKEND (None si es "none")."""
+    if backend == "none":
+        return None
+    if backend == "file":
+        return FileSessionArchive()
+    if backend == "postgres":
+        return PostgresSessionArchive()
+    raise ValueError(f"Backend de archivado de sesiones no soportado: {backend}")
@@ -5,9 +5,34 @@ import logging
 
 logger = logging.getLogger(__name__)
 
+# --- Consumo de tokens del LLM ---
+# Contadores que se suman llamada a llamada; max_prompt_tokens guarda el mayor contexto visto
+LLM_USAGE_SUM_FIELDS = ("llm_calls", "estimated_calls", "prompt_tokens", "completion_tokens", "prefill_ms", "generation_ms")
+
+def add_llm_usage(current: Optional[dict], update: Optional[dict]) -> dict:
+    """Reducer de `llm_usage`: acumula el consumo de cada llamada al LLM en el total del thread."""
+    merged = dict(current or {})
+    for key in LLM_USAGE_SUM_FIELDS:
+        if update and key in update:
+            merged[key] = round(merged.get(key, 0) + update[key], 3)
+    if update and update.get("max_prompt_tokens") is not None:
+        merged["max_prompt_tokens"] = max(merged.get("max_prompt_tokens", 0), update["max_prompt_tokens"])
+    return merged
+
+def summarize_llm_usage(usage: Optional[dict]) -> dict:
+    """Completa un acumulado de `llm_usage` con los ratios: tokens/s de generación y de prefill."""
+    summary = {key: (usage or {}).get(key, 0) for key in LLM_USAGE_SUM_FIELDS + ("max_prompt_tokens",)}
+    summary["tokens_per_second"] = round(summary["completion_tokens"] / (summary["generation_ms"] / 1000), 2) if summary["generation_ms"] else None
+    # Las llamadas cortadas en streaming no traen prompt_tokens: con alguna estimada el ratio no es fiable
+    exact_prefill = summary["prefill_ms"] and summary["prompt_tokens"] and not summary["estimated_calls"]
+    summary["prefill_tokens_per_second"] = round(summary["prompt_tokens"] / (summary["prefill_ms"] / 1000), 2) if exact_prefill else None
+    return summary
+
 # --- Definición del Estado del Agente ---
 class AgentState(TypedDict):
     messages: Annotated[list[AnyMessage], operator.add]
+    # Consumo acumulado del LLM en el thread (ver add_llm_usage)
+    llm_usage: Annotated[dict, add_llm_usage]
     # Memoria para el flujo de reserva del gimnasio
     gym_slot_iso_to_book: Optional[str]         # YYYY-MM-DDTHH:MM:SS slot ofrecido/confirmado
     user_name_for_gym_booking: Optional[str]
@@ -33,7 +58,11 @@ def update_state_after_llm(state: AgentState) -> AgentState:
     para actualizar el estado de la reserva.
     Este nodo se ejecuta DESPUÉS de call_llm_node y ANTES de should_invoke_tool_router.
     """
-    logger.debug(f"  [UpdateStateAfterLLM] Estado actual: gym_slot='{state.get('gym_slot_iso_to_book')}', user_name='{state.get('user_name_for_gym_booking')}', pending_confirm='{state.get('pending_gym_slot_confirmation')}'")
+    logger.debug(
+        "  [UpdateStateAfterLLM] Estado actual: gym_slot='%s', user_name='%s', pending_confirm='%s'",
+        state.get('gym_slot_iso_to_book'), state.get('user_name_for_gym_booking'), state.get('pending_gym_slot_confirmation'),
+        extra={"step": "update_state_after_llm"},
+    )
     
     # Analizar el último mensaje del usuario si el LLM está pidiendo información
     # o si el LLM acaba de presentar opciones de disponibilidad.
@@ -59,7 +88,7 @@ def update_state_after_llm(state: AgentState) -> AgentState:
             # Esto es una simplificación, una mejor manera sería usar extracción de entidades
             # o que el LLM confirme "Entendido, tu nombre es X. ¿Correcto?"
             if last_human_msg_content:
-                logger.info(f"    [UpdateStateAfterLLM] Usuario podría haber proporcionado nombre: '{last_human_msg_content}'")
+                logger.info("    [UpdateStateAfterLLM] Usuario podría haber proporcionado nombre: '%s'", last_human_msg_content, extra={"step": "update_state_after_llm"})
                 state['user_name_for_gym_booking'] = last_human_msg_content.strip()
                 user_provides_name = True
 
@@ -69,7 +98,7 @@ def update_state_after_llm(state: AgentState) -> AgentState:
            ("desea reservar este horario" in last_ai_msg.content.lower() or "quieres este horario" in last_ai_msg.content.lower()):
             if "sí" in last_human_msg_content.lower() or "si" in last_human_msg_content.lower() or \
                "confirmo" in last_human_msg_content.lower() or "vale" in last_human_msg_content.lower():
-                logger.info(f"    [UpdateStateAfterLLM] Usuario parece confirmar el slot pendiente.")
+                logger.info("    [UpdateStateAfterLLM] Usuario parece confirmar el slot pendiente.", extra={"step": "update_state_after_llm"})
                 user_confirms_slot = True
                 # Si también dieron el nombre en el mismo mensaje de confirmación
                 # (ej. "Sí, soy Carlos Portilla"), el código anterior ya lo habría capturado.
@@ -78,14 +107,18 @@ def update_state_after_llm(state: AgentState) -> AgentState:
     # podríamos quitar pending_gym_slot_confirmation para que el LLM proceda a book_gym_slot.
     # Pero dejaremos que el LLM tome esa decisión final basado en el scratchpad actualizado.
     
-    logger.info(f"  [UpdateStateAfterLLM] Estado después de actualizar: gym_slot='{state.get('gym_slot_iso_to_book')}', user_name='{state.get('user_name_for_gym_booking')}', pending_confirm='{state.get('pending_gym_slot_confirmation')}'")
+    logger.info(
+        "  [UpdateStateAfterLLM] Estado después de actualizar: gym_slot='%s', user_name='%s', pending_confirm='%s'",
+        state.get('gym_slot_iso_to_book'), state.get('user_name_for_gym_booking'), state.get('pending_gym_slot_confirmation'),
+        extra={"step": "update_state_after_llm"},
+    )
     return state
 
 def update_state_after_tool(state: AgentState, check_gym_availability, book_gym_slot) -> AgentState:
     """Actualiza el estado basado en el resultado de la herramienta."""
     last_message = state['messages'][-1]
     if isinstance(last_message, ToolMessage):
-        logger.debug(f"  [UpdateStateAfterTool] Procesando ToolMessage de '{last_message.name}'")
+        logger.debug("  [UpdateStateAfterTool] Procesando ToolMessage de '%s'", last_message.name, extra={"step": "update_state_after_tool"})
         if last_message.name == check_gym_availability.name:
             # Parsear el resultado de check_gym_availability para ver si se ofreció un slot específico
             # y si estaba disponible.
@@ -111,7 +144,10 @@ def update_state_after_tool(state: AgentState, check_gym_availability, book_gym_
                          # Esto es complejo porque la herramienta devuelve una lista.
                          # Por ahora, simplemente marcamos que estamos esperando confirmación.
                          # El LLM debe presentar los slots y el usuario elegir.
-                        logger.info(f"    [UpdateStateAfterTool] check_gym_availability tuvo éxito. Poniendo pending_gym_slot_confirmation=True. Slot consultado: {queried_date}")
+                        logger.info(
+                            "    [UpdateStateAfterTool] check_gym_availability tuvo éxito. Poniendo pending_gym_slot_confirmation=True. Slot consultado: %s",
+                            queried_date, extra={"step": "update_state_after_tool"},
+                        )
                         state['pending_gym_slot_confirmation'] = True
                         state['gym_slot_iso_to_book'] = queried_date # Tentativamente, el LLM debe confirmar cuál de los devueltos
                 else:
@@ -119,17 +155,21 @@ def update_state_after_tool(state: AgentState, check_gym_availability, book_gym_
                     state['pending_gym_slot_confirmation'] = True # Aún así, el LLM presentará opciones
 
             elif "No hay horarios disponibles" in tool_content:
-                logger.info("    [UpdateStateAfterTool] check_gym_availability no encontró slots. Limpiando estado de reserva.")
+                logger.info("    [UpdateStateAfterTool] check_gym_availability no encontró slots. Limpiando estado de reserva.", extra={"step": "update_state_after_tool"})
                 state['gym_slot_iso_to_book'] = None
                 state['pending_gym_slot_confirmation'] = False
                 # user_name_for_gym_booking se mantiene por si el usuario quiere probar otra fecha.
 
         elif last_message.name == book_gym_slot.name:
-            logger.info("    [UpdateStateAfterTool] book_gym_slot fue llamado. Limpiando estado de reserva.")
+            logger.info("    [UpdateStateAfterTool] book_gym_slot fue llamado. Limpiando estado de reserva.", extra={"step": "update_state_after_tool"})
             # Limpiar el estado después de un intento de reserva (exitoso o no)
             state['gym_slot_iso_to_book'] = None
             state['user_name_for_gym_booking'] = None # Podríamos mantenerlo si queremos, pero mejor limpiar
             state['pending_gym_slot_confirmation'] = False
     
-    logger.info(f"  [UpdateStateAfterTool] Estado después de actualizar: gym_slot='{state.get('gym_slot_iso_to_book')}', user_name='{state.get('user_name_for_gym_booking')}', pending_confirm='{state.get('pending_gym_slot_confirmation')}'")
+    logger.info(
+        "  [UpdateStateAfterTool] Estado después de actualizar: gym_slot='%s', user_name='%s', pending_confirm='%s'",
+        state.get('gym_slot_iso_to_book'), state.get('user_name_for_gym_booking'), state.get('pending_gym_slot_confirmation'),
+        extra={"step": "update_state_after_tool"},
+    )
     return state 
\ No newline at end of file
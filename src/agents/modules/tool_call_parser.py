@@ -0,0 +1,134 @@
+import json
+import uuid
+from typing import Any, Dict, Iterable, List, Optional
+
+import logging
+logger = logging.getLogger(__name__)
+
+THINK_OPEN = "<think>"
+THINK_CLOSE = "</think>"
+MAX_CANDIDATE_CHARS = 20000  # Un objeto JSON más largo no es una llamada a herramienta razonable
+
+
+def _normalize_tool_call(obj: Any, known_tools: Optional[set]) -> Optional[Dict[str, Any]]:
+    """
+    Convierte un objeto JSON con formato de llamada a herramienta al formato de LangChain.
+    Acepta {"tool", "tool_input"} (el del prompt) y {"name", "arguments"/"args"}.
+    """
+    if not isinstance(obj, dict):
+        return None
+    tool_name = obj.get("name") or obj.get("tool")
+    tool_args = obj.get("arguments", obj.get("tool_input", obj.get("args")))
+    if isinstance(tool_args, str):
+        try:
+            tool_args = json.loads(tool_args)
+        except json.JSONDecodeError:
+            return None
+    if not isinstance(tool_name, str) or not isinstance(tool_args, dict):
+        return None
+    if known_tools is not None and tool_name not in known_tools:
+        return None
+    return {"name": tool_name, "args": tool_args, "id": f"llm_tc_{uuid.uuid4().hex}"}
+
+
+class ToolCallStreamParser:
+    """
+    Extractor incremental de llamadas a herramientas escritas como JSON en el contenido del LLM.
+
+    Se alimenta con fragmentos de texto a medida que llegan los tokens (`feed`) y devuelve las
+    llamadas completas en cuanto se cierra su objeto JSON. Ignora los bloques <think>...</think>,
+    respeta las llaves dentro de strings y admite varios objetos en el mismo mensaje.
+    Cada carácter se procesa una sola vez salvo los de un candidato que resulta no ser JSON válido.
+    """
+
+    def __init__(self, known_tools: Optional[Iterable[str]] = None):
+        self.known_tools = set(known_tools) if known_tools is not None else None
+        self.tool_calls: List[Dict[str, Any]] = []
+        self._pending = ""        # Texto recibido aún no consumido (posible etiqueta partida)
+        self._in_think = False
+        self._candidate: List[str] = []
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+
+    def feed(self, text: str) -> List[Dict[str, Any]]:
+        """Procesa un nuevo fragmento y devuelve las llamadas completadas en él."""
+        found: List[Dict[str, Any]] = []
+        data = self._pending + text
+        self._pending = ""
+        i = 0
+
+        while i < len(data):
+            if self._depth == 0:
+                tag = THINK_CLOSE if self._in_think else THINK_OPEN
+                if data[i] == "<":
+                    if data.startswith(tag, i):
+                        self._in_think = not self._in_think
+                        i += len(tag)
+                        continue
+                    if tag.startswith(data[i:]):
+                        # Etiqueta cortada entre dos fragmentos: esperar al siguiente
+                        self._pending = data[i:]
+                        break
+                if self._in_think:
+                    next_lt = data.find("<", i + 1)
+                    i = next_lt if next_lt != -1 else len(data)
+                    continue
+                if data[i] == "{":
+                    self._candidate = ["{"]
+                    self._depth = 1
+                    self._in_string = self._escape = False
+                i += 1
+                continue
+
+            char = data[i]
+            self._candidate.append(char)
+            i += 1
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                continue
+            if char == '"':
+                self._in_string = True
+            elif char == "{":
+                self._depth += 1
+            elif char == "}":
+                self._depth -= 1
+                if self._depth == 0:
+                    candidate = "".join(self._candidate)
+                    self._candidate = []
+                    tool_call = self._parse_candidate(candidate)
+                    if tool_call:
+                        self.tool_calls.append(tool_call)
+                        found.append(tool_call)
+                    else:
+                        # No era una llamada válida: reanalizar lo que seguía a la primera llave
+                        data = candidate[1:] + data[i:]
+                        i = 0
+                    continue
+
+            if len(self._candidate) > MAX_CANDIDATE_CHARS:
+                logger.debug("ToolCallStreamParser: candidato demasiado largo, se descarta")
+                data = "".join(self._candidate[1:]) + data[i:]
+                i = 0
+                self._candidate = []
+                self._depth = 0
+
+        return found
+
+    def _parse_candidate(self, candidate: str) -> Optional[Dict[str, Any]]:
+        try:
+            return _normalize_tool_call(json.loads(candidate), self.known_tools)
+        except json.JSONDecodeError:
+            return None
+
+
+def extract_tool_calls(text: str, known_tools: Optional[Iterable[str]] = None) -> List[Dict[str, Any]]:
+    """Extrae todas las llamadas a herramientas de un texto completo."""
+    parser = ToolCallStreamParser(known_tools)
+    parser.feed(text)
+    return parser.tool_calls
@@ -4,15 +4,79 @@ from datetime import datetime, timezone
 from langchain_core.tools import tool
 import requests
 import json
+import hashlib
+import re
+from typing import Any, List, Optional, Tuple
 
-from .config import RAG_SERVICE_URL, GYM_API_URL, OLLAMA_MODEL_NAME
-from .metriclogger import MetricLogger
+from .config import RAG_SERVICE_URL, GYM_API_URL, OLLAMA_MODEL_NAME, RAG_READ_TIMEOUT, GYM_API_READ_TIMEOUT
+from .metriclogger import get_metric_logger
+from .http_client import get_upstream_client
+from .availability_cache import AvailabilityCache
 
 import logging
 logger = logging.getLogger(__name__)
 
-# Inicializar metric logger
-metric_logger = MetricLogger()
+# Clientes HTTP compartidos (pool keep-alive, reintentos y circuit breaker por upstream)
+rag_client = get_upstream_client("rag", RAG_SERVICE_URL, RAG_READ_TIMEOUT)
+gym_client = get_upstream_client("gym", GYM_API_URL, GYM_API_READ_TIMEOUT)
+
+# Caché TTL corta de /availability compartida por todas las conversaciones del proceso
+availability_cache = AvailabilityCache()
+
+# Identificador estable de un chunk del RAG (se incluye en la salida de la herramienta)
+CHUNK_ID_PATTERN = re.compile(r"Id: ([0-9a-f]{16})\)")
+
+def rag_chunk_id(doc: dict) -> str:
+    """Calcula un id estable para un chunk a partir de su fuente, posición y contenido."""
+    raw = f"{doc.get('filename', '')}|{doc.get('chunk_index', 0)}|{doc.get('text', '')}"
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:16]
+
+def extract_rag_chunk_ids(tool_content: str) -> List[str]:
+    """Extrae los ids de chunk de la salida formateada de external_rag_search_tool."""
+    return CHUNK_ID_PATTERN.findall(tool_content or "")
+
+def _rag_search(query: str, limit: int = 3, score_threshold: float = 0.3) -> dict:
+    """Llama al endpoint /search del servicio RAG y devuelve el JSON de respuesta."""
+    payload = {"query": query, "limit": limit, "score_threshold": score_threshold}
+    # /search es de solo lectura: se puede reintentar aunque sea POST
+    response = rag_client.post("/search", json=payload, idempotent=True)
+    response.raise_for_status()
+    return response.json()
+
+def fetch_rag_chunk_ids(query: str, limit: int = 3, score_threshold: float = 0.3) -> Optional[List[str]]:
+    """
+    Devuelve los ids de los chunks que el RAG recupera hoy para una consulta.
+    Se usa para validar que las fuentes de una respuesta cacheada no han cambiado.
+    Devuelve None si el servicio RAG no está disponible.
+    """
+    try:
+        search_data = _rag_search(query, limit, score_threshold)
+        return [rag_chunk_id(doc) for doc in search_data.get("results", [])]
+    except Exception as e:
+        logger.warning(f"⚠️ No se pudieron obtener los chunks del RAG para validar la caché: {e}")
+        return None
+
+def _get_availability(service_name: str, start_time: str) -> Tuple[int, Any]:
+    """
+    Consulta /availability pasando por la caché TTL con coalescing de peticiones.
+    Devuelve (status_code, cuerpo): el JSON si la respuesta es 200, el texto en otro caso.
+    Solo se cachean las respuestas 200.
+    """
+    def fetch() -> Tuple[int, Any]:
+        payload = {"service_name": service_name, "start_time": start_time}
+        headers = {"Content-Type": "application/json"}
+        response = gym_client.post("/availability", json=payload, headers=headers, idempotent=True)
+        if response.status_code == 200:
+            return response.status_code, response.json()
+        return response.status_code, response.text
+
+    return availability_cache.get_or_fetch(service_name, start_time, fetch, cacheable=lambda result: result[0] == 200)
+
+def _log_tool_metric(tool_name: str, execution_time: float, status: str) -> None:
+    """Registra la duración de una herramienta: métrica única `tool_duration` con labels tool y status."""
+    get_metric_logger().log_metric(
+        datetime.now(timezone.utc), OLLAMA_MODEL_NAME, "tool_duration", execution_time, labels={"tool": tool_name, "status": status}
+    )
 
 # --- HERRAMIENTAS ---
 @tool
@@ -26,35 +90,30 @@ def external_rag_search_tool(query: str, limit: int = 3, score_threshold: float
     start_time = time.time()  # ✅ INICIO MÉTRICA
     
     try:
-        logger.info(f"🛠️ Herramienta RAG Externa llamada con: query='{query}', limit={limit}, threshold={score_threshold}")
-        search_endpoint = f"{RAG_SERVICE_URL}/search"
-        payload = {"query": query, "limit": limit, "score_threshold": score_threshold}
-        
-        response = requests.post(search_endpoint, json=payload, timeout=45)
-        response.raise_for_status()
-        search_data = response.json()
+        logger.info("🛠️ Herramienta RAG Externa llamada con: query='%s', limit=%s, threshold=%s", query, limit, score_threshold, extra={"step": "tool", "tool": "external_rag_search_tool"})
+        search_data = _rag_search(query, limit, score_threshold)
         
         if search_data and "results" in search_data and search_data["results"]:
             context_parts = [
-                f"[Resultado {i+1}] Fuente: {doc.get('filename', 'Fuente desconocida')} (Relevancia: {doc.get('score', 0.0):.2f})\nContenido: {doc.get('text', 'Contenido no disponible')}\n---"
+                f"[Resultado {i+1}] Fuente: {doc.get('filename', 'Fuente desconocida')} (Relevancia: {doc.get('score', 0.0):.2f}, Id: {rag_chunk_id(doc)})\nContenido: {doc.get('text', 'Contenido no disponible')}\n---"
                 for i, doc in enumerate(search_data["results"])
             ]
             retrieved_info = "No se encontró información relevante en la base de conocimientos para tu consulta." if not context_parts else "Información recuperada de la base de conocimientos:\n\n" + "\n".join(context_parts)
-            logger.info(f"✅ Servicio RAG devolvió {search_data.get('total_results', 0)} resultados.")
+            logger.info("✅ Servicio RAG devolvió %s resultados.", search_data.get('total_results', 0), extra={"step": "tool", "tool": "external_rag_search_tool"})
         else:
             retrieved_info = "El servicio RAG no devolvió resultados válidos o la respuesta estaba vacía."
             logger.warning(f"⚠️ Servicio RAG: sin resultados o formato inesperado para query '{query}'. Respuesta: {search_data}")
             
         # ✅ REGISTRAR MÉTRICA EXITOSA
         execution_time = time.time() - start_time
-        metric_logger.log_metric(datetime.now(timezone.utc), OLLAMA_MODEL_NAME, "tool_rag", execution_time)
+        _log_tool_metric("external_rag_search_tool", execution_time, "ok")
         
-        logger.info(f"📤 Herramienta RAG devolviendo (primeros 200 chars): {retrieved_info[:200]}...")
+        logger.info("📤 Herramienta RAG devolviendo (primeros 200 chars): %.200s...", retrieved_info, extra={"step": "tool", "tool": "external_rag_search_tool"})
         return retrieved_info
         
     except requests.exceptions.HTTPError as http_err:
         execution_time = time.time() - start_time
-        
+        _log_tool_metric("external_rag_search_tool", execution_time, "error")
         error_details_str = http_err.response.text
         try:
             error_details_str = json.dumps(http_err.response.json())
@@ -66,14 +125,14 @@ def external_rag_search_tool(query: str, limit: int = 3, score_threshold: float
         
     except requests.exceptions.RequestException as req_err:
         execution_time = time.time() - start_time
-        
+        _log_tool_metric("external_rag_search_tool", execution_time, "error")
         logger.error(f"❌ Error de red llamando a RAG: {req_err}")
         retrieved_info = f"Error al conectar con RAG (Red): {str(req_err)}"
         return retrieved_info
         
     except Exception as e:
         execution_time = time.time() - start_time
-        
+        _log_tool_metric("external_rag_search_tool", execution_time, "error")
         logger.error(f"❌ Error inesperado en RAG: {e}\n{traceback.format_exc()}")
         retrieved_info = f"Error inesperado en RAG: {str(e)}"
         return retrieved_info
@@ -91,15 +150,10 @@ def check_gym_availability(target_date: str) -> str:
     start_time = time.time()  # ✅ INICIO MÉTRICA
     
     try:
-        logger.info(f"🛠️ Herramienta Check Gym Availability llamada con: target_date='{target_date}'")
-        url = f"{GYM_API_URL}/availability"
-        payload = {"service_name": "gimnasio", "start_time": target_date}
-        headers = {"Content-Type": "application/json"}
-        
-        response = requests.post(url, json=payload, headers=headers, timeout=15)
+        logger.info("🛠️ Herramienta Check Gym Availability llamada con: target_date='%s'", target_date, extra={"step": "tool", "tool": "check_gym_availability"})
+        status_code, slots_data = _get_availability("gimnasio", target_date)
         
-        if response.status_code == 200:
-            slots_data = response.json()
+        if status_code == 200:
             if isinstance(slots_data, list) and slots_data:
                 start_times = [slot.get("start_time") for slot in slots_data if slot.get("start_time")][:5]
                 if start_times:
@@ -114,24 +168,24 @@ def check_gym_availability(target_date: str) -> str:
             else:
                 response_message = f"Respuesta inesperada del API de disponibilidad (no es una lista de slots o está malformada): {json.dumps(slots_data)[:200]}"
         else:
-            logger.warning(f"Check Gym Availability: API devolvió {response.status_code}. Respuesta: {response.text[:200]}")
-            response_message = f"No se pudo verificar la disponibilidad para el gimnasio en {target_date} (código: {response.status_code}). Respuesta API: {response.text[:200]}"
+            logger.warning(f"Check Gym Availability: API devolvió {status_code}. Respuesta: {slots_data[:200]}")
+            response_message = f"No se pudo verificar la disponibilidad para el gimnasio en {target_date} (código: {status_code}). Respuesta API: {slots_data[:200]}"
         
         # ✅ REGISTRAR MÉTRICA EXITOSA
         execution_time = time.time() - start_time
-        metric_logger.log_metric(datetime.now(timezone.utc), OLLAMA_MODEL_NAME, "tool_availability", execution_time)
+        _log_tool_metric("check_gym_availability", execution_time, "ok")
         
         return response_message
         
     except requests.exceptions.RequestException as e:
         execution_time = time.time() - start_time
-        
+        _log_tool_metric("check_gym_availability", execution_time, "error")
         logger.error(f"❌ Error de red en Check Gym Availability: {e}")
         return f"Error de red al verificar disponibilidad del gimnasio: {str(e)}"
         
     except Exception as e:
         execution_time = time.time() - start_time
-        
+        _log_tool_metric("check_gym_availability", execution_time, "error")
         logger.error(f"❌ Error inesperado en Check Gym Availability: {e}\n{traceback.format_exc()}")
         return f"Error inesperado al verificar disponibilidad del gimnasio: {str(e)}"
 
@@ -148,17 +202,16 @@ def book_gym_slot(booking_date: str, user_name: str) -> str:
     start_time = time.time()  # ✅ INICIO MÉTRICA
     
     try:
-        logger.info(f"🛠️ Herramienta Book Gym Slot llamada para {user_name} en {booking_date}.")
-        avail_url = f"{GYM_API_URL}/availability"
-        avail_payload = {"service_name": "gimnasio", "start_time": booking_date}
+        logger.info("🛠️ Herramienta Book Gym Slot llamada para %s en %s.", user_name, booking_date, extra={"step": "tool", "tool": "book_gym_slot"})
         headers = {"Content-Type": "application/json"}
         slot_id_to_book = None
         
-        logger.debug(f"Verificando disponibilidad exacta para {booking_date} antes de reservar...")
-        avail_response = requests.post(avail_url, json=avail_payload, headers=headers, timeout=15)
+        # El slot_id es estable: se resuelve desde la caché si hay una consulta reciente.
+        # La API de reservas sigue validando el aforo (409 si está lleno).
+        logger.debug("Verificando disponibilidad exacta para %s antes de reservar...", booking_date, extra={"step": "tool", "tool": "book_gym_slot"})
+        avail_status, slots = _get_availability("gimnasio", booking_date)
         
-        if avail_response.status_code == 200:
-            slots = avail_response.json()
+        if avail_status == 200:
             if not isinstance(slots, list):
                 logger.error(f"Respuesta de disponibilidad para {booking_date} no fue una lista: {slots}")
                 response_message = f"No se pudo confirmar la disponibilidad del horario {booking_date} (formato de respuesta incorrecto)."
@@ -166,7 +219,7 @@ def book_gym_slot(booking_date: str, user_name: str) -> str:
                 for slot in slots:
                     if slot.get("start_time") == booking_date:
                         slot_id_to_book = slot.get("slot_id")
-                        logger.info(f"Slot ID {slot_id_to_book} encontrado para {booking_date}.")
+                        logger.info("Slot ID %s encontrado para %s.", slot_id_to_book, booking_date, extra={"step": "tool", "tool": "book_gym_slot"})
                         break
                         
                 if not slot_id_to_book:
@@ -177,14 +230,17 @@ def book_gym_slot(booking_date: str, user_name: str) -> str:
                                       f"Por favor, primero verifica la disponibilidad general con 'check_gym_availability'.")
                 else:
                     # Intentar hacer la reserva
-                    logger.info(f"Intentando reservar slot ID {slot_id_to_book} para {user_name}...")
-                    book_url = f"{GYM_API_URL}/booking"
+                    logger.info("Intentando reservar slot ID %s para %s...", slot_id_to_book, user_name, extra={"step": "tool", "tool": "book_gym_slot"})
                     booking_payload = {"slot_id": slot_id_to_book, "guest_name": user_name}
-                    book_response = requests.post(book_url, json=booking_payload, headers=headers, timeout=15)
+                    # La reserva tiene efectos secundarios: nunca se reintenta
+                    book_response = gym_client.post("/booking", json=booking_payload, headers=headers, idempotent=False)
+                    if book_response.status_code in (201, 409):
+                        # La ocupación del día ha cambiado (o la caché estaba desfasada)
+                        availability_cache.invalidate("gimnasio", booking_date)
                     
                     if book_response.status_code == 201:
                         booking_data = book_response.json()
-                        logger.info(f"Reserva exitosa: {booking_data}")
+                        logger.info("Reserva exitosa: %s", booking_data, extra={"step": "tool", "tool": "book_gym_slot"})
                         response_message = (f"Reserva exitosa para {booking_data.get('guest_name')} en el gimnasio. "
                                           f"ID de la reserva: {booking_data.get('booking_id', 'No proporcionado')}, Slot ID: {booking_data.get('slot_id')}, Hora: {booking_date}.")
                     elif book_response.status_code == 409:
@@ -194,24 +250,24 @@ def book_gym_slot(booking_date: str, user_name: str) -> str:
                         logger.error(f"Fallo la reserva (código {book_response.status_code}): {book_response.text[:200]}")
                         response_message = f"Fallo la reserva del gimnasio (código {book_response.status_code}): {book_response.text[:200]}"
         else:
-            logger.error(f"No se pudo verificar la disponibilidad antes de reservar (código: {avail_response.status_code}). Respuesta: {avail_response.text[:200]}")
-            response_message = f"No se pudo confirmar la disponibilidad del horario {booking_date} antes de intentar la reserva (Error API: {avail_response.status_code})."
+            logger.error(f"No se pudo verificar la disponibilidad antes de reservar (código: {avail_status}). Respuesta: {slots[:200]}")
+            response_message = f"No se pudo confirmar la disponibilidad del horario {booking_date} antes de intentar la reserva (Error API: {avail_status})."
         
         # ✅ REGISTRAR MÉTRICA EXITOSA
         execution_time = time.time() - start_time
-        metric_logger.log_metric(datetime.now(timezone.utc), OLLAMA_MODEL_NAME, "tool_booking", execution_time)
+        _log_tool_metric("book_gym_slot", execution_time, "ok")
         
         return response_message
         
     except requests.exceptions.RequestException as e:
         execution_time = time.time() - start_time
-        
+        _log_tool_metric("book_gym_slot", execution_time, "error")
         logger.error(f"❌ Error de red en Book Gym Slot: {e}")
         return f"Error de red al intentar reservar el gimnasio: {str(e)}"
         
     except Exception as e:
         execution_time = time.time() - start_time
-        
+        _log_tool_metric("book_gym_slot", execution_time, "error")
         logger.error(f"❌ Error inesperado en Book Gym Slot: {e}\n{traceback.format_exc()}")
         return f"Error inesperado al intentar reservar el gimnasio: {str(e)}"
 
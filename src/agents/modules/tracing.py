@@ -0,0 +1,175 @@
+import os
+import json
+import time
+import secrets
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from typing import Any, Dict, Iterator, List, Optional
+
+from observability.tracing import TRACEPARENT_HEADER, parse_traceparent
+
+from .config import TRACING_ENABLED, TRACING_SERVICE_NAME, TRACING_EXPORTER, TRACING_FILE
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class Span:
+    """
+    Span con el modelo de datos de OpenTelemetry (trace_id de 16 bytes, span_id de 8 bytes
+    en hex, tiempos en ns desde epoch, atributos y eventos). Se propaga entre servicios
+    con la cabecera W3C `traceparent`.
+    """
+
+    __slots__ = ("name", "trace_id", "span_id", "parent_span_id", "attributes", "events", "status", "start_ns", "end_ns")
+
+    def __init__(self, name: str, trace_id: str, parent_span_id: Optional[str] = None, attributes: Optional[Dict[str, Any]] = None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_span_id = parent_span_id
+        self.attributes: Dict[str, Any] = dict(attributes or {})
+        self.events: List[Dict[str, Any]] = []
+        self.status = "OK"
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def add_event(self, name: str, **attributes: Any) -> None:
+        self.events.append({"name": name, "time_unix_nano": time.time_ns(), "attributes": attributes})
+
+    def to_dict(self) -> Dict[str, Any]:
+        end_ns = self.end_ns or time.time_ns()
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_span_id": self.parent_span_id,
+            "name": self.name,
+            "service": TRACING_SERVICE_NAME,
+            "start_time_unix_nano": self.start_ns,
+            "end_time_unix_nano": end_ns,
+            "duration_ms": round((end_ns - self.start_ns) / 1e6, 3),
+            "status": self.status,
+            "attributes": self.attributes,
+            "events": self.events,
+        }
+
+
+class _NoopSpan:
+    """Span vacío que se devuelve con TRACING_ENABLED=false: las llamadas no hacen nada."""
+
+    trace_id = None
+    span_id = None
+    traceparent = None
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        pass
+
+    def add_event(self, name: str, **attributes: Any) -> None:
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class FileSpanExporter:
+    """Escribe cada span terminado como una línea JSON (JSONL) para analizarlo offline."""
+
+    def __init__(self, path: str = TRACING_FILE):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._file = open(path, "a", encoding="utf-8")
+        self._lock = threading.Lock()
+
+    def export(self, span: Span, flush: bool = False) -> None:
+        line = json.dumps(span.to_dict(), ensure_ascii=False, default=str)
+        with self._lock:
+            self._file.write(line + "\n")
+            # Se vuelca al disco al cerrar cada span raíz (uno por petición), no en cada span
+            if flush:
+                self._file.flush()
+
+
+def create_span_exporter(exporter: str = TRACING_EXPORTER):
+    """Crea el exportador configurado en TRACING_EXPORTER (None si es "none")."""
+    if exporter == "none":
+        return None
+    if exporter == "file":
+        return FileSpanExporter()
+    raise ValueError(f"Exportador de trazas no soportado: {exporter}")
+
+
+_exporter = create_span_exporter() if TRACING_ENABLED else None
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+@contextmanager
+def start_span(name: str, traceparent: Optional[str] = None, **attributes: Any) -> Iterator[Any]:
+    """
+    Abre un span hijo del span activo (o de `traceparent` si llega de otro servicio, o una
+    traza nueva si no hay ninguno) y lo deja como activo mientras dura el bloque. Los
+    contextvars siguen a los nodos del grafo aunque LangGraph los ejecute en otro hilo.
+    """
+    if not TRACING_ENABLED:
+        yield NOOP_SPAN
+        return
+
+    parent = _current_span.get()
+    remote = parse_traceparent(traceparent) if parent is None else None
+    if parent is not None:
+        span = Span(name, parent.trace_id, parent.span_id, attributes)
+    elif remote is not None:
+        span = Span(name, remote[0], remote[1], attributes)
+    else:
+        span = Span(name, secrets.token_hex(16), None, attributes)
+
+    token = _current_span.set(span)
+    try:
+        yield span
+    except BaseException as e:
+        span.status = "ERROR"
+        span.set_attribute("exception.type", type(e).__name__)
+        span.set_attribute("exception.message", str(e)[:500])
+        raise
+    finally:
+        _current_span.reset(token)
+        span.end_ns = time.time_ns()
+        if _exporter is not None:
+            try:
+                _exporter.export(span, flush=parent is None)
+            except Exception as e:
+                logger.warning(f"⚠️ No se pudo exportar el span {name}: {e}")
+
+
+def traced(name: str):
+    """Decorador: ejecuta la función dentro de un span `name` (p. ej. los nodos del grafo)."""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with start_span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def inject_trace_headers(headers: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+    """Añade la cabecera traceparent del span activo a `headers` (copia) para propagar la traza."""
+    headers = dict(headers or {})
+    span = _current_span.get()
+    if span is not None:
+        headers[TRACEPARENT_HEADER] = span.traceparent
+    return headers
@@ -0,0 +1,82 @@
+"""
+Pruebas del fast-path de RagAgent: nunca debe responder por su cuenta en mitad de una
+reserva del gimnasio.
+
+Uso (desde la raíz del repositorio):
+    python -m pytest src/agents/tests
+"""
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+
+from src.agents.modules.agent import RagAgent
+from src.agents.modules.intent_router import CANNED_RESPONSES
+
+
+@pytest.fixture
+def agent():
+    # Sin __init__: ni LLM ni Redis, solo lo que usa el fast-path
+    agent = object.__new__(RagAgent)
+    agent._tools_map = {"check_gym_availability": None, "book_gym_slot": None, "external_rag_search_tool": None}
+    agent._semantic_cache = None
+    return agent
+
+
+def gym_turn():
+    return [
+        HumanMessage(content="¿Hay hueco en el gimnasio mañana?"),
+        AIMessage(content="", tool_calls=[{"name": "check_gym_availability", "args": {"target_date": "2026-10-20T08:00:00"}, "id": "tc_1"}]),
+        ToolMessage(content="Slots libres: 10:00, 11:00", tool_call_id="tc_1", name="check_gym_availability"),
+        AIMessage(content="Hay hueco a las 10:00 y a las 11:00. ¿Te reservo alguno?"),
+    ]
+
+
+def rag_turn():
+    return [
+        HumanMessage(content="¿A qué hora es el desayuno?"),
+        AIMessage(content="", tool_calls=[{"name": "external_rag_search_tool", "args": {"query": "desayuno"}, "id": "tc_2"}]),
+        ToolMessage(content="El desayuno es de 7 a 11.", tool_call_id="tc_2", name="external_rag_search_tool"),
+        AIMessage(content="El desayuno se sirve de 7:00 a 11:00."),
+    ]
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "vale, muchas gracias",  # agradecimiento canned
+        "¿y hay plazas libres en el gimnasio hoy a las 18:00?",  # llamada directa a la herramienta
+        "¿A qué hora es el check-in?",  # consulta al RAG
+    ],
+)
+def test_fast_path_never_intercepts_a_booking_in_progress(agent, text):
+    state = {"messages": gym_turn() + [HumanMessage(content=text)]}
+    assert agent._in_booking_flow(state)
+    assert agent.fast_path_node(state) == {"messages": []}
+    assert agent.fast_path_router(state) == "call_llm"
+
+
+def test_fast_path_answers_outside_a_booking(agent):
+    state = {"messages": rag_turn() + [HumanMessage(content="vale, muchas gracias")]}
+    assert not agent._in_booking_flow(state)
+    update = agent.fast_path_node(state)
+    assert [m.content for m in update["messages"]] == [CANNED_RESPONSES["agradecimiento"]]
+
+
+def test_booking_flow_ends_with_the_next_user_turn(agent):
+    # El turno del gimnasio ya no es el anterior: el fast-path vuelve a actuar
+    messages = gym_turn() + [HumanMessage(content="No, gracias"), AIMessage(content="De acuerdo.")]
+    state = {"messages": messages + [HumanMessage(content="¿A qué hora es el check-in?")]}
+    assert not agent._in_booking_flow(state)
+    tool_call = agent.fast_path_node(state)["messages"][0].tool_calls[0]
+    assert tool_call["name"] == "external_rag_search_tool"
+
+
+def test_booking_flags_also_block_the_fast_path(agent):
+    state = {"messages": [HumanMessage(content="Hola")], "pending_gym_slot_confirmation": True}
+    assert agent.fast_path_node(state) == {"messages": []}
+
+
+def test_semantic_cache_uses_the_same_guard(agent):
+    state = {"messages": gym_turn() + [HumanMessage(content="¿A qué hora es el check-in?")]}
+    assert not agent._is_cacheable_question(state)
+    state = {"messages": rag_turn() + [HumanMessage(content="¿A qué hora es el check-in?")]}
+    assert agent._is_cacheable_question(state)
@@ -0,0 +1,86 @@
+"""
+Pruebas de AvailabilityCache (modules/availability_cache.py): TTL, single-flight e
+invalidación por reservas.
+
+Uso (desde la raíz del repositorio):
+    python -m pytest src/agents/tests
+"""
+import threading
+
+from src.agents.modules.availability_cache import AvailabilityCache
+
+SLOT = "2026-10-20T10:00:00"
+
+
+def run_in_thread(target):
+    result = {}
+    thread = threading.Thread(target=lambda: result.setdefault("value", target()))
+    thread.start()
+    return thread, result
+
+
+def test_hit_after_first_fetch_and_invalidation_by_day():
+    cache = AvailabilityCache(ttl_seconds=60)
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        return len(calls)
+
+    assert cache.get_or_fetch("gimnasio", SLOT, fetch) == 1
+    assert cache.get_or_fetch("gimnasio", SLOT, fetch) == 1
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    # Una reserva de otra hora del mismo día invalida la entrada; otro día u otro servicio no
+    assert cache.invalidate("gimnasio", "2026-10-21T10:00:00") == 0
+    assert cache.invalidate("sauna", SLOT) == 0
+    assert cache.invalidate("gimnasio", "2026-10-20T18:00:00") == 1
+    assert cache.get_or_fetch("gimnasio", SLOT, fetch) == 2
+
+
+def test_concurrent_requests_share_one_fetch():
+    cache = AvailabilityCache(ttl_seconds=60)
+    release = threading.Event()
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        release.wait(5)
+        return "slots"
+
+    threads = [run_in_thread(lambda: cache.get_or_fetch("gimnasio", SLOT, fetch)) for _ in range(5)]
+    release.set()
+    for thread, result in threads:
+        thread.join(5)
+        assert result["value"] == "slots"
+    assert len(calls) == 1
+
+
+def test_invalidation_during_fetch_is_not_lost():
+    """Una reserva que invalida el día mientras la petición está en curso: su respuesta no se guarda."""
+    cache = AvailabilityCache(ttl_seconds=60)
+    fetching, release = threading.Event(), threading.Event()
+
+    def stale_fetch():
+        fetching.set()
+        release.wait(5)
+        return "antes de la reserva"
+
+    leader, result = run_in_thread(lambda: cache.get_or_fetch("gimnasio", SLOT, stale_fetch))
+    assert fetching.wait(5)
+    cache.invalidate("gimnasio", SLOT)
+    release.set()
+    leader.join(5)
+
+    # Quien preguntó antes de la reserva recibe la respuesta de entonces, pero no queda en caché
+    assert result["value"] == "antes de la reserva"
+    assert cache.get_or_fetch("gimnasio", SLOT, lambda: "después de la reserva") == "después de la reserva"
+    assert cache.get_or_fetch("gimnasio", SLOT, lambda: "no se llama") == "después de la reserva"
+    assert cache._generations == {}
+
+
+def test_failed_or_uncacheable_fetches_are_not_stored():
+    cache = AvailabilityCache(ttl_seconds=60)
+    assert cache.get_or_fetch("gimnasio", SLOT, lambda: (503, None), cacheable=lambda r: r[0] == 200) == (503, None)
+    assert cache.get_or_fetch("gimnasio", SLOT, lambda: (200, ["10:00"]), cacheable=lambda r: r[0] == 200) == (200, ["10:00"])
+    assert cache.misses == 2
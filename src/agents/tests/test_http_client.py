@@ -0,0 +1,166 @@
+"""
+Pruebas del circuit breaker de los clientes HTTP de los upstreams (modules/http_client.py).
+
+Uso (desde la raíz del repositorio):
+    python -m pytest src/agents/tests
+"""
+import pytest
+import requests
+
+from src.agents.modules import http_client
+from src.agents.modules.http_client import CircuitBreaker, CircuitOpenError, UpstreamClient
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(http_client.time, "monotonic", clock)
+    return clock
+
+
+@pytest.fixture
+def breaker(clock):
+    return CircuitBreaker(failure_threshold=3, reset_timeout=30, probe_timeout=10)
+
+
+def open_breaker(breaker):
+    for _ in range(breaker.failure_threshold):
+        assert breaker.allow_request()
+        breaker.record_failure()
+    assert breaker.state == "open"
+
+
+def test_opens_after_threshold_consecutive_failures(breaker):
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success()  # un éxito reinicia la cuenta
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == "closed" and breaker.allow_request()
+
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert not breaker.allow_request()
+
+
+def test_half_open_after_cooldown_lets_a_single_probe_through(breaker, clock):
+    open_breaker(breaker)
+    clock.advance(29)
+    assert not breaker.allow_request()
+
+    clock.advance(1)
+    assert breaker.allow_request()
+    assert breaker.state == "half_open"
+    assert not breaker.allow_request()  # la prueba sigue en curso
+
+
+def test_successful_probe_closes_the_breaker(breaker, clock):
+    open_breaker(breaker)
+    clock.advance(30)
+    assert breaker.allow_request()
+    breaker.record_success()
+    assert breaker.state == "closed"
+    assert all(breaker.allow_request() for _ in range(5))
+
+
+def test_failed_probe_reopens_for_another_cooldown(breaker, clock):
+    open_breaker(breaker)
+    clock.advance(30)
+    assert breaker.allow_request()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    clock.advance(29)
+    assert not breaker.allow_request()
+    clock.advance(1)
+    assert breaker.allow_request()
+
+
+def test_probe_without_result_is_replaced_after_probe_timeout(breaker, clock):
+    open_breaker(breaker)
+    clock.advance(30)
+    assert breaker.allow_request()  # esta prueba nunca registra resultado
+    clock.advance(9)
+    assert not breaker.allow_request()
+    clock.advance(1)
+    assert breaker.allow_request()
+    assert not breaker.allow_request()
+
+
+class FakeSession:
+    """Sustituye a requests.Session: cada petición consume el siguiente resultado (excepción o status)."""
+
+    def __init__(self, outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = 0
+
+    def request(self, method, url, **kwargs):
+        self.calls += 1
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, BaseException):
+            raise outcome
+        response = requests.Response()
+        response.status_code = outcome
+        return response
+
+
+@pytest.fixture
+def client(clock, monkeypatch):
+    monkeypatch.setattr(http_client.time, "sleep", lambda seconds: None)
+    client = UpstreamClient("test", "http://upstream", read_timeout=1, max_retries=0)
+    client.breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30, probe_timeout=10)
+    return client
+
+
+def test_timed_out_probe_reopens_the_breaker(client, clock):
+    client.session = FakeSession([requests.exceptions.ConnectionError(), 503, requests.exceptions.ReadTimeout()])
+    with pytest.raises(requests.exceptions.ConnectionError):
+        client.get("/availability")
+    assert client.get("/availability").status_code == 503
+    assert client.breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        client.get("/availability")
+    assert client.session.calls == 2
+
+    clock.advance(30)
+    with pytest.raises(requests.exceptions.ReadTimeout):
+        client.get("/availability")
+    assert client.breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        client.get("/availability")
+
+
+def test_non_retryable_request_error_on_probe_reopens_the_breaker(client, clock):
+    client.session = FakeSession([503, 503, requests.exceptions.ChunkedEncodingError(), requests.exceptions.InvalidHeader()])
+    client.get("/a"), client.get("/a")
+    assert client.breaker.state == "open"
+
+    clock.advance(30)
+    with pytest.raises(requests.exceptions.ChunkedEncodingError):
+        client.get("/a")
+    assert client.breaker.state == "open"
+
+    clock.advance(30)
+    with pytest.raises(requests.exceptions.InvalidHeader):
+        client.get("/a")
+    assert client.breaker.state == "open"
+
+
+def test_successful_probe_closes_the_client_breaker(client, clock):
+    client.session = FakeSession([503, 503, 200, 200])
+    client.get("/a"), client.get("/a")
+    assert client.breaker.state == "open"
+    clock.advance(30)
+    assert client.get("/a").status_code == 200
+    assert client.breaker.state == "closed"
+    assert client.get("/a").status_code == 200
@@ -0,0 +1,89 @@
+"""
+Pruebas del clasificador de intenciones del fast-path (modules/intent_router.py).
+
+Uso (desde la raíz del repositorio):
+    python -m pytest src/agents/tests
+"""
+from datetime import datetime
+
+import pytest
+
+from src.agents.modules.intent_router import CANNED_RESPONSES, MAX_FAST_PATH_WORDS, classify_intent, is_booking_related
+
+NOW = datetime(2026, 10, 19, 9, 30)
+
+
+@pytest.mark.parametrize(
+    "text, intent",
+    [
+        ("Hola", "saludo"),
+        ("¡Buenos días!", "saludo"),
+        ("vale, muchas gracias", "agradecimiento"),
+        ("Gracias Lola por tu ayuda", "agradecimiento"),
+        ("Adiós", "despedida"),
+    ],
+)
+def test_canned_intents_answer_directly(text, intent):
+    match = classify_intent(text, now=NOW)
+    assert match.intent == intent
+    assert match.confidence >= 0.9
+    assert match.response == CANNED_RESPONSES[intent]
+    assert match.tool_name is None
+
+
+@pytest.mark.parametrize(
+    "text, target_date",
+    [
+        ("¿Hay disponibilidad en el gimnasio mañana a las 10?", "2026-10-20T10:00:00"),
+        ("gym libre hoy a las 7 de la tarde", "2026-10-19T19:00:00"),
+        ("¿Quedan plazas en el gimnasio pasado mañana a las 18:30?", "2026-10-21T18:30:00"),
+        ("horarios del gimnasio el 2026-10-25", "2026-10-25T08:00:00"),
+    ],
+)
+def test_gym_availability_calls_the_tool(text, target_date):
+    match = classify_intent(text, now=NOW)
+    assert match.intent == "disponibilidad_gimnasio"
+    assert match.confidence >= 0.8
+    assert match.tool_name == "check_gym_availability"
+    assert match.tool_args == {"target_date": target_date}
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "Quiero reservar el gimnasio mañana a las 10",  # las reservas siempre las gestiona el LLM
+        "¿Hay hueco en el gimnasio?",  # sin fecha
+        "¿hay sitio en el gimnasio mañana a las 25:00?",  # hora imposible
+    ],
+)
+def test_gym_messages_without_a_clear_query_go_to_the_llm(text):
+    match = classify_intent(text, now=NOW)
+    assert match.intent == "gimnasio"
+    assert match.confidence < 0.8
+    assert match.tool_name is None and match.response is None
+
+
+def test_hotel_questions_use_the_rag():
+    match = classify_intent("¿A qué hora es el check-in?", now=NOW)
+    assert match.intent == "informacion_hotel"
+    assert match.confidence >= 0.8
+    assert match.tool_name == "external_rag_search_tool"
+    assert match.tool_args == {"query": "¿A qué hora es el check-in?"}
+
+    # Sin forma de pregunta la confianza no basta para saltarse el LLM
+    assert classify_intent("mascotas", now=NOW).confidence < 0.8
+    # Cancelar una reserva no es una consulta informativa
+    assert classify_intent("quiero cancelar el desayuno", now=NOW).intent == "desconocida"
+
+
+@pytest.mark.parametrize("text", ["", "   ", "sí", "vale", "a nombre de Ana García", "word " * (MAX_FAST_PATH_WORDS + 1) + "gimnasio"])
+def test_unknown_messages_have_zero_confidence(text):
+    match = classify_intent(text, now=NOW)
+    assert match.intent == "desconocida"
+    assert match.confidence == 0.0
+
+
+def test_is_booking_related():
+    assert is_booking_related("¿Puedo reservar el GYM?")
+    assert is_booking_related("cancela mi reserva")
+    assert not is_booking_related("¿Hay parking?")
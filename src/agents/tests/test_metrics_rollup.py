@@ -0,0 +1,139 @@
+"""
+Pruebas de los rollups de métricas (modules/metrics_rollup.py) y del descarte de valores no
+finitos en MetricLogger, sobre SQLite.
+
+Uso (desde la raíz del repositorio):
+    python -m pytest src/agents/tests
+"""
+import math
+import random
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import MetaData, create_engine
+
+from src.agents.modules.metriclogger import MetricLogger
+from src.agents.modules.metrics_rollup import ZERO_BIN, LogBinning, MetricsRollup
+
+START = datetime(2026, 10, 19, 9, 0, tzinfo=timezone.utc)
+END = START + timedelta(hours=1)
+
+
+@pytest.fixture
+def rollup(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'metrics.db'}")
+    metadata = MetaData()
+    rollup = MetricsRollup(engine, metadata, "metrics", LogBinning(0.01))
+    metadata.create_all(engine)
+    yield rollup
+    engine.dispose()
+
+
+def add(rollup, values, metric="latency_ms", start=START, spacing=timedelta(seconds=1), sample_rate=1.0):
+    rows = [
+        {"timestamp": start + i * spacing, "llm": "qwen", "metric": metric, "value": value, "labels": "", "sample_rate": sample_rate}
+        for i, value in enumerate(values)
+    ]
+    with rollup.engine.begin() as conn:
+        rollup.add_rows(conn, rows)
+
+
+def exact_quantile(values, q):
+    # Mismo rango que MetricsRollup._quantile: el elemento floor(q * (n - 1)) de los valores ordenados
+    return sorted(values)[math.floor(q * (len(values) - 1))]
+
+
+@pytest.mark.parametrize("relative_accuracy", [0.01, 0.02, 0.05])
+def test_log_binning_relative_error_bound(relative_accuracy):
+    binning = LogBinning(relative_accuracy)
+    for value in [1e-6, 0.003, 0.5, 1.0, 1.7, 42.0, 999.9, 123456.0, 9.8e12]:
+        estimate = binning.value(binning.bin(value))
+        assert abs(estimate - value) <= relative_accuracy * value * (1 + 1e-9)
+    assert binning.bin(0) == binning.bin(-3.5) == ZERO_BIN
+    assert binning.value(ZERO_BIN) == 0.0
+
+
+@pytest.mark.parametrize("resolution", ["1m", "1h"])
+def test_quantiles_within_relative_accuracy(rollup, resolution):
+    rng = random.Random(7)
+    # Latencias lognormales repartidas en 50 minutos: varios buckets se suman en la consulta
+    values = [rng.lognormvariate(5, 1.2) for _ in range(3000)]
+    add(rollup, values, spacing=timedelta(seconds=1))
+
+    result = rollup.query("latency_ms", START, END, quantiles=(0.01, 0.25, 0.5, 0.9, 0.95, 0.99, 1.0), resolution=resolution)
+    assert result["count"] == len(values)
+    assert result["min"] == pytest.approx(min(values))
+    assert result["max"] == pytest.approx(max(values))
+    assert result["avg"] == pytest.approx(sum(values) / len(values))
+    for q in (0.01, 0.25, 0.5, 0.9, 0.95, 0.99, 1.0):
+        exact = exact_quantile(values, q)
+        assert abs(result[f"p{q * 100:g}"] - exact) <= 0.01 * exact * (1 + 1e-9), q
+
+
+def test_empty_range_has_no_quantiles(rollup):
+    add(rollup, [10.0, 20.0])
+    result = rollup.query("latency_ms", START + timedelta(days=1), END + timedelta(days=1), resolution="1m")
+    assert result["count"] == 0
+    assert result["avg"] is None and result["min"] is None and result["max"] is None
+    assert result["p50"] is None and result["p99"] is None
+    assert rollup.query("otra_metrica", START, END, resolution="1m")["p50"] is None
+
+
+def test_single_sample_is_returned_exactly(rollup):
+    add(rollup, [123.4])
+    result = rollup.query("latency_ms", START, END, resolution="1m")
+    assert result["count"] == 1
+    # El punto medio del bin se acota a [min, max]: con una muestra es el valor exacto
+    assert result["p50"] == result["p95"] == result["p99"] == result["min"] == result["max"] == pytest.approx(123.4)
+
+
+def test_zero_values_use_the_zero_bin(rollup):
+    values = [0.0, 0.0, 0.0, 5.0]
+    add(rollup, values)
+    result = rollup.query("latency_ms", START, END, quantiles=(0.5, 0.99, 1.0), resolution="1m")
+    assert result["p50"] == result["p99"] == exact_quantile(values, 0.99) == 0.0
+    assert result["p100"] == pytest.approx(5.0)
+
+
+def test_sampled_rows_are_weighted(rollup):
+    add(rollup, [10.0] * 50, sample_rate=0.1)
+    result = rollup.query("latency_ms", START, END, resolution="1m")
+    assert result["count"] == 500
+    assert result["sum"] == pytest.approx(5000.0)
+    assert result["p50"] == pytest.approx(10.0)
+
+
+@pytest.fixture
+def metric_logger(tmp_path, monkeypatch):
+    # MetricLogger es un singleton con el engine compartido: uno nuevo por prueba
+    monkeypatch.setattr(MetricLogger, "_instance", None)
+    monkeypatch.setattr(MetricLogger, "_engine", None)
+    metric_logger = MetricLogger(db_url=f"sqlite:///{tmp_path / 'agent_metrics.db'}", async_writer=False, rollups=True)
+    metric_logger.sample_rates = {}
+    metric_logger.default_sample_rate = 1.0
+    yield metric_logger
+    metric_logger.dispose()
+
+
+@pytest.mark.parametrize("value", [math.nan, math.inf, -math.inf, float("1e400"), "no es un número", None])
+def test_log_metric_rejects_non_finite_values(metric_logger, value):
+    assert metric_logger.log_metric(START, "qwen", "latency_ms", value) is False
+    assert metric_logger.log_metric(START, "qwen", "latency_ms", 12.5) is True
+    stats = metric_logger.stats()
+    assert (stats["invalid"], stats["written"], stats["failed"]) == (1, 1, 0)
+
+    result = metric_logger.query_percentiles("latency_ms", START, END, resolution="1m")
+    assert result["count"] == 1
+    assert result["p50"] == pytest.approx(12.5)
+
+
+def test_failed_batch_is_counted(metric_logger):
+    # Una fila no finita que no pasó por log_metric hace fallar el rollup: el lote entero cuenta como fallido
+    rows = [
+        {"timestamp": START, "llm": "qwen", "metric": "latency_ms", "value": value, "labels": "", "sample_rate": 1.0}
+        for value in (1.0, math.inf)
+    ]
+    metric_logger._ensure_schema()
+    assert metric_logger._insert_rows(rows) is False
+    assert metric_logger.stats()["failed"] == 2
+    assert metric_logger.stats()["written"] == 0
@@ -0,0 +1,70 @@
+"""
+Pruebas de regresión del RedisCheckpointer sobre fakeredis.
+
+Uso (desde la raíz del repositorio, con src/agents/requirements-dev.txt instalado):
+    python -m pytest src/agents/tests
+"""
+import fakeredis
+import pytest
+import redis
+from langchain_core.messages import AIMessage, HumanMessage
+from langgraph.graph import END, MessagesState, StateGraph
+
+from src.agents.modules.redis_checkpointer import RedisCheckpointer
+
+
+@pytest.fixture
+def fake_redis(monkeypatch):
+    server = fakeredis.FakeServer()
+
+    def connection_pool(**options):
+        return fakeredis.FakeRedis(server=server, decode_responses=options.get("decode_responses", False)).connection_pool
+
+    monkeypatch.setattr(redis, "ConnectionPool", connection_pool)
+    return server
+
+
+def build_graph(checkpointer):
+    graph = StateGraph(MessagesState)
+    graph.add_node("a", lambda state: {"messages": [AIMessage(content=f"a{len(state['messages'])}")]})
+    graph.set_entry_point("a")
+    graph.add_edge("a", END)
+    return graph.compile(checkpointer=checkpointer)
+
+
+def assert_latest(app, config, expected_messages, checkpoint_id, parent_checkpoint_id):
+    state = app.get_state(config)
+    assert [m.content for m in state.values["messages"]] == expected_messages
+    assert state.config["configurable"]["checkpoint_id"] == checkpoint_id
+    assert state.parent_config["configurable"]["checkpoint_id"] == parent_checkpoint_id
+
+
+@pytest.mark.parametrize("storage_mode", ["full", "delta"])
+@pytest.mark.parametrize(
+    "parent_message_count, expected",
+    [
+        (3, ["h0", "a1", "h1", "EDITED"]),  # el fork vuelve a tener tantos mensajes como la lista guardada
+        (1, ["h0", "EDITED"]),  # el fork tiene menos mensajes
+    ],
+)
+def test_fork_with_same_message_count_is_not_lost(fake_redis, storage_mode, parent_message_count, expected):
+    """update_state desde un checkpoint anterior: el head, la lista de mensajes y el padre son los del fork."""
+    checkpointer = RedisCheckpointer(storage_mode=storage_mode, hot_cache=False, archive_backend="none")
+    app = build_graph(checkpointer)
+    config = {"configurable": {"thread_id": f"fork-{storage_mode}-{parent_message_count}"}}
+    for turn in range(2):
+        app.invoke({"messages": [HumanMessage(content=f"h{turn}")]}, config)
+    assert [m.content for m in app.get_state(config).values["messages"]] == ["h0", "a1", "h1", "a3"]
+
+    parent = next(s for s in app.get_state_history(config) if len(s.values["messages"]) == parent_message_count)
+    fork_config = app.update_state(parent.config, {"messages": [AIMessage(content="EDITED")]}, as_node="a")
+    fork_id = fork_config["configurable"]["checkpoint_id"]
+    parent_id = parent.config["configurable"]["checkpoint_id"]
+
+    assert_latest(app, config, expected, fork_id, parent_id)
+    reader = build_graph(RedisCheckpointer(storage_mode=storage_mode, hot_cache=False, archive_backend="none"))
+    assert_latest(reader, config, expected, fork_id, parent_id)
+
+    # El siguiente turno continúa desde el fork
+    app.invoke({"messages": [HumanMessage(content="h2")]}, config)
+    assert [m.content for m in reader.get_state(config).values["messages"]] == expected + ["h2", f"a{len(expected) + 1}"]
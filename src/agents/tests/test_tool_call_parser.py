@@ -0,0 +1,101 @@
+"""
+Pruebas del extractor incremental de llamadas a herramientas (modules/tool_call_parser.py).
+
+Uso (desde la raíz del repositorio):
+    python -m pytest src/agents/tests
+"""
+import pytest
+
+from src.agents.modules.tool_call_parser import ToolCallStreamParser, extract_tool_calls
+
+TOOLS = {"check_gym_availability", "book_gym_slot", "external_rag_search_tool"}
+AVAILABILITY_CALL = '{"name": "check_gym_availability", "arguments": {"target_date": "2026-10-20T10:00:00"}}'
+
+
+def feed_chunks(chunks, known_tools=TOOLS):
+    parser = ToolCallStreamParser(known_tools)
+    found_per_chunk = [parser.feed(chunk) for chunk in chunks]
+    return parser, found_per_chunk
+
+
+def calls(tool_calls):
+    return [(call["name"], call["args"]) for call in tool_calls]
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 7, 1000])
+def test_object_split_across_chunks(chunk_size):
+    text = f"Voy a consultarlo. {AVAILABILITY_CALL} Un momento."
+    parser, found_per_chunk = feed_chunks([text[i:i + chunk_size] for i in range(0, len(text), chunk_size)])
+    assert calls(parser.tool_calls) == [("check_gym_availability", {"target_date": "2026-10-20T10:00:00"})]
+    # La llamada se emite en el fragmento que cierra el objeto, no al final del stream
+    closing_chunk = (text.index(AVAILABILITY_CALL) + len(AVAILABILITY_CALL) - 1) // chunk_size
+    assert [i for i, found in enumerate(found_per_chunk) if found] == [closing_chunk]
+    assert parser.tool_calls[0]["id"].startswith("llm_tc_")
+
+
+@pytest.mark.parametrize("chunk_size", [1, 4, 1000])
+def test_think_blocks_are_ignored(chunk_size):
+    text = (
+        '<think>Podría llamar a {"name": "book_gym_slot", "arguments": {"slot_id": 1}} pero antes '
+        "tengo que consultar la disponibilidad.</think>"
+        f"{AVAILABILITY_CALL}"
+    )
+    parser, _ = feed_chunks([text[i:i + chunk_size] for i in range(0, len(text), chunk_size)])
+    assert calls(parser.tool_calls) == [("check_gym_availability", {"target_date": "2026-10-20T10:00:00"})]
+
+
+def test_think_tag_split_between_chunks():
+    parser, _ = feed_chunks(["<thi", 'nk>{"name": "book_gym_slot", "arguments": {}}</th', "ink>", AVAILABILITY_CALL])
+    assert [name for name, _ in calls(parser.tool_calls)] == ["check_gym_availability"]
+
+
+def test_braces_and_escaped_quotes_inside_strings():
+    text = (
+        '{"name": "external_rag_search_tool", "arguments": '
+        '{"query": "¿la piscina {cubierta} abre a las \\"9}\\"?", "limit": 3}}'
+    )
+    for chunks in ([text], list(text)):
+        parser, _ = feed_chunks(chunks)
+        assert calls(parser.tool_calls) == [
+            ("external_rag_search_tool", {"query": '¿la piscina {cubierta} abre a las "9}"?', "limit": 3}),
+        ]
+
+
+def test_several_tool_calls_in_one_stream():
+    text = (
+        f"Primero consulto: {AVAILABILITY_CALL}\n"
+        '{"tool": "external_rag_search_tool", "tool_input": {"query": "horario gimnasio"}}\n'
+        '{"name": "book_gym_slot", "arguments": "{\\"slot_id\\": 7, \\"user_name\\": \\"Ana\\"}"}'
+    )
+    parser, found_per_chunk = feed_chunks(list(text))
+    assert calls(parser.tool_calls) == [
+        ("check_gym_availability", {"target_date": "2026-10-20T10:00:00"}),
+        ("external_rag_search_tool", {"query": "horario gimnasio"}),
+        ("book_gym_slot", {"slot_id": 7, "user_name": "Ana"}),
+    ]
+    assert sum(len(found) for found in found_per_chunk) == 3
+    assert len({call["id"] for call in parser.tool_calls}) == 3
+
+
+def test_non_tool_json_and_unknown_tools_are_skipped():
+    text = (
+        'Horario: {"lunes": {"apertura": "7:00"}} '
+        '{"name": "borrar_reservas", "arguments": {}} '
+        '{"respuesta": ' + AVAILABILITY_CALL + "}"
+    )
+    # El objeto exterior no es una llamada: se reanaliza desde su primera llave y se encuentra la interior
+    assert calls(extract_tool_calls(text, TOOLS)) == [("check_gym_availability", {"target_date": "2026-10-20T10:00:00"})]
+    assert [name for name, _ in calls(extract_tool_calls(text))] == ["borrar_reservas", "check_gym_availability"]
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "Sin llamadas a herramientas.",
+        '{"name": "check_gym_availability", "arguments": "no es json"}',
+        '{"name": "check_gym_availability", "arguments": {"target_date": "2026-10-20"',  # objeto sin cerrar
+        "{ esto no es json }",
+    ],
+)
+def test_text_without_valid_tool_calls(text):
+    assert extract_tool_calls(text, TOOLS) == []
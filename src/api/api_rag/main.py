@@ -1,9 +1,13 @@
-from flask import Flask, request, jsonify
+from contextlib import contextmanager
+from flask import Flask, Response, request, jsonify
 from qdrant_client import QdrantClient
+from prometheus_client import CollectorRegistry, GCCollector, Histogram, PlatformCollector, ProcessCollector, generate_latest, CONTENT_TYPE_LATEST
 import requests
 import logging
 import os
 
+from observability.flask_service import child_span, init_observability
+
 # Configurar logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -27,6 +31,28 @@ logger.info(f"🔗 Conectando a Ollama: {OLLAMA_HOST}:{OLLAMA_PORT}")
 logger.info(f"🧠 Modelo de embeddings: {EMBEDDING_MODEL}")
 logger.info(f"📦 Colección: {COLLECTION_NAME}")
 
+# Métricas de Prometheus (expuestas en /metrics). Registro propio en vez del global para
+# poder cargar este servicio en el mismo proceso que otros (p. ej. las pruebas de carga)
+METRICS_REGISTRY = CollectorRegistry()
+for collector in (ProcessCollector, PlatformCollector, GCCollector):
+    collector(registry=METRICS_REGISTRY)
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds", "Latencia de las peticiones HTTP", ["endpoint", "method", "status"],
+    registry=METRICS_REGISTRY,
+)
+SEARCH_STAGE_LATENCY = Histogram(
+    "rag_stage_seconds", "Latencia de cada etapa de /search", ["stage"], registry=METRICS_REGISTRY
+)
+
+# Trazas (TRACING_FILE) y perfilado (PROFILING_ENABLED, /debug/profile): ver src/observability
+init_observability(app, "api-rag", REQUEST_LATENCY)
+
+@contextmanager
+def stage_span(stage):
+    """Mide una etapa de /search en rag_stage_seconds y como span hijo de la petición"""
+    with SEARCH_STAGE_LATENCY.labels(stage).time(), child_span(f"rag.{stage}"):
+        yield
+
 def get_embedding(text: str):
     """Obtener embedding usando Ollama"""
     try:
@@ -96,25 +122,27 @@ def search():
         logger.info(f"🔍 Búsqueda: '{query}' (limit={limit}, threshold={score_threshold})")
         
         # Obtener embedding de la consulta
-        query_embedding = get_embedding(query)
+        with stage_span("embedding"):
+            query_embedding = get_embedding(query)
         
         # Buscar en Qdrant
-        search_results = qdrant_client.search(
-            collection_name=COLLECTION_NAME,
-            query_vector=query_embedding,
-            limit=limit,
-            score_threshold=score_threshold
-        )
-        
-        # Si no encuentra nada, buscar sin threshold
-        if not search_results:
-            logger.warning("⚠️ Sin resultados con threshold, buscando sin filtro...")
+        with stage_span("qdrant"):
             search_results = qdrant_client.search(
                 collection_name=COLLECTION_NAME,
                 query_vector=query_embedding,
                 limit=limit,
-                score_threshold=0.0
+                score_threshold=score_threshold
             )
+            
+            # Si no encuentra nada, buscar sin threshold
+            if not search_results:
+                logger.warning("⚠️ Sin resultados con threshold, buscando sin filtro...")
+                search_results = qdrant_client.search(
+                    collection_name=COLLECTION_NAME,
+                    query_vector=query_embedding,
+                    limit=limit,
+                    score_threshold=0.0
+                )
         
         # Procesar resultados
         documents = []
@@ -149,5 +177,10 @@ def search():
             "details": str(e)
         }), 500
 
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Métricas en formato de texto de Prometheus"""
+    return Response(generate_latest(METRICS_REGISTRY), content_type=CONTENT_TYPE_LATEST)
+
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=8080, debug=True)
\ No newline at end of file
@@ -1,12 +1,14 @@
 from datetime import date, datetime, time
 
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, Response, request, jsonify, send_from_directory
 from pydantic import BaseModel, ValidationError
 from sqlalchemy import func
 from flask_swagger_ui import get_swaggerui_blueprint
+from prometheus_client import CollectorRegistry, GCCollector, Histogram, PlatformCollector, ProcessCollector, generate_latest, CONTENT_TYPE_LATEST
 import os
 
 from generator.main import get_session, Service, Slot, Booking
+from observability.flask_service import init_observability
 
 
 app = Flask(__name__)
@@ -30,6 +32,27 @@ swaggerui_blueprint = get_swaggerui_blueprint(
 
 app.register_blueprint(swaggerui_blueprint, url_prefix=SWAGGER_URL)
 
+# 3) Métricas de Prometheus: latencia por endpoint, expuesta en /metrics. Registro propio
+# en vez del global para poder cargar la app junto a otros servicios en un mismo proceso
+METRICS_REGISTRY = CollectorRegistry()
+for collector in (ProcessCollector, PlatformCollector, GCCollector):
+    collector(registry=METRICS_REGISTRY)
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "Latencia de las peticiones HTTP",
+    ["endpoint", "method", "status"],
+    registry=METRICS_REGISTRY,
+)
+
+
+# 4) Trazas (TRACING_FILE) y perfilado (PROFILING_ENABLED, /debug/profile): ver src/observability
+init_observability(app, "api-services", REQUEST_LATENCY)
+
+
+@app.route("/metrics")
+def metrics():
+    return Response(generate_latest(METRICS_REGISTRY), content_type=CONTENT_TYPE_LATEST)
+
 
 class BookingCreate(BaseModel):
     slot_id: int
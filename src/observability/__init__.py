@@ -0,0 +1,6 @@
+"""
+Observabilidad compartida por el agente y los servicios Flask (api_rag y api_services):
+    tracing.py        cabecera W3C traceparent
+    profiling.py      muestreo de pilas y cProfile de peticiones lentas
+    flask_service.py  hooks de trazas/latencia y GET /debug/profile para los servicios Flask
+"""
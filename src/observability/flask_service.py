@@ -0,0 +1,150 @@
+"""
+Trazas y perfilado de los servicios Flask (api_rag, api_services) con el mismo formato que
+el agente: spans JSONL con el modelo de OpenTelemetry que continúan la traza de la cabecera
+W3C traceparent, y pilas colapsadas / ficheros .prof en PROFILING_DIR (ver profiling.py).
+
+    init_observability(app, "api-rag", REQUEST_LATENCY)
+"""
+import os
+import json
+import time
+import secrets
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional
+
+from flask import Flask, Response, current_app, g, jsonify, request
+
+from .profiling import SlowRequestProfiler, format_collapsed, sample_stacks, write_collapsed
+from .tracing import TRACEPARENT_HEADER, parse_traceparent
+
+import logging
+logger = logging.getLogger(__name__)
+
+# Vacío = no se exportan spans
+TRACING_FILE = os.getenv('TRACING_FILE', '')
+PROFILING_ENABLED = os.getenv('PROFILING_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+PROFILING_DIR = os.getenv('PROFILING_DIR', './data/profiles')
+PROFILING_SAMPLE_INTERVAL_MS = float(os.getenv('PROFILING_SAMPLE_INTERVAL_MS', '10'))
+PROFILING_MAX_SECONDS = int(os.getenv('PROFILING_MAX_SECONDS', '60'))
+PROFILING_SLOW_REQUEST_MS = float(os.getenv('PROFILING_SLOW_REQUEST_MS', '0'))  # 0 = sin cProfile por petición
+PROFILING_MAX_FILES = int(os.getenv('PROFILING_MAX_FILES', '50'))
+
+_trace_lock = threading.Lock()
+
+
+def export_span(
+    service: str,
+    name: str,
+    trace_id: str,
+    span_id: str,
+    parent_span_id: Optional[str],
+    start_ns: int,
+    attributes: Dict[str, Any],
+    status: str = "OK",
+) -> None:
+    """Escribe el span como una línea JSON en TRACING_FILE (si está configurado)."""
+    if not TRACING_FILE:
+        return
+    end_ns = time.time_ns()
+    line = json.dumps({
+        "trace_id": trace_id,
+        "span_id": span_id,
+        "parent_span_id": parent_span_id,
+        "name": name,
+        "service": service,
+        "start_time_unix_nano": start_ns,
+        "end_time_unix_nano": end_ns,
+        "duration_ms": round((end_ns - start_ns) / 1e6, 3),
+        "status": status,
+        "attributes": attributes,
+        "events": [],
+    }, ensure_ascii=False, default=str)
+    try:
+        with _trace_lock, open(TRACING_FILE, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+    except OSError as e:
+        logger.warning(f"⚠️ No se pudo exportar el span {name}: {e}")
+
+
+@contextmanager
+def child_span(name: str, **attributes: Any) -> Iterator[None]:
+    """Span hijo del de la petición en curso; se exporta también si el bloque lanza una excepción."""
+    start_ns = time.time_ns()
+    status = "OK"
+    try:
+        yield
+    except BaseException as e:
+        status = "ERROR"
+        attributes["exception.type"] = type(e).__name__
+        attributes["exception.message"] = str(e)[:500]
+        raise
+    finally:
+        export_span(current_app.extensions["observability"], name, g.trace_id, secrets.token_hex(8), g.span_id, start_ns, attributes, status)
+
+
+def init_observability(app: Flask, service: str, request_latency) -> None:
+    """
+    Registra en `app` los hooks que miden cada petición en `request_latency` (Histogram de
+    prometheus_client con labels endpoint, method, status), exportan su span como hijo del
+    traceparent recibido y, con PROFILING_SLOW_REQUEST_MS > 0, guardan el cProfile de las
+    peticiones lentas; y el endpoint GET /debug/profile?seconds=N[&idle=true].
+    """
+    app.extensions["observability"] = service
+    slow_request_profiler = (
+        SlowRequestProfiler(PROFILING_SLOW_REQUEST_MS, PROFILING_DIR, PROFILING_MAX_FILES)
+        if PROFILING_ENABLED and PROFILING_SLOW_REQUEST_MS > 0 else None
+    )
+
+    @app.before_request
+    def start_request_observation():
+        g.request_start = time.perf_counter()
+        g.request_start_ns = time.time_ns()
+        g.request_profile = None
+        if slow_request_profiler and not request.path.startswith("/debug/"):
+            g.request_profile = slow_request_profiler.start()
+        remote = parse_traceparent(request.headers.get(TRACEPARENT_HEADER))
+        g.trace_id, g.parent_span_id = remote or (secrets.token_hex(16), None)
+        g.span_id = secrets.token_hex(8)
+
+    @app.after_request
+    def finish_request_observation(response):
+        start = g.pop("request_start", None)
+        if start is None:
+            return response
+        endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+        duration = time.perf_counter() - start
+        request_latency.labels(endpoint, request.method, str(response.status_code)).observe(duration)
+        profile = g.pop("request_profile", None)
+        if profile is not None:
+            slow_request_profiler.finish(profile, duration * 1000, f"{request.method} {endpoint}")
+        export_span(
+            service, f"{request.method} {endpoint}", g.trace_id, g.span_id, g.parent_span_id, g.request_start_ns,
+            {"http.method": request.method, "http.route": endpoint, "http.status_code": response.status_code},
+            "ERROR" if response.status_code >= 500 else "OK",
+        )
+        response.headers[TRACEPARENT_HEADER] = f"00-{g.trace_id}-{g.span_id}-01"
+        return response
+
+    @app.route("/debug/profile", methods=["GET"])
+    def debug_profile():
+        """Perfil de muestreo de ?seconds=N (máx. PROFILING_MAX_SECONDS) en pilas colapsadas."""
+        if not PROFILING_ENABLED:
+            return jsonify({"error": "El perfilado está deshabilitado (PROFILING_ENABLED)."}), 404
+        try:
+            seconds = float(request.args.get("seconds", "10"))
+        except ValueError:
+            return jsonify({"error": "'seconds' debe ser un número."}), 400
+        if not 0 < seconds <= PROFILING_MAX_SECONDS:
+            return jsonify({"error": f"'seconds' debe estar entre 0 y {PROFILING_MAX_SECONDS}."}), 400
+
+        include_idle = request.args.get("idle", "false").lower() in ("1", "true", "yes")
+        try:
+            stacks = sample_stacks(seconds, PROFILING_SAMPLE_INTERVAL_MS, include_idle)
+        except RuntimeError as e:
+            return jsonify({"error": str(e)}), 409
+        try:
+            write_collapsed(stacks, PROFILING_DIR, PROFILING_MAX_FILES)
+        except OSError as e:
+            logger.warning(f"⚠️ No se pudo guardar el perfil: {e}")
+        return Response(format_collapsed(stacks), content_type="text/plain; charset=utf-8")
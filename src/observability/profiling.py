@@ -0,0 +1,136 @@
+import os
+import re
+import sys
+import time
+import cProfile
+import threading
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Optional
+
+import logging
+logger = logging.getLogger(__name__)
+
+# Hojas de pila de hilos bloqueados (Event/Condition.wait, select del servidor): se omiten
+# salvo con include_idle, para que el perfil muestre dónde se gasta CPU
+IDLE_LEAVES = {
+    ("threading.py", "wait"),
+    ("threading.py", "_wait_for_tstate_lock"),
+    ("selectors.py", "select"),
+    ("socketserver.py", "serve_forever"),
+}
+
+# Un solo muestreo a la vez: dos perfiles simultáneos se medirían el uno al otro
+_sampling_lock = threading.Lock()
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _is_idle(frame) -> bool:
+    return (os.path.basename(frame.f_code.co_filename), frame.f_code.co_name) in IDLE_LEAVES
+
+
+def sample_stacks(seconds: float, interval_ms: float = 10.0, include_idle: bool = False) -> Counter:
+    """
+    Perfilador de muestreo: cada `interval_ms` lee la pila de todos los hilos del proceso
+    (sys._current_frames, sin instrumentar el código) durante `seconds` y devuelve un
+    Counter de pilas colapsadas "hilo;func (fichero:línea);..." -> muestras, el formato de
+    flamegraph.pl / speedscope. Lanza RuntimeError si ya hay un muestreo en curso.
+    """
+    if not _sampling_lock.acquire(blocking=False):
+        raise RuntimeError("Ya hay un perfil en curso")
+    try:
+        own_thread = threading.get_ident()
+        interval = max(interval_ms, 1.0) / 1000
+        stacks: Counter = Counter()
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_thread or (not include_idle and _is_idle(frame)):
+                    continue
+                labels = []
+                while frame is not None:
+                    labels.append(_frame_label(frame))
+                    frame = frame.f_back
+                labels.append(thread_names.get(thread_id, f"thread-{thread_id}"))
+                stacks[";".join(reversed(labels))] += 1
+            time.sleep(interval)
+        return stacks
+    finally:
+        _sampling_lock.release()
+
+
+def format_collapsed(stacks: Counter) -> str:
+    """Una línea "pila muestras" por pila, de más a menos muestras."""
+    return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+
+def profile_path(name: str, extension: str, directory: str, max_files: int) -> str:
+    """
+    Ruta nueva en `directory` para un perfil (`name` se sanea). Borra antes los perfiles
+    más antiguos para no superar `max_files`.
+    """
+    os.makedirs(directory, exist_ok=True)
+    existing = sorted(
+        (entry for entry in os.scandir(directory) if entry.is_file()),
+        key=lambda entry: entry.stat().st_mtime,
+    )
+    for entry in existing[:max(0, len(existing) - max_files + 1)]:
+        try:
+            os.remove(entry.path)
+        except OSError:
+            pass
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%fZ")
+    safe_name = re.sub(r"[^A-Za-z0-9]+", "_", name).strip("_") or "profile"
+    return os.path.join(directory, f"{stamp}-{safe_name}.{extension}")
+
+
+def write_collapsed(stacks: Counter, directory: str, max_files: int, name: str = "sampling") -> str:
+    path = profile_path(name, "collapsed", directory, max_files)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(format_collapsed(stacks))
+    return path
+
+
+class SlowRequestProfiler:
+    """
+    cProfile de cada petición; el perfil solo se guarda (`.prof`, legible con pstats o
+    snakeviz) en `directory` si la petición tarda más de `threshold_ms`. cProfile perfila
+    el hilo que lo activa. Tiene un coste apreciable: activarlo solo para investigar.
+    """
+
+    def __init__(self, threshold_ms: float, directory: str, max_files: int):
+        self.threshold_ms = threshold_ms
+        self.directory = directory
+        self.max_files = max_files
+        self.captured = 0
+        self.skipped = 0
+
+    def start(self) -> Optional[cProfile.Profile]:
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Otro perfilador activo en este hilo/intérprete (Python >= 3.12 solo admite uno)
+            self.skipped += 1
+            return None
+        return profile
+
+    def finish(self, profile: cProfile.Profile, duration_ms: float, name: str) -> Optional[str]:
+        """Detiene el perfil y lo guarda si la petición fue lenta. Devuelve la ruta del fichero."""
+        profile.disable()
+        if duration_ms < self.threshold_ms:
+            return None
+        try:
+            path = profile_path(f"slow-{name}-{duration_ms:.0f}ms", "prof", self.directory, self.max_files)
+            profile.dump_stats(path)
+        except OSError as e:
+            logger.warning(f"⚠️ No se pudo guardar el perfil de la petición lenta {name}: {e}")
+            return None
+        self.captured += 1
+        logger.info(f"🐢 Petición lenta {name} ({duration_ms:.0f} ms), perfil guardado en {path}")
+        return path
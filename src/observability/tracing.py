@@ -0,0 +1,19 @@
+from typing import Optional
+
+TRACEPARENT_HEADER = "traceparent"
+
+
+def parse_traceparent(header: Optional[str]) -> Optional[tuple]:
+    """Devuelve (trace_id, parent_span_id) de una cabecera traceparent válida, o None."""
+    if not header:
+        return None
+    parts = header.strip().split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    try:
+        int(parts[1], 16), int(parts[2], 16)
+    except ValueError:
+        return None
+    if parts[1] == "0" * 32 or parts[2] == "0" * 16:
+        return None
+    return parts[1], parts[2]